@@ -5,8 +5,11 @@ Standalone GUI application to convert images from sRGB to ACEScg using OpenColor
 Author: PostBox Visual
 """
 
+import multiprocessing
 import os
+import queue
 import sys
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
 from datetime import datetime
 from pathlib import Path
 
@@ -27,12 +30,21 @@ try:
 except ImportError:
     OCIO_AVAILABLE = False
 
+try:
+    import OpenImageIO as oiio
+    OIIO_AVAILABLE = True
+except ImportError:
+    OIIO_AVAILABLE = False
+
 
 # --- Constants ---
 SUPPORTED_EXTENSIONS = ['.jpg', '.jpeg', '.png', '.tif', '.tiff', '.exr', '.bmp']
 APP_NAME = "PBV ACES Converter"
 APP_VERSION = "1.0.0"
 
+# Working memory per conversion worker for pixel strips; peak memory no longer grows with image size.
+STRIP_MEMORY_BUDGET = 64 * 1024 * 1024
+
 # Texture type keywords (from PBV_vray_material_from_folder.py)
 TEXTURE_KEYWORDS = {
     'texturesColor': ['diffuse', 'diff', 'albedo', 'alb', 'base', 'col', 'color', 'basecolor'],
@@ -62,13 +74,153 @@ def is_color_texture(filename):
     return False
 
 
+# --- Conversion (runs in the worker processes) ---
+# Each worker process builds its OCIO processor once, in _init_worker, and
+# reuses it for every file it is handed.
+_worker_cpu = None
+_worker_messages = None
+_worker_cancel = None
+
+
+class ConversionCancelled(Exception):
+    """Raised inside a worker when the user cancelled the conversion."""
+
+
+def _init_worker(ocio_config_path, input_cs, output_cs, messages, cancel_event):
+    global _worker_cpu, _worker_messages, _worker_cancel
+    config = OCIO.Config.CreateFromFile(ocio_config_path)
+    _worker_cpu = config.getProcessor(input_cs, output_cs).getDefaultCPUProcessor()
+    _worker_messages = messages
+    _worker_cancel = cancel_event
+
+
+def _emit(message, level="info"):
+    """Send a log line to the Qt thread."""
+    _worker_messages.put((message, level))
+
+
+def _check_cancelled():
+    if _worker_cancel.is_set():
+        raise ConversionCancelled()
+
+
+def _rows_per_strip(width, tile_height=0):
+    """Scanlines per strip so one float32 RGB strip (plus a working copy) fits the memory budget."""
+    rows = max(1, STRIP_MEMORY_BUDGET // (width * 3 * 4 * 2))
+    if tile_height:
+        # Whole rows of tiles, so no tile is decoded twice.
+        rows = max(tile_height, rows // tile_height * tile_height)
+    return rows
+
+
+def convert_file(file_path, output_format, output_folder):
+    """Convert one image with this worker's OCIO processor; returns the output path."""
+    _check_cancelled()
+    name = os.path.basename(file_path)
+    _emit(f"Converting: {name}...")
+
+    base_name = Path(file_path).stem
+    output_ext = output_format.lower()
+    output_path = os.path.join(output_folder, f"{base_name}_ACEScg.{output_ext}")
+    try:
+        if OIIO_AVAILABLE:
+            return _convert_streaming(file_path, output_path, output_ext == 'exr')
+        return _convert_in_memory(file_path, output_path, output_ext)
+    except ConversionCancelled:
+        # Never leave a half-written output behind.
+        if os.path.exists(output_path):
+            os.remove(output_path)
+        raise
+
+
+def _convert_streaming(file_path, output_path, hdr):
+    """Read, transform and write in scanline strips; peak memory is one strip, whatever the image size."""
+    inp = oiio.ImageInput.open(file_path)
+    if inp is None:
+        raise IOError(oiio.geterror())
+    try:
+        spec = inp.spec()
+        width, height = spec.width, spec.height
+        # RGB as is; grey (and grey + alpha) is expanded like PIL's convert('RGB'); alpha is dropped.
+        channels = 3 if spec.nchannels >= 3 else 1
+        rows = _rows_per_strip(width, spec.tile_height)
+        _emit(f"  {os.path.basename(file_path)}: {width}x{height}, {rows} rows per strip")
+
+        out = oiio.ImageOutput.create(output_path)
+        if out is None:
+            raise IOError(oiio.geterror())
+        out_spec = oiio.ImageSpec(width, height, 3, oiio.FLOAT if hdr else oiio.UINT8)
+        if not out.open(output_path, out_spec):
+            raise IOError(out.geterror())
+        try:
+            for y in range(spec.y, spec.y + height, rows):
+                _check_cancelled()
+                y_end = min(y + rows, spec.y + height)
+                # Read as float: 8/16-bit data is normalised to 0-1, float data passes through.
+                strip = inp.read_scanlines(0, 0, y, y_end, spec.z, 0, channels, oiio.FLOAT)
+                if strip is None:
+                    raise IOError(inp.geterror())
+                if channels == 1:
+                    strip = np.repeat(strip.reshape(y_end - y, width, 1), 3, axis=2)
+                strip = np.ascontiguousarray(strip, dtype=np.float32)
+                _worker_cpu.applyRGB(strip)
+                # OIIO clamps and quantises to the 8-bit output itself.
+                if not out.write_scanlines(y - spec.y, y_end - spec.y, 0, strip):
+                    raise IOError(out.geterror())
+        finally:
+            out.close()
+    finally:
+        inp.close()
+    return output_path
+
+
+def _convert_in_memory(file_path, output_path, output_ext):
+    """Fallback without OpenImageIO: transform the decoded 8-bit image in place, strip by strip.
+    
+    PIL cannot decode partial images, so the 8-bit pixels are held whole, but
+    only one float32 strip exists at a time.
+    """
+    img = Image.open(file_path).convert('RGB')
+    pixels = np.array(img)
+    del img
+    height, width = pixels.shape[:2]
+    rows = _rows_per_strip(width)
+    _emit(f"  {os.path.basename(file_path)}: {width}x{height}, {rows} rows per strip "
+          f"(install OpenImageIO to stream from disk)")
+
+    buffer = np.empty((rows, width, 3), dtype=np.float32)
+    for y in range(0, height, rows):
+        _check_cancelled()
+        strip = buffer[:min(rows, height - y)]
+        np.multiply(pixels[y:y + rows], 1.0 / 255.0, out=strip)
+        _worker_cpu.applyRGB(strip)
+        np.multiply(strip, 255, out=strip)
+        np.clip(strip, 0, 255, out=strip)
+        pixels[y:y + rows] = strip
+
+    if output_ext == 'exr':
+        # Without OpenImageIO there is no EXR writer; save as 8-bit TIFF (loses HDR data but works)
+        output_path = output_path.replace('.exr', '.tiff')
+        Image.fromarray(pixels, mode='RGB').save(output_path, format='TIFF')
+        _emit("  (Saved as 8-bit TIFF - install OpenImageIO for EXR/HDR support)", "warning")
+    else:
+        Image.fromarray(pixels, mode='RGB').save(output_path)
+    return output_path
+
+
+def default_worker_count():
+    """One worker per core, leaving one for the UI."""
+    return max(1, (os.cpu_count() or 2) - 1)
+
+
 class ConversionWorker(QThread):
-    """Background worker for image conversion."""
+    """Background thread driving a pool of conversion processes."""
     progress = Signal(int, str)  # progress percentage, message
     log = Signal(str, str)  # message, level (info/success/error/warning)
     finished = Signal(int, int)  # success count, error count
     
-    def __init__(self, files, ocio_config_path, input_cs, output_cs, output_format, output_folder):
+    def __init__(self, files, ocio_config_path, input_cs, output_cs, output_format, output_folder,
+                 max_workers=None):
         super().__init__()
         self.files = files
         self.ocio_config_path = ocio_config_path
@@ -76,6 +228,7 @@ class ConversionWorker(QThread):
         self.output_cs = output_cs
         self.output_format = output_format
         self.output_folder = output_folder
+        self.max_workers = max_workers or default_worker_count()
         self._cancelled = False
     
     def cancel(self):
@@ -87,10 +240,10 @@ class ConversionWorker(QThread):
             self.finished.emit(0, len(self.files))
             return
         
+        # Validate the config here, so a bad config is reported once instead of by every worker.
         try:
             config = OCIO.Config.CreateFromFile(self.ocio_config_path)
-            processor = config.getProcessor(self.input_cs, self.output_cs)
-            cpu = processor.getDefaultCPUProcessor()
+            config.getProcessor(self.input_cs, self.output_cs).getDefaultCPUProcessor()
         except Exception as e:
             self.log.emit(f"ERROR: Failed to create OCIO processor: {e}", "error")
             self.finished.emit(0, len(self.files))
@@ -99,85 +252,67 @@ class ConversionWorker(QThread):
         success_count = 0
         error_count = 0
         total = len(self.files)
-        
-        for i, file_path in enumerate(self.files):
-            if self._cancelled:
-                self.log.emit("Conversion cancelled by user.", "warning")
-                break
-            
-            try:
-                self.log.emit(f"Converting: {os.path.basename(file_path)}...", "info")
-                
-                # Step 1: Load image
-                self.log.emit("  Step 1: Loading image...", "info")
-                img = Image.open(file_path).convert('RGB')
-                self.log.emit(f"  Image size: {img.size}", "info")
-                
-                # Step 2: Convert to numpy array
-                self.log.emit("  Step 2: Converting to numpy array...", "info")
-                pixels = np.array(img, dtype=np.float32) / 255.0
-                self.log.emit(f"  Array shape: {pixels.shape}, dtype: {pixels.dtype}", "info")
-                
-                # Step 3: Ensure C-contiguous
-                self.log.emit("  Step 3: Making array contiguous...", "info")
-                pixels = np.ascontiguousarray(pixels)
-                self.log.emit(f"  Contiguous: {pixels.flags['C_CONTIGUOUS']}", "info")
-                
-                # Step 4: Apply OCIO transform
-                self.log.emit("  Step 4: Applying OCIO transform...", "info")
-                cpu.applyRGB(pixels)
-                self.log.emit("  OCIO transform complete", "info")
-                
-                # Prepare output path
-                base_name = Path(file_path).stem
-                output_ext = self.output_format.lower()
-                output_path = os.path.join(self.output_folder, f"{base_name}_ACEScg.{output_ext}")
-                
-                # Step 5: Save based on format
-                self.log.emit(f"  Step 5: Saving as {output_ext}...", "info")
-                if output_ext == 'exr':
-                    self._save_exr(pixels, output_path)
-                else:
-                    # Clip values for non-HDR formats
-                    pixels_clipped = np.clip(pixels * 255, 0, 255).astype(np.uint8)
-                    self.log.emit(f"  Clipped array shape: {pixels_clipped.shape}", "info")
-                    out_img = Image.fromarray(pixels_clipped, mode='RGB')
-                    out_img.save(output_path)
+        workers = min(self.max_workers, total)
+        self.log.emit(f"Using {workers} worker process(es).", "info")
+        
+        # "spawn" everywhere: forking a process that runs Qt is not safe.
+        context = multiprocessing.get_context("spawn")
+        messages = context.Queue()
+        cancel_event = context.Event()
+        
+        with ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=context,
+            initializer=_init_worker,
+            initargs=(self.ocio_config_path, self.input_cs, self.output_cs, messages, cancel_event),
+        ) as pool:
+            futures = {
+                pool.submit(convert_file, file_path, self.output_format, self.output_folder): file_path
+                for file_path in self.files
+            }
+            pending = set(futures)
+            done_count = 0
+            while pending:
+                done, pending = wait(pending, timeout=0.1, return_when=FIRST_COMPLETED)
+                self._drain(messages)
                 
-                self.log.emit(f"✓ {os.path.basename(file_path)} → {os.path.basename(output_path)}", "success")
-                success_count += 1
+                if self._cancelled and not cancel_event.is_set():
+                    self.log.emit("Cancelling conversion...", "warning")
+                    cancel_event.set()
+                    for future in pending:
+                        future.cancel()
                 
-            except Exception as e:
-                import traceback
-                self.log.emit(f"✗ {os.path.basename(file_path)}: {str(e)}", "error")
-                self.log.emit(f"  Traceback: {traceback.format_exc()}", "error")
-                error_count += 1
-            
-            progress = int((i + 1) / total * 100)
-            self.progress.emit(progress, f"Processing {i + 1}/{total}...")
-        
+                for future in done:
+                    name = os.path.basename(futures[future])
+                    done_count += 1
+                    if future.cancelled():
+                        continue
+                    try:
+                        output_path = future.result()
+                        self.log.emit(f"✓ {name} → {os.path.basename(output_path)}", "success")
+                        success_count += 1
+                    except ConversionCancelled:
+                        self.log.emit(f"  {name}: cancelled", "warning")
+                    except Exception as e:
+                        self.log.emit(f"✗ {name}: {str(e)}", "error")
+                        error_count += 1
+                    
+                    progress = int(done_count / total * 100)
+                    self.progress.emit(progress, f"Processing {done_count}/{total}...")
+        
+        self._drain(messages)
+        if self._cancelled:
+            self.log.emit("Conversion cancelled by user.", "warning")
         self.finished.emit(success_count, error_count)
     
-    def _save_exr(self, pixels, output_path):
-        """Save as EXR using OpenImageIO if available, otherwise fallback to TIFF."""
-        try:
-            import OpenImageIO as oiio
-            height, width, channels = pixels.shape
-            spec = oiio.ImageSpec(width, height, channels, oiio.FLOAT)
-            out = oiio.ImageOutput.create(output_path)
-            out.open(output_path, spec)
-            out.write_image(pixels)
-            out.close()
-        except ImportError:
-            # Fallback: save as 32-bit TIFF (PIL can handle this with 'F' mode per channel)
-            # Or save as 8-bit TIFF when OpenImageIO is not available
-            alt_path = output_path.replace('.exr', '.tiff')
-            
-            # Convert to 8-bit for PIL compatibility (loses HDR data but works)
-            pixels_8bit = np.clip(pixels * 255, 0, 255).astype(np.uint8)
-            img = Image.fromarray(pixels_8bit, mode='RGB')
-            img.save(alt_path, format='TIFF')
-            self.log.emit(f"  (Saved as 8-bit TIFF - install OpenImageIO for EXR/HDR support)", "warning")
+    def _drain(self, messages):
+        """Forward the log lines the workers sent so far."""
+        while True:
+            try:
+                message, level = messages.get_nowait()
+            except queue.Empty:
+                return
+            self.log.emit(message, level)
 
 
 class ACESConverterWindow(QMainWindow):
@@ -357,6 +492,12 @@ class ACESConverterWindow(QMainWindow):
         self.convert_btn.clicked.connect(self.start_conversion)
         btn_layout.addWidget(self.convert_btn)
         
+        self.cancel_btn = QPushButton("Cancel")
+        self.cancel_btn.setMinimumWidth(80)
+        self.cancel_btn.setEnabled(False)
+        self.cancel_btn.clicked.connect(self.cancel_conversion)
+        btn_layout.addWidget(self.cancel_btn)
+        
         self.close_btn = QPushButton("Close")
         self.close_btn.setMinimumWidth(80)
         self.close_btn.clicked.connect(self.close)
@@ -572,6 +713,7 @@ class ACESConverterWindow(QMainWindow):
         
         # Disable UI during conversion
         self.convert_btn.setEnabled(False)
+        self.cancel_btn.setEnabled(True)
         self.progress_bar.setValue(0)
         
         # Start worker thread
@@ -590,6 +732,13 @@ class ACESConverterWindow(QMainWindow):
         
         self.log_message("Starting conversion...", "info")
     
+    def cancel_conversion(self):
+        """Stop queued files and interrupt the ones being converted."""
+        if self.worker is not None and self.worker.isRunning():
+            self.worker.cancel()
+            self.cancel_btn.setEnabled(False)
+            self.progress_label.setText("Cancelling...")
+    
     def on_progress(self, percent, message):
         """Update progress bar."""
         self.progress_bar.setValue(percent)
@@ -598,6 +747,7 @@ class ACESConverterWindow(QMainWindow):
     def on_finished(self, success, errors):
         """Handle conversion completion."""
         self.convert_btn.setEnabled(True)
+        self.cancel_btn.setEnabled(False)
         self.progress_label.setText("Done")
         
         if errors == 0:
@@ -617,4 +767,6 @@ def main():
 
 
 if __name__ == "__main__":
+    # Worker processes are spawned; needed when the app is frozen into an executable.
+    multiprocessing.freeze_support()
     main()
@@ -5,122 +5,245 @@ from dotenv import load_dotenv
 import functools # Required to pass the session correctly
 import time 
 
+from core.dispatch import ANY_ACTION, DispatchTable, update_subscription
+from core.event_batcher import EventBatcher
+from core.event_journal import EventJournal
+from core.gap_recovery import GapRecovery
+
 # --- Configuration ---
 # Loads credentials from your .env file
 load_dotenv()
 
 # --- Setup Logging ---
-logging.basicConfig(level=logging.INFO)
+# Configured by the entry point (core.logging_setup).
 logger = logging.getLogger(__name__)
 
-def create_tasks_for_new_shot(session, event):
+# --- Define your task template here ---
+TASK_NAMES = ['Animation', 'Lighting', 'Compositing']
+
+# Entity types whose changes invalidate the cached task types/status/priority.
+SCHEMA_ENTITY_TYPES = {'Type', 'Status', 'Priority', 'ProjectSchema', 'TaskTypeSchema'}
+
+# The only ftrack.update entities this action cares about; everything else
+# is dropped before it is journaled or batched.
+SHOT_DISPATCH = DispatchTable(
+    {('Shot', 'add'): 'shot', **{(entity_type, ANY_ACTION): 'schema' for entity_type in SCHEMA_ENTITY_TYPES}},
+    name='shot_creation'
+)
+
+# Changed-since query used to catch shots created while the listener was down.
+RECOVERY_QUERIES = {'Shot': 'select id from Shot where created_at > "{since}"'}
+
+# Max ids per "id in (...)" query, to keep query strings reasonably short.
+QUERY_CHUNK_SIZE = 100
+
+# Retry schedule for shots that are not yet visible through the API.
+FETCH_ATTEMPTS = 5
+FETCH_BASE_DELAY = 0.25
+
+
+def _chunks(items, size=QUERY_CHUNK_SIZE):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def _id_list(ids):
+    return ', '.join(f'"{i}"' for i in ids)
+
+
+class TaskTemplate:
+    """
+    Task types, status and priority used for new shot tasks.
+    Resolved once at register time and refreshed when the schema changes,
+    instead of being re-queried for every shot and every task.
+    """
+
+    def __init__(self, session, task_names=TASK_NAMES):
+        self.session = session
+        self.task_names = list(task_names)
+        self.task_types = {}
+        self.status = None
+        self.priority = None
+        self.refresh()
+
+    def refresh(self):
+        """Resolve task types, status and priority with one query each."""
+        session = self.session
+        names = _id_list(self.task_names)
+        self.task_types = {
+            t['name']: t for t in session.query(f'select id, name from Type where name in ({names})')
+        }
+        for task_name in self.task_names:
+            if task_name not in self.task_types:
+                logger.warning(f"Could not find a Task Type named '{task_name}'. This task will not be created.")
+
+        status = session.query('Status where name is "Not Started"').first()
+        priority = session.query('Priority where name is "None"').first()
+
+        if not status or status.get('entity_type') != 'Task':
+            logger.warning("Could not find a valid Task Status 'Not Started'. Tasks will be created with the default status.")
+            status = None
+        if not priority:
+            logger.warning("Could not find Priority 'None'. Tasks will be created with the default priority.")
+
+        self.status = status
+        self.priority = priority
+        logger.info(f"Task template resolved: {sorted(self.task_types)}")
+
+    def task_data(self, task_name, shot):
+        """Build the create() payload for one template task under shot."""
+        task_data = {
+            'name': task_name,
+            'parent': shot,
+            'type': self.task_types[task_name]
+        }
+        if self.priority:
+            task_data['priority'] = self.priority
+        if self.status:
+            task_data['status'] = self.status
+        return task_data
+
+
+def _fetch_shots(session, shot_ids):
+    """
+    Fetch shots by id with a few batched queries. Shots that are not visible
+    yet (database commit delays) are retried with exponential backoff.
+    """
+    shots = {}
+    missing = list(shot_ids)
+    for attempt in range(FETCH_ATTEMPTS):
+        for chunk in _chunks(missing):
+            for shot in session.query(
+                f'select id, name, project.full_name from Shot where id in ({_id_list(chunk)})'
+            ):
+                shots[shot['id']] = shot
+        missing = [shot_id for shot_id in missing if shot_id not in shots]
+        if not missing:
+            break
+        if attempt < FETCH_ATTEMPTS - 1:
+            delay = FETCH_BASE_DELAY * (2 ** attempt)
+            logger.warning(f"Attempt {attempt + 1}: {len(missing)} shot(s) not found yet. Retrying in {delay:.2f} seconds...")
+            time.sleep(delay)
+
+    for shot_id in missing:
+        logger.error(f"Failed to fetch details for shot {shot_id} after multiple attempts. Aborting for this entity.")
+    return shots
+
+
+def _existing_task_names(session, shot_ids):
+    """Return {shot_id: set(task names)} for all shots in one query per chunk."""
+    existing = {shot_id: set() for shot_id in shot_ids}
+    for chunk in _chunks(list(shot_ids)):
+        for task in session.query(
+            f'select name, parent_id from Task where parent.id in ({_id_list(chunk)})'
+        ):
+            existing.setdefault(task['parent_id'], set()).add(task['name'])
+    return existing
+
+
+def create_tasks_for_new_shot(session, event, template=None):
     """
     Listens for ftrack.update events and creates default tasks
     when a new 'Shot' type is created.
     This version is idempotent and uses batch commits.
     """
-    logger.info("--- Event received, processing entities... ---")
-    
-    for entity in event['data'].get('entities', []):
-        logger.info(f"Inspecting entity: {entity.get('entity_type')} with action: {entity.get('action')}")
+    return create_tasks_for_new_shots(session, event['data'].get('entities', []), template=template)
+
 
-        if (entity.get('action') == 'add' and 
-            entity.get('entity_type') == 'Shot'):
+def create_tasks_for_new_shots(session, entities, template=None):
+    """
+    Creates default tasks for every new 'Shot' in a batch of ftrack.update
+    entities (as collected by the EventBatcher). The whole batch is resolved
+    with a handful of queries and committed in a single transaction; if that
+    commit fails, the shots are committed one by one so a single bad shot
+    does not hold up the others.
+
+    Returns the entities of the shots whose tasks could not be created, for
+    the batcher to keep unacknowledged.
+    """
+    logger.info(f"--- Batch received, processing {len(entities)} entities... ---")
 
+    shot_entities = {}
+    schema_changed = False
+    for entity in entities:
+        route = SHOT_DISPATCH.route(entity)
+        if route == 'schema':
+            schema_changed = True
+        elif route == 'shot':
             shot_id = entity.get('entityId')
             if not shot_id:
                 logger.warning("Found a new Shot entity but it had no ID. Skipping.")
                 continue
+            shot_entities.setdefault(shot_id, entity)
 
-            logger.info(f"MATCH! New Shot detected with ID: {shot_id}. Fetching details...")
-            
-            shot_object = None
-            # Retry logic to handle potential database commit delays
-            for i in range(5):
-                shot_object = session.get('Shot', shot_id)
-                if shot_object:
-                    logger.info(f"Successfully fetched ftrack object on attempt {i+1}. Object Name: '{shot_object['name']}'")
-                    break
-                logger.warning(f"Attempt {i+1}: Shot object not found yet. Retrying in 1 second...")
-                time.sleep(1)
-
-            if not shot_object:
-                logger.error(f"Failed to fetch details for shot {shot_id} after multiple attempts. Aborting for this entity.")
+    if template is None:
+        template = TaskTemplate(session)
+    elif schema_changed:
+        logger.info("Schema change detected. Refreshing task template...")
+        template.refresh()
+
+    if not shot_entities:
+        return []
+
+    logger.info(f"MATCH! {len(shot_entities)} new Shot(s) detected. Fetching details...")
+
+    shots = _fetch_shots(session, list(shot_entities))
+    if not shots:
+        return []
+    existing = _existing_task_names(session, list(shots))
+
+    planned = {}
+    for shot_id, shot_object in shots.items():
+        logger.info(f"--- Starting Task Creation for Shot: '{shot_object['name']}' (ID: {shot_id}) in '{shot_object['project']['full_name']}' ---")
+        planned[shot_id] = []
+        for task_name in template.task_names:
+            # Idempotency check
+            if task_name in existing.get(shot_id, ()):
+                logger.info(f"Task '{task_name}' already exists on '{shot_object['name']}'. Skipping.")
+                continue
+            if task_name not in template.task_types:
                 continue
+            planned[shot_id].append(template.task_data(task_name, shot_object))
+
+    tasks_created_count = sum(len(tasks) for tasks in planned.values())
+    if not tasks_created_count:
+        logger.info("No new tasks were created (they may have all existed already).")
+        return []
 
-            try:
-                project = shot_object['project']
-                logger.info(f"Found parent project: '{project['full_name']}'")
-                
-                # --- Define your task template here ---
-                task_names = ['Animation', 'Lighting', 'Compositing']
-                
-
-                status = session.query('Status where name is "Not Started"').first()
-                priority = session.query('Priority where name is "None"').first()
-
-                if not status or status.get('entity_type') != 'Task':
-                    logger.warning("Could not find a valid Task Status 'Not Started'. Tasks will be created with the default status.")
-                    status = None
-                if not priority:
-                    logger.warning("Could not find Priority 'None'. Tasks will be created with the default priority.")
-
-                logger.info(f"--- Starting Task Creation for Shot: '{shot_object['name']}' (ID: {shot_id}) ---")
-
-                tasks_created_count = 0
-                for task_name in task_names:
-                    # Idempotency check
-                    existing_task = session.query(
-                        f'Task where name is "{task_name}" and parent.id is "{shot_id}"'
-                    ).first()
-                    if existing_task:
-                        logger.info(f"Task '{task_name}' already exists. Skipping.")
-                        continue
-
-                    task_type = session.query(f'Type where name is "{task_name}"').first()
-                    if not task_type:
-                        logger.warning(f"Could not find a Task Type named '{task_name}'. Skipping creation of this task.")
-                        continue
-
-                    logger.info(f"Preparing to create Task '{task_name}' with Type '{task_type['name']}'...")
-                    task_data = {
-                        'name': task_name,
-                        'parent': shot_object,
-                        'type': task_type
-                    }
-                    if priority:
-                        task_data['priority'] = priority
-                    if status:
-                        task_data['status'] = status
-                    session.create('Task', task_data)
-                    tasks_created_count += 1
-
-                # Commit all prepared tasks in a single transaction outside the loop.
-                if tasks_created_count > 0:
-                    session.commit()
-                    logger.info(f"SUCCESS! Committed {tasks_created_count} new tasks for shot '{shot_object['name']}'.")
-                else:
-                    logger.info("No new tasks were created (they may have all existed already).")
-
-                logger.info("--- Finished Task Creation ---")
-
-            except Exception as e:
-                # Rollback any changes in the batch if an error occurs
-                session.rollback()
-                logger.exception(f"CRITICAL: An error occurred while processing shot ID {shot_id}. Transaction rolled back. Error: {e}")
+    # Commit all prepared tasks for the whole batch in a single transaction.
+    try:
+        for tasks in planned.values():
+            for task_data in tasks:
+                session.create('Task', task_data)
+        session.commit()
+        logger.info(f"SUCCESS! Committed {tasks_created_count} new tasks for {len(shots)} shot(s).")
+        logger.info("--- Finished Task Creation ---")
+        return []
+    except Exception as e:
+        session.rollback()
+        logger.warning(f"Batch commit for {len(shots)} shot(s) failed, retrying shot by shot. Error: {e}")
+
+    failed = []
+    for shot_id, tasks in planned.items():
+        if not tasks:
+            continue
+        try:
+            for task_data in tasks:
+                session.create('Task', task_data)
+            session.commit()
+        except Exception as e:
+            # Rollback this shot's tasks only; the others are already committed.
+            session.rollback()
+            logger.exception(f"CRITICAL: Could not create tasks for shot {shot_id}. Transaction rolled back. Error: {e}")
+            failed.append(shot_entities[shot_id])
+    logger.info(f"--- Finished Task Creation: {len(failed)} of {len(shots)} shot(s) failed ---")
+    return failed
 
 
 
 def register_event_listener(session):
-    """Registers the event listener with the ftrack session."""
-    
-    callback_with_session = functools.partial(create_tasks_for_new_shot, session)
-    
-    session.event_hub.subscribe(
-        'topic=ftrack.update', 
-        callback_with_session
-    )
-    
+    """Registers the event listener with the ftrack session and blocks on its event hub."""
+    register(session)
     logger.info("Event listener registered. Waiting for new Shots via ftrack.update...")
     session.event_hub.wait()
 
@@ -129,9 +252,17 @@ def register_event_listener(session):
 def register(session):
     """Register the shot creation automation."""
     logger.info("Registering Shot Creation Automation...")
-    callback_with_session = functools.partial(create_tasks_for_new_shot, session)
+    # Task types, status and priority are resolved once here, not per shot.
+    template = TaskTemplate(session)
+    # Bursts of new shots are coalesced and handed over as one batch; events are
+    # journaled first so nothing is lost if the listener goes down mid-burst.
+    callback_with_session = EventBatcher(
+        functools.partial(create_tasks_for_new_shots, session, template=template), name='shot_creation',
+        journal=EventJournal('shot_creation'), dispatch=SHOT_DISPATCH
+    )
     session.event_hub.subscribe(
-        'topic=ftrack.update',
+        update_subscription(),
         callback_with_session
     )
-    logger.info("Shot Creation Automation registered.")
\ No newline at end of file
+    GapRecovery(session, callback_with_session, RECOVERY_QUERIES).register()
+    logger.info("Shot Creation Automation registered.")
@@ -1,14 +1,32 @@
-import ftrack_api
 import logging
 import sys
 import json
 import datetime
 import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
 
+from core.instrumentation import instrument_session, track
+from core.project_catalog import ProjectCatalog
+from core.rate_limiter import INTERACTIVE, install_rate_limiter, priority_lane
+from core.schema_cache import create_session
+from core.template_snapshots import LEAF_ENTITY_TYPES, TemplateSnapshotCache, children_by_parent
+
 import logging
 logger = logging.getLogger(__name__)
 
+# Number of created entities sent to the server per commit when cloning.
+COMMIT_CHUNK_SIZE = 250
+
+# Number of clone jobs allowed to run at the same time.
+MAX_CLONE_JOBS = int(os.getenv('FTRACK_MAX_CLONE_JOBS', 2))
+
+
+def _default_session_factory():
+    """Create a worker session from the same environment as the listener session."""
+    return install_rate_limiter(instrument_session(create_session(auto_connect_event_hub=False)))
+
 class CreateProjectFromCopyAction:
     """Action to create a new project by copying an existing one."""
 
@@ -16,12 +34,25 @@ class CreateProjectFromCopyAction:
     identifier = 'com.ftrack.create-from-copy.action'
     description = 'Creates a new project by copying an existing project structure.'
 
-    def __init__(self, session):
-        """Initialise action with ftrack session."""
+    def __init__(self, session, session_factory=_default_session_factory, snapshots=None):
+        """Initialise action with ftrack session.
+
+        Clones run on a background executor; each worker thread lazily opens
+        its own session through session_factory, since ftrack sessions are
+        not thread safe. Source hierarchies are read from a snapshot cache so
+        repeat clones of the same template do not walk the source again.
+        """
         self.session = session
+        self.session_factory = session_factory
         self.logger = logging.getLogger(
             __name__ + '.' + self.__class__.__name__
         )
+        self._executor = ThreadPoolExecutor(
+            max_workers=MAX_CLONE_JOBS, thread_name_prefix='clone-job'
+        )
+        self._worker_state = threading.local()
+        self.snapshots = snapshots or TemplateSnapshotCache()
+        self.projects = ProjectCatalog(session)
 
     def register(self):
         """Register the action with the ftrack event hub."""
@@ -33,8 +64,20 @@ class CreateProjectFromCopyAction:
             f'topic=ftrack.action.launch and data.actionIdentifier={self.identifier}',
             self._launch
         )
+        # Project list for the form is loaded once and then kept current from events.
+        self.projects.refresh()
+        self.session.event_hub.subscribe(
+            'topic=ftrack.update',
+            self._on_update
+        )
         self.logger.info(f'"{self.label}" action registered.')
 
+    def _on_update(self, event):
+        """Keep the project catalog and template snapshots in step with the server."""
+        self.projects.handle_update_event(event)
+        # Any change inside a project drops its cached snapshot.
+        self.snapshots.handle_update_event(event)
+
     def _discover(self, event):
         """This action is global, so it should always be available."""
         self.logger.info("Discover event received, action is available.")
@@ -50,33 +93,31 @@ class CreateProjectFromCopyAction:
     def _launch(self, event):
         """Handles both displaying the form and processing the submission."""
         self.logger.info("Launch event received.")
+        # User-facing: served ahead of background sync/clone traffic.
+        with priority_lane(INTERACTIVE), track('create_from_copy.launch', event.get('id')):
+            return self._handle_launch(event)
+
+    def _handle_launch(self, event):
+        """Display the form or process the submission."""
         if 'values' in event['data']:
             self.logger.info("Processing form submission.")
-            self._process_form(event)
-            return {'success': True, 'message': 'Project copy job started!'}
+            return self._process_form(event)
 
         self.logger.info("Building form for user.")
         return self._build_form(event)
 
     def _build_form(self, event):
-        """Queries for projects and returns the UI form definition."""
-        self.logger.info("Querying for all projects to populate form dropdown.")
-        
-        all_projects = list(self.session.query('select id, full_name from Project'))
-        self.logger.info(f"Found {len(all_projects)} projects.")
+        """Returns the UI form definition, with projects from the in-process catalog."""
+        project_options = self.projects.options()
+        self.logger.info(f"Found {len(project_options)} projects.")
 
-        if not all_projects:
+        if not project_options:
             self.logger.warning("No projects found in ftrack instance.")
             return {
                 'success': False,
                 'message': 'No projects found to copy from.'
             }
 
-        project_options = [
-            {'label': p['full_name'], 'value': p['id']}
-            for p in sorted(all_projects, key=lambda x: x['full_name'])
-        ]
-
         return {
             'type': 'form',
             'title': 'Create Project from Copy',
@@ -121,32 +162,92 @@ class CreateProjectFromCopyAction:
         
         job = self.session.create('Job', {
             'user_id': user_id,
-            'status': 'running',
-            'data': json.dumps({'description': f"Starting copy of project '{values['new_project_name']}'."})
+            'status': 'queued',
+            'data': json.dumps({'description': f"Queued copy of project '{values['new_project_name']}'."})
         })
         self.session.commit()
         self.logger.info(f"Created job {job['id']} to track progress.")
-        
+
+        # Hand the clone to the background executor so the hub callback returns
+        # immediately and other discover/launch events are not blocked.
+        future = self._executor.submit(self._run_clone_job, values, job['id'])
+        future.add_done_callback(self._log_job_crash)
+        return {'success': True, 'message': 'Project copy job started!'}
+
+    def _log_job_crash(self, future):
+        """Log anything a clone job raised past its own error handling."""
+        if future.cancelled():
+            return
+        error = future.exception()
+        if error:
+            self.logger.error(f"Clone job crashed: {error}", exc_info=error)
+
+    def _worker_session(self):
+        """Return the session owned by the current worker thread."""
+        session = getattr(self._worker_state, 'session', None)
+        if session is None:
+            session = self.session_factory()
+            self._worker_state.session = session
+        return session
+
+    def _run_clone_job(self, values, job_id):
+        """Run one clone on a worker thread and keep its ftrack Job up to date."""
+        with track('create_from_copy.clone', job_id, project=values['new_project_name']):
+            self._clone_job(values, job_id)
+
+    def _clone_job(self, values, job_id):
+        session = None
         try:
-            self._clone_project(values, job)
-            job['data'] = json.dumps({'description': f"Successfully copied project '{values['new_project_name']}'."})
+            session = self._worker_session()
+            job = session.get('Job', job_id)
+            job['status'] = 'running'
+            job['data'] = json.dumps({'description': f"Starting copy of project '{values['new_project_name']}'."})
+            session.commit()
+
+            def report_progress(done, total):
+                # Called right before each chunk commit, so the update rides along.
+                percent = int(done * 100 / total) if total else 100
+                job['data'] = json.dumps({
+                    'description': f"Copying '{values['new_project_name']}': {done}/{total} entities ({percent}%).",
+                    'progress': percent,
+                    'entities_done': done,
+                    'entities_total': total
+                })
+
+            self._clone_project(session, values, job, report_progress)
+            job['data'] = json.dumps({'description': f"Successfully copied project '{values['new_project_name']}'.", 'progress': 100})
             job['status'] = 'done'
-            self.logger.info(f"Job {job['id']} completed successfully.")
+            session.commit()
+            self.logger.info(f"Job {job_id} completed successfully.")
         except Exception as e:
-            self.logger.error(f"Job {job['id']} failed: {e}", exc_info=True)
-            job['data'] = json.dumps({'description': f"ERROR: Could not copy project. Reason: {e}"})
+            self.logger.error(f"Job {job_id} failed: {e}", exc_info=True)
+            self._fail_job(session, job_id, e)
+
+    def _fail_job(self, session, job_id, error):
+        """Mark the Job failed so it does not stay queued or running forever."""
+        try:
+            if session is None:
+                # Opening the worker session failed; try once more for the status update.
+                session = self._worker_session()
+            session.rollback()
+            job = session.get('Job', job_id)
+            job['data'] = json.dumps({'description': f"ERROR: Could not copy project. Reason: {error}"})
             job['status'] = 'failed'
-        finally:
-            self.session.commit()
+            session.commit()
+        except Exception as e:
+            # The worker session is unusable; the next job opens a new one.
+            self._worker_state.session = None
+            self.logger.error(f"Could not mark job {job_id} as failed: {e}", exc_info=True)
 
-    def _clone_project(self, form_data, job):
+    def _clone_project(self, session, form_data, job, report_progress=None):
         """The main logic for cloning the project."""
         source_project_id = form_data['source_project_id']
         new_project_full_name = form_data['new_project_name']
         new_start_date = datetime.datetime.strptime(form_data['new_start_date'], '%Y-%m-%d')
         self.logger.info(f"Starting clone from source project ID: {source_project_id}")
         
-        source_project = self.session.get('Project', source_project_id)
+        snapshot = self.snapshots.get_or_build(session, source_project_id)
+        source_project = snapshot['project']
         
         new_end_date = None
         if source_project['start_date'] and source_project['end_date']:
@@ -156,19 +257,19 @@ class CreateProjectFromCopyAction:
         else:
             self.logger.warning("Source project missing start/end dates. New end date will not be set.")
         
-        if self.session.query(f'Project where full_name is "{new_project_full_name}"').first():
+        if session.query(f'Project where full_name is "{new_project_full_name}"').first():
             raise ValueError(f"A project named '{new_project_full_name}' already exists.")
 
         job['data'] = json.dumps({'description': f"Creating project '{new_project_full_name}'..."})
-        self.session.commit()
+        session.commit()
 
         new_project_short_name = new_project_full_name.lower().replace(' ', '_')
         self.logger.info(f"Creating new project entity: '{new_project_full_name}' (Short name: {new_project_short_name})")
 
-        new_project = self.session.create('Project', {
+        new_project = session.create('Project', {
             'name': new_project_short_name,
             'full_name': new_project_full_name,
-            'project_schema': source_project['project_schema'],
+            'project_schema': session.get('ProjectSchema', source_project['project_schema_id']),
             'start_date': new_start_date,
             'end_date': new_end_date
         })
@@ -177,43 +278,75 @@ class CreateProjectFromCopyAction:
             new_project['custom_attributes'][key] = value
         self.logger.info(f"Copied custom attributes from source project.")
 
-        self.session.commit()
+        session.commit()
+        self.projects.upsert(new_project['id'], new_project_full_name)
         self.logger.info(f"New project created with ID: {new_project['id']}. Starting recursive copy.")
 
-        self._clone_recursive(source_project, new_project)
+        self._clone_recursive(session, snapshot, new_project, report_progress)
+
+    def _plan_clone(self, snapshot):
+        """Flatten the snapshot tree into (depth, source_node, source_parent_id) tuples, parents first."""
+        grouped = children_by_parent(snapshot)
+        plan = []
+        level = [snapshot['project']['id']]
+        depth = 0
+        while level:
+            next_level = []
+            for parent_id in level:
+                for source_child in grouped.get(parent_id, []):
+                    plan.append((depth, source_child, parent_id))
+                    if source_child['entity_type'] not in LEAF_ENTITY_TYPES:
+                        next_level.append(source_child['id'])
+            level = next_level
+            depth += 1
+        return plan
+
+    def _clone_recursive(self, session, snapshot, target_parent, report_progress=None):
+        """Clones all descendants of a snapshotted source project into a target parent.
 
-    def _clone_recursive(self, source_parent, target_parent):
-        """Recursively clones all children from a source parent to a target parent."""
-        source_children = sorted(source_parent['children'], key=lambda child: child.get('position', 0))
-        self.logger.info(f"Found {len(source_children)} children to copy under '{source_parent['name']}'.")
-        for source_child in source_children:
-            self.logger.info(f"Copying '{source_child['name']}' ({source_child.entity_type}) to '{target_parent['name']}'.")
-            
-            new_child_data = {'name': source_child['name'], 'parent': target_parent}
+        The copies are created in memory from the snapshot, breadth first, and
+        committed in chunks of COMMIT_CHUNK_SIZE so every parent is committed
+        no later than its children.
+        """
+        plan = self._plan_clone(snapshot)
+        self.logger.info(f"Copying {len(plan)} entities under '{snapshot['project']['name']}'.")
 
-            if source_child.entity_type == 'Task':
-                # --- MODIFICATIONS AS PER YOUR REQUEST ---
+        task_types = {t['id']: t for t in session.query('select id, name from Type')}
+        targets = {snapshot['project']['id']: target_parent}
+        pending = 0
+        done = 0
+        for depth, source_child, source_parent_id in plan:
+            new_child_data = {'name': source_child['name'], 'parent': targets[source_parent_id]}
 
+            if source_child['entity_type'] == 'Task':
                 # 1. Set the task type from the source.
-                new_child_data['type'] = source_child.get('type')
-                
+                new_child_data['type'] = task_types.get(source_child['type_id'])
+
                 # 2. DO NOT copy the status. By leaving this out, ftrack will
                 #    automatically assign the default "Not Started" status from the schema.
-                
+
                 # 3. DO NOT copy assignees. The 'assignments' attribute is not
                 #    being copied, so new tasks will be unassigned.
-                
-                # --- END OF MODIFICATIONS ---
 
-            new_child = self.session.create(source_child.entity_type, new_child_data)
-            
+            new_child = session.create(source_child['entity_type'], new_child_data)
             for key, value in source_child['custom_attributes'].items():
                 new_child['custom_attributes'][key] = value
+            targets[source_child['id']] = new_child
+
+            pending += 1
+            done += 1
+            if pending >= COMMIT_CHUNK_SIZE:
+                if report_progress:
+                    report_progress(done, len(plan))
+                session.commit()
+                self.logger.info(f"Committed {pending} entities (depth {depth}).")
+                pending = 0
 
-            self.session.commit()
-            
-            if source_child.entity_type not in ['Task', 'Milestone']:
-                self._clone_recursive(source_child, new_child)
+        if pending:
+            if report_progress:
+                report_progress(done, len(plan))
+            session.commit()
+            self.logger.info(f"Committed {pending} entities.")
 
 def register(session):
     """Register the project copy action."""
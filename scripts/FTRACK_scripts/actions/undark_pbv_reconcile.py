@@ -0,0 +1,243 @@
+"""
+UNDARK ↔ PBV Bulk Reconciliation
+----------------------------------
+Batch counterpart of the event-driven sync in undark_pbv_sync. Events get
+missed and names get edited, so this mode periodically pulls projected lists
+of asset-request tasks, notes and asset versions for every project that
+exists on both servers, diffs them in memory by the sync's matching keys and
+creates whatever is missing in batched commits.
+
+Usage:
+    python -m actions.undark_pbv_reconcile --dry-run
+    python -m actions.undark_pbv_reconcile --project my_project --every 3600
+"""
+
+import argparse
+import collections
+import logging
+import time
+
+from actions.undark_pbv_sync import (
+    PBV_FTRACK_API_KEY, PBV_FTRACK_API_URL, PBV_FTRACK_API_USER,
+    UNDARK_FTRACK_API_KEY, UNDARK_FTRACK_API_URL, UNDARK_FTRACK_API_USER,
+    get_ftrack_session,
+)
+from core.id_map import SyncIdMap
+from core.logging_setup import configure_logging
+
+logger = logging.getLogger("undark_pbv_reconcile")
+
+# Ids per "in (...)" clause and results per server page.
+QUERY_CHUNK_SIZE = 100
+PAGE_SIZE = 1000
+# Creates per commit.
+COMMIT_CHUNK_SIZE = 200
+
+
+def _id_list(ids):
+    return ", ".join(f'"{i}"' for i in ids)
+
+
+def _chunked_query(session, template, ids):
+    """Run template (with an {ids} placeholder) over ids in chunks, yielding every result."""
+    ids = list(ids)
+    for i in range(0, len(ids), QUERY_CHUNK_SIZE):
+        chunk = ids[i:i + QUERY_CHUNK_SIZE]
+        yield from session.query(template.format(ids=_id_list(chunk)), page_size=PAGE_SIZE)
+
+
+class ServerState:
+    """Projected snapshot of the synced entity types of the shared projects on one server."""
+
+    def __init__(self, name, session):
+        self.name = name
+        self.session = session
+        self.projects = {}        # project name -> project
+        self.tasks = {}           # (project name, task name) -> task
+        self.assets = {}          # (project name, asset name) -> asset
+        self.notes = {}           # (project name, task name, subject, content) -> note
+        self.versions = {}        # (project name, asset name, version name) -> version
+        self.users = {}           # username -> user
+
+    def load_projects(self):
+        self.projects = {p["name"]: p for p in self.session.query("select id, name from Project")}
+
+    def load(self, project_names):
+        session = self.session
+        project_ids = [self.projects[name]["id"] for name in project_names]
+        project_by_id = {self.projects[name]["id"]: name for name in project_names}
+
+        task_by_id = {}
+        for task in _chunked_query(session, "select id, name, project_id from Task where project_id in ({ids})", project_ids):
+            key = (project_by_id[task["project_id"]], task["name"])
+            self.tasks.setdefault(key, task)
+            task_by_id[task["id"]] = key
+
+        asset_by_id = {}
+        for asset in _chunked_query(session, "select id, name, project_id from Asset where project_id in ({ids})", project_ids):
+            key = (project_by_id[asset["project_id"]], asset["name"])
+            self.assets.setdefault(key, asset)
+            asset_by_id[asset["id"]] = key
+
+        for note in _chunked_query(
+            session, "select id, subject, content, parent_id, metadata, user.username from Note where parent_id in ({ids})", task_by_id
+        ):
+            project_name, task_name = task_by_id[note["parent_id"]]
+            key = (project_name, task_name, note["subject"] or "", note["content"] or "")
+            self.notes.setdefault(key, note)
+
+        for version in _chunked_query(
+            session, "select id, name, asset_id, metadata from AssetVersion where asset_id in ({ids})", asset_by_id
+        ):
+            project_name, asset_name = asset_by_id[version["asset_id"]]
+            self.versions.setdefault((project_name, asset_name, version["name"]), version)
+
+        self.users = {u["username"]: u for u in session.query("select id, username from User")}
+        logger.info(
+            "[%s] Loaded %d tasks, %d assets, %d notes, %d versions in %d projects.",
+            self.name, len(self.tasks), len(self.assets), len(self.notes), len(self.versions), len(project_names),
+        )
+
+
+def _is_asset_request(task_key):
+    return "asset-request" in task_key[1].lower()
+
+
+def plan_creates(pbv, undark, id_map):
+    """Diff both servers by the sync's matching keys.
+
+    Returns a list of (kind, source state, target state, key, source entity).
+    Tasks flow PBV → UNDARK only; notes and versions flow both ways.
+    """
+    plan = []
+    for key, task in pbv.tasks.items():
+        if not _is_asset_request(key) or key in undark.tasks:
+            continue
+        # Synced tasks may since have been renamed on either side; the id map still pairs them.
+        if id_map.counterpart(pbv.name, task["id"], undark.name):
+            continue
+        plan.append(("Task", pbv, undark, key, task))
+
+    for source, target in ((pbv, undark), (undark, pbv)):
+        for key, note in source.notes.items():
+            if key in target.notes or id_map.counterpart(source.name, note["id"], target.name):
+                continue
+            if "synced_from" in (note["metadata"] or {}):
+                continue  # a copy whose original was deleted; do not bounce it back
+            if (key[0], key[1]) not in target.tasks:
+                continue
+            plan.append(("Note", source, target, key, note))
+
+        for key, version in source.versions.items():
+            if key in target.versions or id_map.counterpart(source.name, version["id"], target.name):
+                continue
+            if "synced_from" in (version["metadata"] or {}):
+                continue
+            if (key[0], key[1]) not in target.assets:
+                continue
+            plan.append(("AssetVersion", source, target, key, version))
+    return plan
+
+
+def apply_plan(plan, id_map):
+    """Create the planned entities, committing every COMMIT_CHUNK_SIZE creates per target server."""
+    pending = collections.defaultdict(list)
+
+    def commit(target):
+        if not pending[target.name]:
+            return
+        target.session.commit()
+        for kind, source, source_id, new_id in pending[target.name]:
+            id_map.record(kind, source.name, source_id, target.name, new_id)
+        logger.info("[%s] Committed %d creates.", target.name, len(pending[target.name]))
+        pending[target.name] = []
+
+    targets = {}
+    for kind, source, target, key, entity in plan:
+        targets[target.name] = target
+        session = target.session
+        if kind == "Task":
+            created = session.create("Task", {"name": key[1], "parent": target.projects[key[0]]})
+        elif kind == "Note":
+            payload = {
+                "parent": target.tasks[(key[0], key[1])],
+                "subject": key[2],
+                "content": key[3],
+                "metadata": {"synced_from": source.name},
+            }
+            user = entity["user"]
+            author = target.users.get(user["username"]) if user else None
+            if author:
+                payload["author"] = author
+            created = session.create("Note", payload)
+        else:
+            created = session.create("AssetVersion", {
+                "name": key[2],
+                "asset": target.assets[(key[0], key[1])],
+                "metadata": {"synced_from": source.name},
+            })
+
+        pending[target.name].append((kind, source, entity["id"], created["id"]))
+        if len(pending[target.name]) >= COMMIT_CHUNK_SIZE:
+            commit(target)
+
+    for target in targets.values():
+        commit(target)
+
+
+def format_report(plan):
+    """Human readable per-project summary of the planned creates."""
+    counts = collections.Counter((key[0], kind, f"{source.name} → {target.name}") for kind, source, target, key, _ in plan)
+    if not counts:
+        return "Nothing to reconcile: both servers are in sync."
+    lines = [f"{len(plan)} entities to create:"]
+    for (project, kind, direction), count in sorted(counts.items()):
+        lines.append(f"  {project:<40} {kind:<13} {direction:<16} {count}")
+    return "\n".join(lines)
+
+
+def reconcile(session_pbv, session_undark, id_map=None, dry_run=True, projects=None):
+    """Run one reconciliation pass; returns the plan that was (or would be) applied."""
+    started = time.monotonic()
+    id_map = id_map or SyncIdMap()
+    pbv = ServerState("PBV", session_pbv)
+    undark = ServerState("UNDARK", session_undark)
+    pbv.load_projects()
+    undark.load_projects()
+
+    shared = sorted(set(pbv.projects) & set(undark.projects))
+    if projects:
+        shared = [name for name in shared if name in projects]
+    logger.info("Reconciling %d shared projects.", len(shared))
+
+    pbv.load(shared)
+    undark.load(shared)
+    plan = plan_creates(pbv, undark, id_map)
+    logger.info(format_report(plan))
+
+    if not dry_run and plan:
+        apply_plan(plan, id_map)
+    logger.info("Reconciliation %s in %.1fs.", "dry run finished" if dry_run else "finished", time.monotonic() - started)
+    return plan
+
+
+# --- Main ---
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Bulk reconcile PBV and UNDARK ftrack servers.")
+    parser.add_argument("--dry-run", action="store_true", help="only report what would be created")
+    parser.add_argument("--project", action="append", help="limit to this project name (repeatable)")
+    parser.add_argument("--every", type=float, default=0, help="repeat every N seconds instead of running once")
+    args = parser.parse_args()
+    configure_logging("undark_pbv_reconcile")
+
+    pbv = get_ftrack_session(PBV_FTRACK_API_KEY, PBV_FTRACK_API_USER, PBV_FTRACK_API_URL)
+    undark = get_ftrack_session(UNDARK_FTRACK_API_KEY, UNDARK_FTRACK_API_USER, UNDARK_FTRACK_API_URL)
+    id_map = SyncIdMap()
+    while True:
+        try:
+            reconcile(pbv, undark, id_map=id_map, dry_run=args.dry_run, projects=args.project)
+        except Exception as e:
+            logger.exception("Reconciliation failed: %s", e)
+        if not args.every:
+            break
+        time.sleep(args.every)
@@ -9,16 +9,30 @@ import os
 import threading
 import logging
 import functools
+import collections
 import time
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
-import ftrack_api
 
-
-# --- Logging Configuration ---
-logging.basicConfig(
-    level=logging.DEBUG,
-    format="%(asctime)s [%(levelname)s] %(name)s: %(message)s",
-)
+from core.config import env_bool, env_float
+from core.dispatch import DispatchTable, update_subscription
+from core.echo_guard import EchoGuard
+from core.event_batcher import EventBatcher
+from core.event_journal import EventJournal
+from core.gap_recovery import GapRecovery
+from core.id_map import SyncIdMap
+from core.instrumentation import instrument_session
+from core.media_transfer import LocalDiskStore, LocationStore, MediaTransfer
+from core.logging_setup import configure_logging
+from core.rate_limiter import install_rate_limiter
+from core.runtime import LockedSession, holding
+from core.schema_cache import create_session
+from core.shard_lease import ShardLeases
+from core.sync_topology import load_topology
+
+
+# --- Logging ---
+# Configured by the entry point (core.logging_setup); set FTRACK_LOG_LEVELS="undark_pbv_sync=DEBUG" for detail.
 logger = logging.getLogger("undark_pbv_sync")
 
 
@@ -34,18 +48,44 @@ UNDARK_FTRACK_API_USER = os.getenv("UNDARK_FTRACK_API_USER")
 UNDARK_FTRACK_API_URL = os.getenv("UNDARK_FTRACK_API_URL")
 
 
+# Changed-since queries run per server to catch entities created while the
+# listener was down or the hub was disconnected. Each selects the owning
+# project's id, so recovered entities shard like live events.
+RECOVERY_QUERIES = {
+    "Task": 'select id, project_id from Task where created_at > "{since}" and name like "%asset-request%"',
+    "Note": 'select id, parent.project_id from Note where date > "{since}"',
+    "AssetVersion": 'select id, asset.project_id from AssetVersion where date > "{since}"',
+}
+RECOVERY_PROJECT_ATTRIBUTES = {
+    "Task": "project_id",
+    "Note": "parent.project_id",
+    "AssetVersion": "asset.project_id",
+}
+
+# Sharding: when enabled, several replicas of this service share the load,
+# each handling only the projects in the partitions it holds a lease on.
+SYNC_SHARDING = env_bool("FTRACK_SYNC_SHARDING", False)
+# Seconds a gap recovery looks back after taking over partitions from another replica.
+SYNC_TAKEOVER_LOOKBACK = env_float("FTRACK_SYNC_TAKEOVER_LOOKBACK", 3600)
+
+# Transfer the files behind mirrored versions' components, not just the versions.
+# Unset: on only when every server has a media_root or a location other than
+# ftrack.server configured in the topology.
+SYNC_MEDIA = env_bool("FTRACK_SYNC_MEDIA", None)
+
+
 # --- Helper Functions ---
 def get_ftrack_session(api_key, api_user, api_url):
     logger.info("Connecting to ftrack server: %s as %s", api_url, api_user)
     try:
-        session = ftrack_api.Session(
+        session = create_session(
             api_key=api_key,
             api_user=api_user,
             server_url=api_url,
             auto_connect_event_hub=True,
         )
         logger.info("Connected successfully to %s", api_url)
-        return session
+        return install_rate_limiter(instrument_session(session))
     except Exception as e:
         logger.critical("Failed to connect to %s: %s", api_url, e)
         raise
@@ -73,10 +113,6 @@ def _safe_str(value):
         return "<unprintable>"
 
 
-def _resolve_entity_type(entity):
-    return (entity.get("entity_type") or entity.get("entityType") or "").lower()
-
-
 def _resolve_action(entity):
     return (entity.get("action") or entity.get("operation") or "").lower()
 
@@ -85,165 +121,273 @@ def _resolve_note_id(entity):
     return entity.get("entityId") or entity.get("id")
 
 
+# (server, project id) → project name, for shard keys.
+_project_names = {}
+
+
+def _resolve_shard_key(link, entity):
+    """Project name of an event entity, falling back to its own id if the event has none.
+
+    Project ids differ between servers, names do not, so both directions of
+    a project land in the same partition and on the same replica.
+    """
+    project_id = next(
+        (parent.get("entityId") for parent in entity.get("parents") or [] if parent.get("entityType") == "show"), None
+    )
+    if not project_id:
+        return _resolve_note_id(entity)
+    key = (link.source_name, project_id)
+    name = _project_names.get(key)
+    if name is None:
+        project = link.source.query(f'select name from Project where id is "{project_id}"').first()
+        name = _project_names[key] = project["name"] if project else project_id
+    return name
+
+
+# --- Sync Direction ---
+# Each hub gets its own callback bound to the SyncLinks leaving its server, so
+# the direction of an event is known from the hub it arrived on instead of
+# probing every server. entity_types (lower case) limits what a link replicates;
+# media, if set, is the MediaTransfer moving component data along the link.
+SyncLink = collections.namedtuple(
+    "SyncLink",
+    ["source", "target", "source_name", "target_name", "id_map", "echo_guard", "entity_types", "shards", "media"],
+    defaults=(None, None, None),
+)
+
+
+def _is_sync_echo(link, entity_id):
+    """True if entity_id was created on the source server by the sync itself."""
+    return link.echo_guard.seen(link.source_name, entity_id) or link.id_map.is_mirror(link.source_name, entity_id)
+
+
+def _is_synced_copy(entity):
+    """True if the entity carries the 'synced_from' marker the sync writes on its copies."""
+    metadata = _get(entity, "metadata")
+    try:
+        return bool(metadata) and "synced_from" in metadata
+    except Exception:
+        return False
+
+
+def _resolve_counterpart(link, entity_type, source_entity, query):
+    """Find the target-side entity mirroring source_entity.
+
+    Uses the local id map first; falls back to the name-based query and
+    remembers the match so the next lookup is local.
+    """
+    target_id = link.id_map.counterpart(link.source_name, source_entity["id"], link.target_name)
+    if target_id:
+        found = link.target.get(entity_type, target_id)
+        if found:
+            return found
+        logger.debug("[ID MAP] Stale %s mapping %s → %s; re-resolving.", entity_type, source_entity["id"], target_id)
+
+    found = link.target.query(query).first()
+    if found:
+        link.id_map.record(entity_type, link.source_name, source_entity["id"], link.target_name, found["id"])
+    return found
+
+
+def _resolve_target_project(link, project):
+    return _resolve_counterpart(
+        link, "Project", project, f'Project where name is "{_escape(project["name"])}"'
+    )
+
+
+# --- Handlers ---
+# Each synced entity type has a reader and a writer. The reader runs once per
+# event under the source session's lock and returns the plain values the
+# writers need (or None to skip the event); the writer runs once per link
+# under that link's target lock only, so the links of one server write in
+# parallel instead of queueing on their shared source session.
+
+
 # --- Task Sync ---
-def handle_task_creation(entity, session_pbv, session_undark):
-    task_id = entity.get("entityId")
-    if not task_id:
+def read_task(entity, link):
+    task_id = _resolve_note_id(entity)
+    logger.info("[TASK SYNC] Checking for new task %s on %s...", task_id, link.source_name)
+    task = link.source.query(f'Task where id is "{task_id}"').first()
+    if not task:
+        logger.warning("[TASK SYNC] Task %s not found on %s.", task_id, link.source_name)
+        return None
+
+    name = task["name"]
+    if "asset-request" not in name.lower():
+        logger.debug("[TASK SYNC] Task %s is not an 'asset-request'; skipping.", name)
+        return None
+
+    project = task["project"]
+    return {"id": task_id, "name": name, "project": {"id": project["id"], "name": project["name"]}}
+
+
+def write_task(task, link):
+    name, project_name = task["name"], task["project"]["name"]
+    logger.info("[TASK SYNC] Syncing '%s' in project '%s'...", name, project_name)
+
+    target_project = _resolve_target_project(link, task["project"])
+    if not target_project:
+        logger.warning("[TASK SYNC] Target project not found on %s: %s", link.target_name, project_name)
         return
 
-    try:
-        logger.info("[TASK SYNC] Checking for new task %s on PBV...", task_id)
-        task = session_pbv.query(f'Task where id is "{task_id}"').first()
-        if not task:
-            logger.warning("[TASK SYNC] Task %s not found on PBV.", task_id)
-            return
-
-        name = task["name"]
-        if "asset-request" not in name.lower():
-            logger.debug("[TASK SYNC] Task %s is not an 'asset-request'; skipping.", name)
-            return
-
-        project_name = task["project"]["name"]
-        logger.info("[TASK SYNC] Syncing '%s' in project '%s'...", name, project_name)
-
-        target_project = session_undark.query(
-            f'Project where name is "{_escape(project_name)}"'
-        ).first()
-        if not target_project:
-            logger.warning("[TASK SYNC] Target project not found on UNDARK: %s", project_name)
-            return
-
-        existing = session_undark.query(
-            f'Task where name is "{_escape(name)}" and parent.id is "{target_project["id"]}"'
-        ).first()
-        if existing:
-            logger.info("[TASK SYNC] Task '%s' already exists on UNDARK.", name)
-            return
-
-        new_task = session_undark.create("Task", {"name": name, "parent": target_project})
-        session_undark.commit()
-        logger.info("[TASK SYNC] Created task '%s' (id=%s) on UNDARK.", name, new_task["id"])
+    existing = link.target.query(
+        f'Task where name is "{_escape(name)}" and parent.id is "{target_project["id"]}"'
+    ).first()
+    if existing:
+        link.id_map.record("Task", link.source_name, task["id"], link.target_name, existing["id"])
+        logger.info("[TASK SYNC] Task '%s' already exists on %s.", name, link.target_name)
+        return
 
-    except Exception as e:
-        logger.exception("[TASK SYNC] Error syncing task: %s", e)
+    new_task = link.target.create("Task", {"name": name, "parent": target_project})
+    link.echo_guard.add(link.target_name, new_task["id"])
+    link.target.commit()
+    link.id_map.record("Task", link.source_name, task["id"], link.target_name, new_task["id"])
+    logger.info("[TASK SYNC] Created task '%s' (id=%s) on %s.", name, new_task["id"], link.target_name)
 
 
 # --- Note Sync ---
-def handle_note_creation(entity, session_pbv, session_undark):
+def read_note(entity, link):
     note_id = _resolve_note_id(entity)
-    action = _resolve_action(entity)
-    logger.info("[NOTE SYNC] Event received: id=%s action=%s", note_id, action)
-
-    if not note_id or action != "add":
+    logger.info("[NOTE SYNC] Event received: id=%s on %s", note_id, link.source_name)
+
+    source = link.source
+    source_note = source.query(f'Note where id is "{note_id}"').first()
+    if not source_note:
+        logger.warning("[NOTE SYNC] Note %s not found on %s.", note_id, link.source_name)
+        return None
+
+    # Populate parent (and metadata, to recognise copies made by another sync run)
+    source.populate(source_note, "parent, parent.project, metadata")
+    if _is_synced_copy(source_note):
+        logger.debug("[NOTE SYNC] Note %s is a synced copy; ignoring echo.", note_id)
+        return None
+
+    parent = _get(source_note, "parent")
+    if not parent:
+        logger.warning("[NOTE SYNC] No parent found for note %s; skipping.", note_id)
+        return None
+
+    # Author resolution
+    author = _get(source_note, "user") or _get(source_note, "author")
+    project = parent["project"]
+    return {
+        "id": note_id,
+        "project": {"id": project["id"], "name": _get(project, "name")},
+        "task": {"id": parent["id"], "name": _get(parent, "name")},
+        "content": _get(source_note, "content") or "",
+        "subject": _get(source_note, "subject") or "",
+        "author": (_get(author, "username") or _get(author, "name")) if author else None,
+    }
+
+
+def write_note(note, link):
+    target, target_name = link.target, link.target_name
+    project_name, task_name = note["project"]["name"], note["task"]["name"]
+    logger.debug("[NOTE SYNC] %s → %s: project=%s task=%s", link.source_name, target_name, project_name, task_name)
+
+    # Find matching project/task on target
+    target_project = _resolve_target_project(link, note["project"])
+    if not target_project:
+        logger.warning("[NOTE SYNC] Project not found on %s: %s", target_name, project_name)
         return
 
-    try:
-        # Determine which server has the note
-        note_pbv = session_pbv.query(f'Note where id is "{note_id}"').first()
-        note_undark = session_undark.query(f'Note where id is "{note_id}"').first()
-
-        if note_pbv and note_undark:
-            logger.info("[NOTE SYNC] Note already exists on both servers.")
-            return
-
-        source, target = (session_pbv, session_undark) if note_pbv else (session_undark, session_pbv)
-        source_name, target_name = ("PBV", "UNDARK") if note_pbv else ("UNDARK", "PBV")
-        source_note = note_pbv or note_undark
-        logger.info("[NOTE SYNC] Source=%s Target=%s", source_name, target_name)
-
-        # Populate parent
-        source.populate(source_note, ["parent", "parent.project"])
-        parent = _get(source_note, "parent")
-        if not parent:
-            logger.warning("[NOTE SYNC] No parent found for note %s; skipping.", note_id)
-            return
-
-        project_name = _get(parent["project"], "name")
-        task_name = _get(parent, "name")
-
-        logger.debug("[NOTE SYNC] Parent project=%s task=%s", project_name, task_name)
-
-        # Find matching project/task on target
-        target_project = target.query(f'Project where name is "{_escape(project_name)}"').first()
-        if not target_project:
-            logger.warning("[NOTE SYNC] Project not found on %s: %s", target_name, project_name)
-            return
-
-        target_task = target.query(
-            f'Task where name is "{_escape(task_name)}" and project.id is "{target_project["id"]}"'
-        ).first()
-        if not target_task:
-            logger.warning("[NOTE SYNC] Task not found on %s: %s", target_name, task_name)
-            return
-
-        # Build payload
-        note_payload = {
-            "parent": target_task,
-            "content": _get(source_note, "content") or "",
-            "subject": _get(source_note, "subject") or "",
-            "metadata": {"synced_from": source_name},
-        }
-
-        # Author resolution
-        author = _get(source_note, "user") or _get(source_note, "author")
-        if author:
-            username = _get(author, "username") or _get(author, "name")
-            found = target.query(f'User where username is "{_escape(username)}"').first()
-            if found:
-                note_payload["author"] = found
-                logger.debug("[NOTE SYNC] Author mapped to %s", username)
-            else:
-                logger.warning("[NOTE SYNC] Author %s not found on target.", username)
-
-        # Avoid setting unsupported attributes like 'recipients'
-        schema = target.types["Note"]
-        if "recipients" in schema.keys():
-            logger.debug("[NOTE SYNC] Recipients supported; adding fallback recipients.")
-            note_payload["recipients"] = [note_payload.get("author")] if note_payload.get("author") else []
-
-        logger.info("[NOTE SYNC] Creating note on %s: %s", target_name, note_payload)
-        target.create("Note", note_payload)
-        target.commit()
-        logger.info("[NOTE SYNC] SUCCESS: Synced note '%s' to %s.", _safe_str(note_payload["content"])[:50], target_name)
+    target_task = _resolve_counterpart(
+        link, "Task", note["task"],
+        f'Task where name is "{_escape(task_name)}" and project.id is "{target_project["id"]}"'
+    )
+    if not target_task:
+        logger.warning("[NOTE SYNC] Task not found on %s: %s", target_name, task_name)
+        return
 
-    except Exception as e:
-        logger.exception("[NOTE SYNC] Failed to sync note %s: %s", note_id, e)
+    # Build payload
+    note_payload = {
+        "parent": target_task,
+        "content": note["content"],
+        "subject": note["subject"],
+        "metadata": {"synced_from": link.source_name},
+    }
+
+    username = note["author"]
+    if username:
+        found = target.query(f'User where username is "{_escape(username)}"').first()
+        if found:
+            note_payload["author"] = found
+            logger.debug("[NOTE SYNC] Author mapped to %s", username)
+        else:
+            logger.warning("[NOTE SYNC] Author %s not found on target.", username)
+
+    # Avoid setting unsupported attributes like 'recipients'
+    schema = target.types["Note"]
+    if "recipients" in schema.keys():
+        logger.debug("[NOTE SYNC] Recipients supported; adding fallback recipients.")
+        note_payload["recipients"] = [note_payload.get("author")] if note_payload.get("author") else []
+
+    logger.debug("[NOTE SYNC] Creating note on %s: %s", target_name, note_payload)
+    new_note = target.create("Note", note_payload)
+    link.echo_guard.add(target_name, new_note["id"])
+    target.commit()
+    link.id_map.record("Note", link.source_name, note["id"], target_name, new_note["id"])
+    logger.info("[NOTE SYNC] SUCCESS: Synced note '%s' to %s.", _safe_str(note["content"])[:50], target_name)
 
 
 # --- Version Sync ---
-def handle_version_creation(entity, session_pbv, session_undark):
-    version_id = entity.get("entityId")
-    if not version_id:
-        return
-
+def read_version(entity, link):
+    version_id = _resolve_note_id(entity)
     logger.info("[VERSION SYNC] Version ID: %s", version_id)
 
-    pbv_ver = session_pbv.query(f'AssetVersion where id is "{version_id}"').first()
-    undark_ver = session_undark.query(f'AssetVersion where id is "{version_id}"').first()
-
-    if not pbv_ver and not undark_ver:
-        logger.warning("[VERSION SYNC] Version %s not found anywhere.", version_id)
-        return
+    version = link.source.query(f'AssetVersion where id is "{version_id}"').first()
+    if not version:
+        logger.warning("[VERSION SYNC] Version %s not found on %s.", version_id, link.source_name)
+        return None
 
-    source, target = (session_pbv, session_undark) if pbv_ver else (session_undark, session_pbv)
-    src_name, tgt_name = ("PBV", "UNDARK") if pbv_ver else ("UNDARK", "PBV")
-    version = pbv_ver or undark_ver
+    if _is_synced_copy(version):
+        logger.debug("[VERSION SYNC] Version %s is a synced copy; ignoring echo.", version_id)
+        return None
 
     asset = version["asset"]
-    project_name = asset["project"]["name"]
-    asset_name = asset["name"]
-    version_name = version["name"]
+    project = asset["project"]
+    components = []
+    if link.media:
+        components = [
+            {key: component[key] for key in ("id", "name", "file_type", "size")}
+            for component in link.source.query(
+                f'select id, name, file_type, size from FileComponent where version_id is "{version_id}"'
+            ).all()
+        ]
+    return {
+        "id": version_id,
+        "name": version["name"],
+        "asset": {"id": asset["id"], "name": asset["name"]},
+        "project": {"id": project["id"], "name": project["name"]},
+        "components": components,
+    }
+
+
+def write_version(version, link):
+    target = link.target
+    src_name, tgt_name = link.source_name, link.target_name
+    version_id, version_name = version["id"], version["name"]
+
+    target_id = link.id_map.counterpart(src_name, version_id, tgt_name)
+    if target_id:
+        # Redelivery: finish the component transfers of a copy the sync created.
+        target_version = target.get("AssetVersion", target_id)
+        if target_version and _is_synced_copy(target_version):
+            _sync_version_components(link, version, target_version)
+        return
 
+    project_name, asset_name = version["project"]["name"], version["asset"]["name"]
     logger.info("[VERSION SYNC] %s → %s: %s / %s / %s", src_name, tgt_name, project_name, asset_name, version_name)
 
-    tgt_project = target.query(f'Project where name is "{_escape(project_name)}"').first()
+    tgt_project = _resolve_target_project(link, version["project"])
     if not tgt_project:
         logger.warning("[VERSION SYNC] Project not found on %s: %s", tgt_name, project_name)
         return
 
-    tgt_asset = target.query(
+    tgt_asset = _resolve_counterpart(
+        link, "Asset", version["asset"],
         f'Asset where name is "{_escape(asset_name)}" and project.id is "{tgt_project["id"]}"'
-    ).first()
+    )
     if not tgt_asset:
         logger.warning("[VERSION SYNC] Asset not found on %s: %s", tgt_name, asset_name)
         return
@@ -252,53 +396,284 @@ def handle_version_creation(entity, session_pbv, session_undark):
         f'AssetVersion where name is "{_escape(version_name)}" and asset.id is "{tgt_asset["id"]}"'
     ).first()
     if exists:
+        # Not created by the sync, so its components are left to whoever created it.
+        link.id_map.record("AssetVersion", src_name, version_id, tgt_name, exists["id"])
         logger.info("[VERSION SYNC] Version already exists on %s: %s", tgt_name, version_name)
         return
 
-    target.create("AssetVersion", {"name": version_name, "asset": tgt_asset})
+    new_version = target.create(
+        "AssetVersion", {"name": version_name, "asset": tgt_asset, "metadata": {"synced_from": src_name}}
+    )
+    link.echo_guard.add(tgt_name, new_version["id"])
     target.commit()
+    link.id_map.record("AssetVersion", src_name, version_id, tgt_name, new_version["id"])
     logger.info("[VERSION SYNC] SUCCESS: Created %s on %s.", version_name, tgt_name)
+    _sync_version_components(link, version, new_version)
+
+
+def _sync_version_components(link, version, target_version):
+    """Mirror the version's file components on the target and queue their data transfers.
+
+    Only called for target versions the sync created. Components mirrored
+    earlier (recorded in the id map) are not created again; those whose
+    transfer never finished are queued again and resume from what was
+    already staged or uploaded.
+    """
+    if not link.media:
+        return
+
+    pending, created = [], []
+    for component in version["components"]:
+        target_id = link.id_map.counterpart(link.source_name, component["id"], link.target_name)
+        if target_id:
+            if link.media.index.hash_of(link.target_name, target_id):
+                continue  # already transferred
+            target_component = link.target.get("FileComponent", target_id)
+            if target_component:
+                pending.append((component, target_component))
+                continue
+        target_component = link.target.create("FileComponent", {
+            "name": component["name"],
+            "file_type": component["file_type"],
+            "size": component["size"],
+            "version": target_version,
+        })
+        created.append((component, target_component))
+
+    if created:
+        link.target.commit()
+        for component, target_component in created:
+            link.id_map.record("Component", link.source_name, component["id"], link.target_name, target_component["id"])
+        pending += created
+
+    for component, target_component in pending:
+        link.media.submit(link.source_name, link.target_name, component, target_component)
+    if pending:
+        logger.info("[VERSION SYNC] Queued %d component transfer(s) to %s.", len(pending), link.target_name)
 
 
 # --- Event Dispatcher ---
-def sync_event_handler(session_pbv, session_undark, event):
+def sync_event_handler(link, event):
     logger.debug("[EVENT] Raw event data: %s", event)
-    for entity in event["data"].get("entities", []):
-        action = _resolve_action(entity)
-        etype = _resolve_entity_type(entity)
-        logger.debug("[EVENT] Entity=%s Action=%s", etype, action)
-
-        if etype == "task" and action == "add":
-            handle_task_creation(entity, session_pbv, session_undark)
-        elif etype == "note" and action == "add":
-            handle_note_creation(entity, session_pbv, session_undark)
-        elif etype == "assetversion" and action == "add":
-            handle_version_creation(entity, session_pbv, session_undark)
+    return sync_entities(link, event["data"].get("entities", []))
+
+
+# (entity_type, action) → (lower-case entity type, reader, writer), compiled once.
+SYNC_ROUTES = {
+    ("Task", "add"): ("task", read_task, write_task),
+    ("Note", "add"): ("note", read_note, write_note),
+    ("AssetVersion", "add"): ("assetversion", read_version, write_version),
+}
+SYNC_DISPATCH = DispatchTable(SYNC_ROUTES, name="sync")
+
+
+def _needs_sync(link, etype, entity_id):
+    """False once entity_id is mirrored along link; mirrored versions may still have transfers to finish."""
+    if etype == "assetversion" and link.media:
+        return True
+    return not link.id_map.counterpart(link.source_name, entity_id, link.target_name)
+
+
+def sync_entities(link, entities):
+    """Sync a batch of event entities (as collected by the EventBatcher) across link.
+
+    Returns the entities that failed.
+    """
+    return fan_out([link], None, entities)
+
+
+def _write_all(link, writes):
+    """Run a link's writes in order under its target lock; returns the entities that failed."""
+    failed = []
+    for write, data, entity in writes:
+        try:
+            with holding(link.target):
+                write(data, link)
+        except Exception as e:
+            link.target.rollback()
+            logger.exception(
+                "[EVENT] %s → %s: %s failed: %s", link.source_name, link.target_name, _resolve_note_id(entity), e
+            )
+            failed.append(entity)
+    return failed
+
+
+def fan_out(links, executor, entities):
+    """Sync a batch from one server along all its outgoing links, each target on its own worker.
+
+    Every entity is read from the source once, then written along each link
+    that replicates it. Each entity is handled on its own, so one failure
+    does not stop the rest of the batch; returns the entities that failed on
+    any link, for the batcher to keep unacknowledged.
+    """
+    source = links[0]  # every link leaves the same server
+    writes = {link: [] for link in links}
+    failed = []
+    for entity in entities:
+        route = SYNC_DISPATCH.route(entity)
+        entity_id = _resolve_note_id(entity)
+        if route is None or not entity_id:
+            continue
+        etype, read, write = route
+
+        # Another replica owns this project's partition and handles the event.
+        if source.shards and not source.shards.owns(_resolve_shard_key(source, entity)):
+            continue
+
+        # Drop events for entities the sync itself just created before any query.
+        if _is_sync_echo(source, entity_id):
+            logger.debug("[EVENT] Dropping self-generated event for %s.", entity_id)
+            continue
+
+        targets = [
+            link for link in links
+            if (link.entity_types is None or etype in link.entity_types) and _needs_sync(link, etype, entity_id)
+        ]
+        if not targets:
+            logger.debug("[EVENT] %s %s needs no sync from %s.", etype, entity_id, source.source_name)
+            continue
+
+        try:
+            with holding(source.source):
+                data = read(entity, source)
+        except Exception as e:
+            logger.exception("[EVENT] %s: reading %s %s failed: %s", source.source_name, etype, entity_id, e)
+            failed.append(entity)
+            continue
+        if data is None:
+            continue
+        for link in targets:
+            logger.debug("[EVENT] %s → %s Entity=%s", link.source_name, link.target_name, etype)
+            writes[link].append((write, data, entity))
+
+    pending = [(link, link_writes) for link, link_writes in writes.items() if link_writes]
+    if len(pending) == 1 or executor is None:
+        return failed + [entity for link, link_writes in pending for entity in _write_all(link, link_writes)]
+    futures = [executor.submit(_write_all, link, link_writes) for link, link_writes in pending]
+    return failed + [entity for future in futures for entity in future.result()]
 
 
 # --- Registration ---
+def _media_enabled(topology):
+    if SYNC_MEDIA is not None:
+        return SYNC_MEDIA
+    enabled = all(server.media_root or server.location != "ftrack.server" for server in topology.servers.values())
+    if not enabled:
+        logger.info("[MEDIA] No media_root or disk location configured; component files are not transferred.")
+    return enabled
+
+
+def _media_store(server):
+    if server.media_root:
+        return LocalDiskStore(server.media_root)
+    # Transfers get their own connection so uploads never hold up the sync's session.
+    session = create_session(
+        api_key=server.api_key, api_user=server.user, server_url=server.url, auto_connect_event_hub=False
+    )
+    return LocationStore(LockedSession(session), server.location)
+
+
 def register(session_pbv):
     logger.info("Registering event listeners...")
-    session_undark = get_ftrack_session(
-        UNDARK_FTRACK_API_KEY, UNDARK_FTRACK_API_USER, UNDARK_FTRACK_API_URL
-    )
+    topology = load_topology()
+
+    # One connection per server; the runner's session is the primary server's.
+    sessions = {topology.primary: session_pbv}
+    for name, server in topology.servers.items():
+        if name not in sessions:
+            sessions[name] = get_ftrack_session(server.api_key, server.user, server.url)
+    # Links to different targets run concurrently, so every session is shared between threads.
+    # On the shared runtime the primary session already is the action's LockedSession.
+    sessions = {
+        name: session if isinstance(session, LockedSession) else LockedSession(session)
+        for name, session in sessions.items()
+    }
+
+    media = None
+    if _media_enabled(topology):
+        media = MediaTransfer({name: _media_store(server) for name, server in topology.servers.items()})
+
+    id_map = SyncIdMap()
+    echo_guard = EchoGuard()
+    recoveries = []
+    shards = None
+    suffix = ""
+    if SYNC_SHARDING:
+        # Replicas share the state volume, so each keeps its own journals and checkpoints,
+        # keyed by a name that survives the container being recreated (unlike its hostname).
+        replica_id = os.getenv("FTRACK_SYNC_REPLICA_ID")
+        if not replica_id:
+            raise ValueError("FTRACK_SYNC_SHARDING needs a stable FTRACK_SYNC_REPLICA_ID per replica.")
+
+        # Partitions taken over from a replica that died may have missed events
+        # this replica's checkpoint does not cover, so look back a fixed window.
+        def recover_acquired(partitions):
+            for recovery in recoveries:
+                recovery.schedule(lookback=SYNC_TAKEOVER_LOOKBACK)
+
+        shards = ShardLeases(replica_id=replica_id, on_acquire=recover_acquired)
+        suffix = f"_{replica_id}"
+
+    listeners = []
+    for name, session in sessions.items():
+        outgoing = topology.outgoing(name)
+        if not outgoing:
+            continue
+        links = [
+            SyncLink(
+                session, sessions[link.target], name, link.target, id_map, echo_guard, link.entity_types, shards, media
+            )
+            for link in outgoing
+        ]
+        executor = ThreadPoolExecutor(max_workers=len(links), thread_name_prefix=f"sync-{name.lower()}")
+
+        # Entity types this server replicates nowhere are dropped on arrival.
+        replicated = topology.replicated_types(name)
+        dispatch = DispatchTable(
+            {key: route for key, route in SYNC_ROUTES.items() if route[0] in replicated}, name=f"sync_{name.lower()}"
+        )
 
-    callback = functools.partial(sync_event_handler, session_pbv, session_undark)
-    topics = ["ftrack.update", "ftrack.note"]
+        # One callback per hub: its events sync along every link leaving that server.
+        # Bursts are coalesced and de-duplicated before they reach the handlers.
+        callback = EventBatcher(
+            functools.partial(fan_out, links, executor),
+            name=f"sync_{name.lower()}",
+            journal=EventJournal(f"sync_{name.lower()}{suffix}"),
+            dispatch=dispatch,
+        )
+        queries = {etype: query for etype, query in RECOVERY_QUERIES.items() if etype.lower() in replicated}
+        recoveries.append(
+            GapRecovery(session, callback, queries, project_attributes=RECOVERY_PROJECT_ATTRIBUTES)
+        )
+        listeners.append((name, session, callback, outgoing))
+
+    # Leases are taken once the recoveries exist, so the first acquisition looks back
+    # too, and before subscribing, so no early event is dropped as unowned.
+    if shards:
+        shards.start()
+        logger.info("Sharding enabled: replica %s owns partitions %s.", shards.replica_id, shards.owned)
+
+    for name, session, callback, outgoing in listeners:
+        subscriptions = [update_subscription("ftrack.update", topology.servers[name].user), "topic=ftrack.note"]
+        for subscription in subscriptions:
+            session.event_hub.subscribe(subscription, callback)
+        logger.info(
+            "Subscribed to %s on %s (→ %s).", ", ".join(subscriptions), name, ", ".join(l.target for l in outgoing)
+        )
 
-    for topic in topics:
-        session_pbv.event_hub.subscribe(f"topic={topic}", callback)
-        session_undark.event_hub.subscribe(f"topic={topic}", callback)
-        logger.info("Subscribed to topic: %s", topic)
+        # The runner waits on the primary hub; every other hub gets its own thread.
+        if name != topology.primary:
+            thread = threading.Thread(target=session.event_hub.wait, name=f"hub-{name.lower()}", daemon=True)
+            thread.start()
+            logger.info("%s listener thread started.", name)
 
-    # Background listener for UNDARK
-    thread = threading.Thread(target=session_undark.event_hub.wait, daemon=True)
-    thread.start()
-    logger.info("UNDARK listener thread started.")
+    for recovery in recoveries:
+        recovery.register()
 
 
 # --- Main ---
 if __name__ == "__main__":
+    configure_logging("undark_pbv_sync")
     logger.info("Starting UNDARK-PBV Sync Service...")
     pbv = get_ftrack_session(PBV_FTRACK_API_KEY, PBV_FTRACK_API_USER, PBV_FTRACK_API_URL)
     register(pbv)
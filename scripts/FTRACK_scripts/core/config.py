@@ -0,0 +1,44 @@
+"""
+Shared runtime configuration for the ftrack action server.
+Everything is read from the environment (and the .env file loaded by the
+entry points), so the Docker image and local runs behave the same way.
+"""
+
+import os
+
+# Directory holding local runtime state (SQLite stores, journals, caches).
+# Mount a volume here in Docker so state survives container restarts.
+STATE_DIR = os.getenv(
+    "FTRACK_STATE_DIR",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "state"),
+)
+
+
+def state_path(filename):
+    """Return the absolute path of a file inside the state directory, creating the directory if needed."""
+    os.makedirs(STATE_DIR, exist_ok=True)
+    return os.path.join(STATE_DIR, filename)
+
+
+def env_float(name, default):
+    """Read a float from the environment, falling back to the default on missing/invalid values."""
+    try:
+        return float(os.getenv(name, default))
+    except (TypeError, ValueError):
+        return float(default)
+
+
+def env_int(name, default):
+    """Read an int from the environment, falling back to the default on missing/invalid values."""
+    try:
+        return int(os.getenv(name, default))
+    except (TypeError, ValueError):
+        return int(default)
+
+
+def env_bool(name, default=False):
+    """Read a boolean flag from the environment ("1", "true", "yes", "on" are truthy)."""
+    value = os.getenv(name)
+    if value is None:
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "on")
@@ -0,0 +1,73 @@
+"""
+Precompiled entity dispatch tables.
+-----------------------------------
+ftrack.update carries every change on the server, and most of its entities
+(status changes, timelogs, ...) are of no interest to a given listener. The
+hub cannot filter inside an event's entity list, so a DispatchTable does it
+as the first step on the client, before an event is journaled, batched or
+logged: the routes are compiled once into a dict keyed by (entity_type,
+action) under both spellings ftrack uses (the schema name in "entity_type",
+lower case in "entityType"), so each entity costs two dict lookups and the
+lower-casing of its action (taken from "operation" when "action" is missing,
+as in note events).
+"""
+
+import logging
+import os
+
+from core.config import env_bool
+from core.metrics import METRICS
+
+logger = logging.getLogger(__name__)
+
+ANY_ACTION = "*"
+
+
+class DispatchTable:
+    """Routes ftrack.update entities by (entity_type, action) and counts what it drops.
+
+    ``routes`` maps (entity type, action) to a route value (usually the
+    handler); use ANY_ACTION to match every action of a type.
+    """
+
+    def __init__(self, routes, name="dispatch"):
+        self.name = name
+        self._routes = {}
+        self._any_action = {}
+        for (entity_type, action), target in routes.items():
+            for spelling in {entity_type, entity_type.lower()}:
+                if action == ANY_ACTION:
+                    self._any_action[spelling] = target
+                else:
+                    self._routes[(spelling, action.lower())] = target
+
+    def route(self, entity):
+        """Route value for an entity, or None if no route matches."""
+        entity_type = entity.get("entity_type") or entity.get("entityType")
+        action = (entity.get("action") or entity.get("operation") or "").lower()
+        return self._routes.get((entity_type, action)) or self._any_action.get(entity_type)
+
+    def select(self, entities):
+        """Entities with a route, in order; the rest are counted as dropped."""
+        selected = [entity for entity in entities if self.route(entity) is not None]
+        dropped = len(entities) - len(selected)
+        if dropped:
+            METRICS.inc("ftrack_entities_dropped_total", dropped, listener=self.name)
+        if selected:
+            METRICS.inc("ftrack_entities_dispatched_total", len(selected), listener=self.name)
+        return selected
+
+
+def update_subscription(topic="ftrack.update", api_user=None):
+    """Hub subscription expression for a listener's update topic.
+
+    With FTRACK_IGNORE_OWN_EVENTS set, events published by the API user
+    (default FTRACK_API_USER), i.e. its own creates echoing back, are
+    excluded on the hub. Off by default: when the API key belongs to a
+    person, that would also hide their changes made in the web UI.
+    """
+    expression = f"topic={topic}"
+    api_user = api_user or os.getenv("FTRACK_API_USER")
+    if api_user and env_bool("FTRACK_IGNORE_OWN_EVENTS"):
+        expression += f' and source.user.username!="{api_user}"'
+    return expression
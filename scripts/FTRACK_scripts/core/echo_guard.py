@@ -0,0 +1,53 @@
+"""
+In-memory echo guard for the two-way sync.
+------------------------------------------
+When the sync creates an entity on a server, that server publishes its own
+ftrack.update event for it. The guard remembers the ids the sync just created
+for a short time so those self-generated events can be dropped before any
+query is sent to either server.
+"""
+
+import collections
+import threading
+import time
+
+DEFAULT_TTL = 300.0
+DEFAULT_MAX_SIZE = 10000
+
+
+class EchoGuard:
+    """TTL-bounded set of (server, entity id) pairs created by the sync itself."""
+
+    def __init__(self, ttl=DEFAULT_TTL, max_size=DEFAULT_MAX_SIZE):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def add(self, server, entity_id):
+        """Remember that entity_id on server was created by the sync."""
+        with self._lock:
+            key = (server, entity_id)
+            self._entries.pop(key, None)
+            self._entries[key] = time.monotonic() + self.ttl
+            self._expire()
+
+    def seen(self, server, entity_id):
+        """True if entity_id on server was created by the sync within the TTL window."""
+        with self._lock:
+            self._expire()
+            return (server, entity_id) in self._entries
+
+    def __len__(self):
+        with self._lock:
+            self._expire()
+            return len(self._entries)
+
+    def _expire(self):
+        # Entries are kept in insertion order, which is also expiry order.
+        now = time.monotonic()
+        while self._entries:
+            key, expires = next(iter(self._entries.items()))
+            if expires > now and len(self._entries) <= self.max_size:
+                break
+            self._entries.popitem(last=False)
@@ -0,0 +1,266 @@
+"""
+Event coalescing for ftrack.update bursts.
+------------------------------------------
+Bulk operations in ftrack (multi-selecting hundreds of tasks, CSV imports)
+publish a storm of ftrack.update events. An EventBatcher is subscribed to the
+hub in place of a per-event handler: it collects the entities of incoming
+events for a short window, de-duplicates them by (entity_type, id, action)
+and hands the handler one batch, so the handler can resolve the whole burst
+with a few batched queries and a single commit.
+
+With a journal attached, every event is written to disk before it is queued
+and acknowledged only once the handler handled all of its entities, and
+events left over from a previous run are replayed before live events are
+dispatched. A handler reports failures by raising (the whole batch failed)
+or by returning the entities it could not handle; the events carrying them
+stay in the journal with their failed attempt counted.
+
+With a DispatchTable attached, entities without a route are dropped on
+arrival, before they are journaled or queued.
+"""
+
+import collections
+import logging
+import threading
+import time
+
+from core.config import env_float, env_int
+from core.instrumentation import track
+from core.metrics import METRICS
+
+logger = logging.getLogger(__name__)
+
+# Seconds to wait after the first entity of a burst before dispatching it.
+DEFAULT_WINDOW = env_float("FTRACK_EVENT_WINDOW", 0.5)
+# Dispatch early once this many distinct entities are pending.
+DEFAULT_MAX_BATCH = env_int("FTRACK_EVENT_MAX_BATCH", 500)
+
+
+def entity_key(entity):
+    """De-duplication key of an ftrack.update entity: (entity_type, id, action)."""
+    return (
+        (entity.get("entity_type") or entity.get("entityType") or "").lower(),
+        entity.get("entityId") or entity.get("id"),
+        (entity.get("action") or entity.get("operation") or "").lower(),
+    )
+
+
+class EventBatcher:
+    """Collects event entities for a debounce window and dispatches them in batches.
+
+    The instance is callable so it can be passed straight to
+    ``session.event_hub.subscribe``. ``handler`` is called on the batcher's
+    own worker thread with a list of unique entity dicts, in arrival order,
+    and returns None or the entities it failed to handle.
+    ``journal`` is an optional EventJournal for durable delivery, and
+    ``dispatch`` an optional DispatchTable selecting the entities to keep.
+    """
+
+    def __init__(self, handler, name=None, window=None, max_batch=None, journal=None, dispatch=None):
+        self.handler = handler
+        self.dispatch = dispatch
+        self.name = name or getattr(handler, "__name__", "batch")
+        self.window = DEFAULT_WINDOW if window is None else window
+        self.max_batch = DEFAULT_MAX_BATCH if max_batch is None else max_batch
+        self.logger = logging.getLogger(__name__ + "." + self.name)
+
+        self.journal = journal
+        # Everything journaled up to now belongs to a previous run and is replayed first.
+        self._replay_up_to = journal.last_seq() if journal else 0
+
+        self._pending = {}
+        # Journal sequence number → keys of the entities its event carried.
+        self._pending_seqs = {}
+        self._pending_topics = collections.Counter()
+        self._last_event_at = None
+        # Hang detection: when the worker last completed a dispatch, replay page or task
+        # (or picked up work while idle), and whether it is running one right now.
+        self._last_progress = None
+        self._busy = False
+        self._deadline = None
+        self._tasks = collections.deque()
+        self._condition = threading.Condition()
+        self._stopped = False
+
+        METRICS.register_gauge("ftrack_batch_queue_depth", self.pending, listener=self.name)
+        METRICS.register_gauge("ftrack_last_event_age_seconds", self._last_event_age, listener=self.name)
+        METRICS.register_progress(f"batcher-{self.name}", self._stalled_since)
+        if journal:
+            METRICS.register_gauge("ftrack_journal_backlog", journal.pending_count, listener=self.name)
+            METRICS.register_gauge("ftrack_journal_dead_letters", journal.dead_letter_count, listener=self.name)
+
+        self._thread = threading.Thread(target=self._run, name=f"batcher-{self.name}", daemon=True)
+        self._thread.start()
+
+    def __call__(self, event):
+        topic = event.get("topic") or "unknown"
+        METRICS.inc("ftrack_events_received_total", listener=self.name, topic=topic)
+        self._last_event_at = time.time()
+        entities = event["data"].get("entities", [])
+        if self.dispatch is not None:
+            selected = self.dispatch.select(entities)
+            if not selected:
+                return
+            if len(selected) != len(entities):
+                event = dict(event, data=dict(event["data"], entities=selected))
+            entities = selected
+        seq = self.journal.append(event) if self.journal else None
+        self.add(entities, seq=seq, topic=topic)
+
+    def add(self, entities, seq=None, topic=None):
+        """Queue entities for the next batch; duplicates within the window are dropped."""
+        with self._condition:
+            if seq is not None:
+                self._pending_seqs[seq] = [entity_key(entity) for entity in entities]
+            if topic is not None:
+                self._pending_topics[topic] += 1
+            if self._stalled_since() is None:
+                self._progressed()
+            for entity in entities:
+                self._pending.setdefault(entity_key(entity), entity)
+            if (self._pending or self._pending_seqs) and self._deadline is None:
+                self._deadline = time.monotonic() + self.window
+            self._condition.notify()
+
+    def call_soon(self, task):
+        """Run task() on the worker thread, between batches.
+
+        Lets maintenance work (such as gap recovery) use the handler's session
+        without racing the handler itself.
+        """
+        with self._condition:
+            if self._stalled_since() is None:
+                self._progressed()
+            self._tasks.append(task)
+            self._condition.notify()
+
+    def pending(self):
+        """Number of distinct entities waiting to be dispatched."""
+        with self._condition:
+            return len(self._pending)
+
+    def _stalled_since(self):
+        """When the worker last made progress, while it has work outstanding (None when idle).
+
+        Read without the lock, so it still answers if the worker deadlocked holding it.
+        """
+        if self._busy or self._pending or self._pending_seqs or self._tasks:
+            return self._last_progress
+        return None
+
+    def _progressed(self):
+        self._last_progress = time.time()
+
+    def _last_event_age(self):
+        return time.time() - self._last_event_at if self._last_event_at else -1
+
+    def flush(self):
+        """Dispatch whatever is pending right now, on the calling thread."""
+        batch, seqs, topics = self._take()
+        if batch or seqs:
+            self._dispatch(batch, seqs, topics)
+
+    def replay(self, up_to=None):
+        """Re-dispatch journaled events that were never acknowledged, max_batch events at a time."""
+        if not self.journal:
+            return 0
+        replayed = 0
+        self._progressed()
+        for page in self.journal.pending(up_to=up_to):
+            for i in range(0, len(page), self.max_batch):
+                batch, seqs = {}, {}
+                for seq, event in page[i:i + self.max_batch]:
+                    entities = (event.get("data") or {}).get("entities", [])
+                    seqs[seq] = [entity_key(entity) for entity in entities]
+                    for entity in entities:
+                        batch.setdefault(entity_key(entity), entity)
+                self._dispatch(list(batch.values()), seqs)
+            replayed += len(page)
+        if replayed:
+            self.logger.info("Replayed %d journaled events.", replayed)
+        return replayed
+
+    def stop(self):
+        """Stop the worker thread after dispatching the pending batch."""
+        with self._condition:
+            self._stopped = True
+            self._condition.notify()
+        self._thread.join()
+
+    def _take(self):
+        with self._condition:
+            batch = list(self._pending.values())
+            seqs = self._pending_seqs
+            topics = self._pending_topics
+            self._pending = {}
+            self._pending_seqs = {}
+            self._pending_topics = collections.Counter()
+            self._deadline = None
+            return batch, seqs, topics
+
+    def _run(self):
+        if self._replay_up_to:
+            self.replay(up_to=self._replay_up_to)
+        while True:
+            with self._condition:
+                while not self._stopped and not self._tasks:
+                    if self._deadline is not None:
+                        remaining = self._deadline - time.monotonic()
+                        if remaining <= 0 or len(self._pending) >= self.max_batch:
+                            break
+                        self._condition.wait(remaining)
+                    else:
+                        self._condition.wait()
+                stopped = self._stopped
+                tasks = list(self._tasks)
+                self._tasks.clear()
+                self._busy = bool(tasks)
+            for task in tasks:
+                try:
+                    task()
+                except Exception as e:
+                    self.logger.exception("Task on batcher '%s' failed: %s", self.name, e)
+                finally:
+                    self._progressed()
+            self._busy = False
+            if tasks and not stopped and self._deadline is not None and time.monotonic() < self._deadline:
+                continue
+            self.flush()
+            if stopped:
+                return
+
+    def _dispatch(self, batch, seqs=None, topics=None):
+        seqs = seqs or {}
+        self.logger.debug("Dispatching batch of %d entities.", len(batch))
+        failed, error = (), None
+        self._busy = True
+        try:
+            if batch:
+                event_id = f"seq:{min(seqs)}-{max(seqs)}" if seqs else None
+                with track(self.name, event_id, entities=len(batch)):
+                    result = self.handler(batch)
+                # Only a list of entities reports failures; any other return value means success.
+                if isinstance(result, (list, tuple)):
+                    failed = result
+        except Exception as e:
+            self.logger.exception("Batch handler '%s' failed: %s", self.name, e)
+            failed, error = batch, str(e)
+
+        failed_keys = {entity_key(entity) for entity in failed}
+        if failed_keys and error is None:
+            self.logger.warning("Batch handler '%s' failed on %d of %d entities.", self.name, len(failed_keys), len(batch))
+        if failed_keys:
+            METRICS.inc("ftrack_entities_failed_total", len(failed_keys), listener=self.name)
+        if self.journal and seqs:
+            # Events carrying a failed entity are not acknowledged: they stay journaled and are replayed on restart.
+            retry = [seq for seq, keys in seqs.items() if failed_keys.intersection(keys)]
+            dead = self.journal.fail(retry, error or "handler reported failed entities")
+            if dead:
+                self.logger.error("Dead-lettered %d event(s) after repeated failures: seq %s", len(dead), dead)
+                METRICS.inc("ftrack_events_dead_lettered_total", len(dead), listener=self.name)
+            self.journal.ack(seqs.keys() - set(retry))
+        self._progressed()
+        self._busy = False
+        if error is None:
+            for topic, count in (topics or {"replay": len(seqs)}).items():
+                METRICS.inc("ftrack_events_handled_total", count, listener=self.name, topic=topic)
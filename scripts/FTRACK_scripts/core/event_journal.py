@@ -0,0 +1,199 @@
+"""
+Durable local event journal.
+----------------------------
+Incoming hub events are appended to a per-listener SQLite write-ahead journal
+before they are dispatched, and removed once the handler has acknowledged
+them. Whatever is still in the journal when the process starts again (crash,
+container restart) is replayed through the same handler.
+
+A per-listener checkpoint records the last acknowledged sequence number and
+the time of the last handled event, for recovery and supervision.
+
+Every failed delivery of an event is counted. An event that failed
+FTRACK_JOURNAL_MAX_ATTEMPTS times is moved to the dead_letters table, so a
+poison event is not replayed on every restart; it stays there for
+inspection.
+"""
+
+import json
+import logging
+import sqlite3
+import threading
+import time
+
+from core.config import env_int, state_path
+
+logger = logging.getLogger(__name__)
+
+# Events read per page while replaying a backlog.
+REPLAY_PAGE_SIZE = env_int("FTRACK_JOURNAL_REPLAY_PAGE", 1000)
+# Failed deliveries before an event is dead-lettered.
+MAX_ATTEMPTS = env_int("FTRACK_JOURNAL_MAX_ATTEMPTS", 5)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS events (
+    seq         INTEGER PRIMARY KEY AUTOINCREMENT,
+    topic       TEXT,
+    payload     TEXT NOT NULL,
+    received_at REAL NOT NULL,
+    attempts    INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS dead_letters (
+    seq         INTEGER PRIMARY KEY,
+    topic       TEXT,
+    payload     TEXT NOT NULL,
+    received_at REAL NOT NULL,
+    attempts    INTEGER NOT NULL,
+    error       TEXT,
+    failed_at   REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS checkpoints (
+    listener      TEXT PRIMARY KEY,
+    last_seq      INTEGER NOT NULL,
+    last_event_at REAL,
+    updated_at    REAL NOT NULL
+);
+"""
+
+
+def serialize_event(event):
+    """Reduce an ftrack event to the JSON-serializable fields handlers use."""
+    return json.dumps(
+        {
+            "id": event.get("id"),
+            "topic": event.get("topic"),
+            "source": event.get("source"),
+            "data": event.get("data"),
+        },
+        default=str,
+    )
+
+
+class EventJournal:
+    """Append-only SQLite journal of one listener's un-acknowledged events."""
+
+    def __init__(self, listener, path=None):
+        self.listener = listener
+        self.path = path or state_path(f"journal_{listener}.sqlite3")
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(events)")}
+        if "attempts" not in columns:
+            # Journal written before attempts were counted.
+            self._conn.execute("ALTER TABLE events ADD COLUMN attempts INTEGER NOT NULL DEFAULT 0")
+
+    def append(self, event):
+        """Persist an event before dispatch; returns its sequence number."""
+        payload = serialize_event(event)
+        with self._lock:
+            cursor = self._conn.execute(
+                "INSERT INTO events (topic, payload, received_at) VALUES (?, ?, ?)",
+                (event.get("topic"), payload, time.time()),
+            )
+        return cursor.lastrowid
+
+    def ack(self, seqs, last_event_at=None):
+        """Acknowledge handled events: drop them and move the checkpoint forward."""
+        seqs = list(seqs)
+        if not seqs:
+            return
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN")
+            self._conn.executemany("DELETE FROM events WHERE seq = ?", [(seq,) for seq in seqs])
+            self._conn.execute(
+                "INSERT INTO checkpoints (listener, last_seq, last_event_at, updated_at) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(listener) DO UPDATE SET "
+                "last_seq = MAX(last_seq, excluded.last_seq), "
+                "last_event_at = COALESCE(excluded.last_event_at, last_event_at), "
+                "updated_at = excluded.updated_at",
+                (self.listener, max(seqs), last_event_at or now, now),
+            )
+            self._conn.execute("COMMIT")
+
+    def fail(self, seqs, error=None, max_attempts=MAX_ATTEMPTS):
+        """Count a failed delivery of events, keeping them for replay.
+
+        Events that have now failed max_attempts times are moved to the
+        dead_letters table; returns their sequence numbers.
+        """
+        seqs = [(seq,) for seq in seqs]
+        if not seqs:
+            return []
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN")
+            self._conn.executemany("UPDATE events SET attempts = attempts + 1 WHERE seq = ?", seqs)
+            dead = [
+                seq for seq, in seqs
+                if self._conn.execute(
+                    "SELECT 1 FROM events WHERE seq = ? AND attempts >= ?", (seq, max_attempts)
+                ).fetchone()
+            ]
+            for seq in dead:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO dead_letters "
+                    "SELECT seq, topic, payload, received_at, attempts, ?, ? FROM events WHERE seq = ?",
+                    (error, now, seq),
+                )
+                self._conn.execute("DELETE FROM events WHERE seq = ?", (seq,))
+            self._conn.execute("COMMIT")
+        return dead
+
+    def dead_letter_count(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM dead_letters").fetchone()[0]
+
+    def mark(self, last_event_at):
+        """Move the checkpoint time forward without acknowledging any event (e.g. after a recovery scan)."""
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO checkpoints (listener, last_seq, last_event_at, updated_at) VALUES (?, 0, ?, ?) "
+                "ON CONFLICT(listener) DO UPDATE SET "
+                "last_event_at = MAX(COALESCE(last_event_at, 0), excluded.last_event_at), "
+                "updated_at = excluded.updated_at",
+                (self.listener, last_event_at, now),
+            )
+
+    def checkpoint(self):
+        """Return {'last_seq', 'last_event_at', 'updated_at'} for this listener, or None."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT last_seq, last_event_at, updated_at FROM checkpoints WHERE listener = ?",
+                (self.listener,),
+            ).fetchone()
+        if not row:
+            return None
+        return {"last_seq": row[0], "last_event_at": row[1], "updated_at": row[2]}
+
+    def last_seq(self):
+        """Highest sequence number currently in the journal (0 when empty)."""
+        with self._lock:
+            row = self._conn.execute("SELECT COALESCE(MAX(seq), 0) FROM events").fetchone()
+        return row[0]
+
+    def pending_count(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM events").fetchone()[0]
+
+    def pending(self, up_to=None, page_size=REPLAY_PAGE_SIZE):
+        """Yield pages of (seq, event dict) for un-acknowledged events, oldest first."""
+        after = 0
+        while True:
+            with self._lock:
+                rows = self._conn.execute(
+                    "SELECT seq, payload FROM events WHERE seq > ? AND seq <= ? ORDER BY seq LIMIT ?",
+                    (after, up_to if up_to is not None else 2 ** 62, page_size),
+                ).fetchall()
+            if not rows:
+                return
+            yield [(seq, json.loads(payload)) for seq, payload in rows]
+            after = rows[-1][0]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
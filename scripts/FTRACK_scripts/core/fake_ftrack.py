@@ -0,0 +1,304 @@
+"""
+Offline ftrack stand-in.
+------------------------
+An in-memory Session and event hub implementing the subset of the
+ftrack_api surface the actions use, so handlers can be exercised (and load
+tested) without a live server:
+
+  * query():  "[select a, b.c from] Type [where <cond> [and <cond>]...]"
+              with "is", "is_not", "in (...)", "like", ">", "<" on plain or
+              dotted attributes (parent.id, project.full_name, asset.id ...)
+  * get(), create(), commit(), rollback(), populate(), delete(), types
+  * event_hub.subscribe() / publish() / wait()
+
+Every server round trip goes through call(), which sleeps for the configured
+per-call latency and is counted in session.call_counts.
+"""
+
+import collections
+import re
+import threading
+import time
+import uuid
+
+# Entity types returned by "TypedContext" queries.
+TYPED_CONTEXT_TYPES = {"Folder", "Sequence", "Shot", "Episode", "AssetBuild", "Task", "Milestone", "Scene"}
+
+_QUERY_RE = re.compile(
+    r"^\s*(?:select\s+(?P<select>.+?)\s+from\s+)?(?P<type>\w+)(?:\s+where\s+(?P<where>.+?))?"
+    r"(?:\s+order\s+by\s+.+)?(?:\s+limit\s+\d+)?\s*$",
+    re.IGNORECASE | re.DOTALL,
+)
+_CONDITION_RE = re.compile(
+    r'^\s*(?P<path>[\w.]+)\s+(?P<op>is_not|is|in|like|>=|<=|>|<)\s+(?P<value>.+?)\s*$', re.IGNORECASE
+)
+_AND_RE = re.compile(r'\s+and\s+(?=(?:[^"]*"[^"]*")*[^"]*$)', re.IGNORECASE)
+
+
+class FakeEntity(dict):
+    """Dict-backed entity with the ftrack entity conveniences the actions rely on."""
+
+    def __init__(self, session, entity_type, data):
+        super().__init__(data)
+        self.session = session
+        self.entity_type = entity_type
+        self.setdefault("id", str(uuid.uuid4()))
+        self.setdefault("custom_attributes", {})
+        self.setdefault("metadata", {})
+
+    def __setitem__(self, key, value):
+        dict.__setitem__(self, key, value)
+        # Updates to persisted entities are sent with the next commit.
+        session = getattr(self, "session", None)
+        if session is not None:
+            session._dirty = True
+
+    def __getitem__(self, key):
+        if dict.__contains__(self, key):
+            return dict.__getitem__(self, key)
+        return self._derived(key)
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def _derived(self, key):
+        if key == "project":
+            if self.entity_type == "Project":
+                return self
+            for via in ("parent", "asset"):
+                related = dict.get(self, via)
+                if isinstance(related, FakeEntity):
+                    return related["project"]
+            raise KeyError(key)
+        if key == "children":
+            return [e for e in self.session._all("TypedContext") if e.get("parent") is self]
+        if key.endswith("_id"):
+            related = self.get(key[:-3])
+            return related["id"] if isinstance(related, FakeEntity) else None
+        raise KeyError(key)
+
+    def resolve(self, path):
+        value = self
+        for part in path.split("."):
+            if not isinstance(value, FakeEntity):
+                return None
+            value = value.get(part)
+        return value
+
+    def __hash__(self):
+        return hash(self["id"])
+
+    def __eq__(self, other):
+        return self is other
+
+    def __repr__(self):
+        return f"<{self.entity_type}({dict.get(self, 'name', self['id'])})>"
+
+
+class FakeQueryResult:
+    def __init__(self, session, expression):
+        self.session = session
+        self.expression = expression
+        self._results = None
+
+    def _fetch(self):
+        if self._results is None:
+            self._results = self.session.call([{"action": "query", "expression": self.expression}])[0]
+        return self._results
+
+    def first(self):
+        results = self._fetch()
+        return results[0] if results else None
+
+    def one(self):
+        results = self._fetch()
+        if len(results) != 1:
+            raise ValueError(f"Expected exactly one result, got {len(results)} for: {self.expression}")
+        return results[0]
+
+    def all(self):
+        return list(self._fetch())
+
+    def __iter__(self):
+        return iter(self._fetch())
+
+    def __len__(self):
+        return len(self._fetch())
+
+
+class FakeEventHub:
+    """Synchronous in-process hub: publish() calls matching subscribers directly."""
+
+    def __init__(self):
+        self._subscribers = []
+        self._lock = threading.Lock()
+        self.published = 0
+
+    def subscribe(self, subscription, callback, **kwargs):
+        conditions = {}
+        for part in _AND_RE.split(subscription):
+            key, _, value = part.partition("=")
+            conditions[key.strip()] = value.strip()
+        with self._lock:
+            self._subscribers.append((conditions, callback))
+        return len(self._subscribers)
+
+    @staticmethod
+    def _matches(conditions, event):
+        for key, expected in conditions.items():
+            value = event
+            for part in key.split("."):
+                value = value.get(part) if isinstance(value, dict) else None
+            if value != expected:
+                return False
+        return True
+
+    def publish(self, event):
+        """Deliver event to every matching subscriber; returns their replies."""
+        event.setdefault("id", str(uuid.uuid4()))
+        event.setdefault("data", {})
+        self.published += 1
+        with self._lock:
+            subscribers = list(self._subscribers)
+        return [callback(event) for conditions, callback in subscribers if self._matches(conditions, event)]
+
+    def wait(self, duration=None):
+        time.sleep(duration or 0)
+
+
+class FakeSession:
+    """In-memory stand-in for ftrack_api.Session."""
+
+    def __init__(self, server_url="https://fake.ftrackapp.com", latency=0.0, commit_latency=None):
+        self.server_url = server_url
+        self.latency = latency
+        self.commit_latency = latency if commit_latency is None else commit_latency
+        self.event_hub = FakeEventHub()
+        self.call_counts = collections.Counter()
+        self.types = collections.defaultdict(lambda: {"recipients": None})
+        self._store = collections.defaultdict(dict)
+        self._pending = []
+        self._dirty = False
+        self._lock = threading.RLock()
+
+    # --- Seeding ---
+    def add(self, entity_type, data):
+        """Create and immediately persist an entity (test fixture helper)."""
+        entity = FakeEntity(self, entity_type, data)
+        with self._lock:
+            self._store[entity_type][entity["id"]] = entity
+        return entity
+
+    # --- Server round trips ---
+    def call(self, data):
+        results = []
+        for operation in data:
+            action = operation["action"]
+            self.call_counts[action] += 1
+            time.sleep(self.commit_latency if action == "commit" else self.latency)
+            if action == "query":
+                results.append(self._execute(operation["expression"]))
+            elif action == "commit":
+                with self._lock:
+                    for entity in self._pending:
+                        self._store[entity.entity_type][entity["id"]] = entity
+                    results.append(len(self._pending))
+                    self._pending = []
+                    self._dirty = False
+            else:
+                results.append(None)
+        return results
+
+    def query(self, expression, page_size=None):
+        return FakeQueryResult(self, expression)
+
+    def get(self, entity_type, entity_id):
+        with self._lock:
+            for entity in self._pending:
+                if entity["id"] == entity_id and self._is_a(entity, entity_type):
+                    return entity
+        return self.query(f'{entity_type} where id is "{entity_id}"').first()
+
+    def create(self, entity_type, data=None):
+        entity = FakeEntity(self, entity_type, dict(data or {}))
+        with self._lock:
+            self._pending.append(entity)
+        return entity
+
+    def commit(self):
+        if self._pending or self._dirty:
+            self.call([{"action": "commit"}])
+
+    def rollback(self):
+        with self._lock:
+            self._pending = []
+            self._dirty = False
+
+    def populate(self, entities, projections):
+        self.call([{"action": "populate"}])
+
+    def delete(self, entity):
+        with self._lock:
+            self._store[entity.entity_type].pop(entity["id"], None)
+
+    def reset(self):
+        self.rollback()
+
+    def close(self):
+        pass
+
+    # --- Query engine ---
+    @staticmethod
+    def _is_a(entity, entity_type):
+        if entity_type == "TypedContext":
+            return entity.entity_type in TYPED_CONTEXT_TYPES
+        return entity.entity_type == entity_type
+
+    def _all(self, entity_type):
+        with self._lock:
+            if entity_type == "TypedContext":
+                return [e for t in TYPED_CONTEXT_TYPES for e in self._store[t].values()]
+            return list(self._store[entity_type].values())
+
+    def _execute(self, expression):
+        match = _QUERY_RE.match(expression)
+        if not match:
+            raise ValueError(f"Unsupported query: {expression}")
+        results = self._all(match.group("type"))
+        if match.group("where"):
+            for condition in _AND_RE.split(match.group("where")):
+                results = [e for e in results if self._test(e, condition)]
+        return results
+
+    @staticmethod
+    def _literal(text):
+        text = text.strip()
+        if text.startswith("(") and text.endswith(")"):
+            return [FakeSession._literal(part) for part in re.findall(r'"(?:[^"\\]|\\.)*"|[^,\s]+', text[1:-1])]
+        if text.startswith('"') and text.endswith('"'):
+            return text[1:-1].replace('\\"', '"')
+        return text
+
+    def _test(self, entity, condition):
+        match = _CONDITION_RE.match(condition)
+        if not match:
+            raise ValueError(f"Unsupported condition: {condition}")
+        value = entity.resolve(match.group("path"))
+        op = match.group("op").lower()
+        expected = self._literal(match.group("value"))
+        if op == "is":
+            return str(value) == expected if value is not None else expected in ("None", "null")
+        if op == "is_not":
+            return str(value) != expected
+        if op == "in":
+            return str(value) in expected
+        if op == "like":
+            pattern = "^" + re.escape(expected).replace("%", ".*") + "$"
+            return value is not None and re.match(pattern, str(value), re.IGNORECASE) is not None
+        if value is None:
+            return False
+        value = value.isoformat() if hasattr(value, "isoformat") else str(value)
+        return {">": value > expected, "<": value < expected, ">=": value >= expected, "<=": value <= expected}[op]
@@ -0,0 +1,90 @@
+"""
+Persistent PBV ↔ UNDARK id mapping store.
+-----------------------------------------
+A small SQLite table of (source server, source id) → (target server, target id),
+written every time the sync creates or matches an entity on the other side.
+
+It answers three questions locally instead of over the API:
+  * "Which entity on the target corresponds to this one?" (target lookups)
+  * "Has this entity already been synced?" (idempotency)
+  * "Did the sync itself create this entity?" (echo-loop suppression)
+"""
+
+import logging
+import sqlite3
+import threading
+import time
+
+from core.config import state_path
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_DB_NAME = "sync_id_map.sqlite3"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS id_map (
+    entity_type   TEXT NOT NULL,
+    source_server TEXT NOT NULL,
+    source_id     TEXT NOT NULL,
+    target_server TEXT NOT NULL,
+    target_id     TEXT NOT NULL,
+    created_at    REAL NOT NULL,
+    PRIMARY KEY (source_server, source_id, target_server)
+);
+CREATE UNIQUE INDEX IF NOT EXISTS id_map_target
+    ON id_map (target_server, target_id, source_server);
+"""
+
+
+class SyncIdMap:
+    """Thread-safe SQLite-backed mapping of entity ids between ftrack servers."""
+
+    def __init__(self, path=None):
+        self.path = path or state_path(DEFAULT_DB_NAME)
+        self._lock = threading.Lock()
+        # The sync runs one hub thread per server, so the connection is shared
+        # across threads and serialised by the lock above.
+        self._conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+        logger.info("Sync id map opened at %s", self.path)
+
+    def record(self, entity_type, source_server, source_id, target_server, target_id):
+        """Store that source_id on source_server was mirrored as target_id on target_server."""
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO id_map VALUES (?, ?, ?, ?, ?, ?)",
+                (entity_type, source_server, source_id, target_server, target_id, time.time()),
+            )
+        logger.debug(
+            "[ID MAP] %s %s:%s → %s:%s", entity_type, source_server, source_id, target_server, target_id
+        )
+
+    def counterpart(self, server, entity_id, other_server):
+        """Return the id of the entity on other_server that mirrors entity_id on server, or None.
+
+        Works in both directions: it does not matter which side was the original.
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT target_id FROM id_map WHERE source_server = ? AND source_id = ? AND target_server = ? "
+                "UNION ALL "
+                "SELECT source_id FROM id_map WHERE target_server = ? AND target_id = ? AND source_server = ? "
+                "LIMIT 1",
+                (server, entity_id, other_server, server, entity_id, other_server),
+            ).fetchone()
+        return row[0] if row else None
+
+    def is_mirror(self, server, entity_id):
+        """True if entity_id on server was created by the sync (i.e. it is a copy, not an original)."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT 1 FROM id_map WHERE target_server = ? AND target_id = ? LIMIT 1",
+                (server, entity_id),
+            ).fetchone()
+        return row is not None
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
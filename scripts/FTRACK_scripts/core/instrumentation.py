@@ -0,0 +1,154 @@
+"""
+Per-handler query/commit instrumentation.
+-----------------------------------------
+instrument_session() wraps Session.query, get, populate, create and commit
+(plus Session.call, where the actual server round trips happen) and
+attributes counts and latencies to the handler currently running on that
+thread, as declared with the track() context manager.
+
+When a tracked block ends, one cost line is logged, e.g.
+    [COST] shot_creation event=3f2a… entities=200 query=4 get=0 populate=0 create=600 commit=1 calls=5 server_ms=812 total_ms=905
+and the duration is added to the handler's rolling histogram in STATS, which
+the metrics endpoint exports.
+"""
+
+import collections
+import contextlib
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+INSTRUMENTED_METHODS = ("query", "get", "populate", "create", "commit")
+
+# Histogram bucket upper bounds in milliseconds (Prometheus style, cumulative on export).
+LATENCY_BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000, float("inf"))
+# Samples kept per handler for rolling percentiles.
+ROLLING_WINDOW = 1000
+
+_active = threading.local()
+
+
+class HandlerStats:
+    """Cumulative counters plus a rolling latency window for one handler."""
+
+    def __init__(self):
+        self.invocations = 0
+        self.errors = 0
+        self.calls = collections.Counter()
+        self.server_ms = 0.0
+        self.total_ms = 0.0
+        self.bucket_counts = [0] * len(LATENCY_BUCKETS_MS)
+        self.recent_ms = collections.deque(maxlen=ROLLING_WINDOW)
+
+    def observe(self, cost, duration_ms, failed):
+        self.invocations += 1
+        self.errors += int(failed)
+        self.calls.update(cost.calls)
+        self.server_ms += cost.server_ms
+        self.total_ms += duration_ms
+        self.recent_ms.append(duration_ms)
+        for index, bound in enumerate(LATENCY_BUCKETS_MS):
+            if duration_ms <= bound:
+                self.bucket_counts[index] += 1
+                break
+
+    def percentile(self, fraction):
+        if not self.recent_ms:
+            return 0.0
+        ordered = sorted(self.recent_ms)
+        return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+class StatsRegistry:
+    """Thread-safe handler name -> HandlerStats registry."""
+
+    def __init__(self):
+        self._stats = collections.defaultdict(HandlerStats)
+        self._lock = threading.Lock()
+
+    def observe(self, handler, cost, duration_ms, failed=False):
+        with self._lock:
+            self._stats[handler].observe(cost, duration_ms, failed)
+
+    def snapshot(self):
+        """Return {handler: HandlerStats} copies safe to read without the lock."""
+        with self._lock:
+            copies = {}
+            for name, stats in self._stats.items():
+                copy = HandlerStats()
+                copy.__dict__.update({
+                    key: (value.copy() if hasattr(value, "copy") else value)
+                    for key, value in stats.__dict__.items()
+                })
+                copies[name] = copy
+            return copies
+
+
+STATS = StatsRegistry()
+
+
+class _Cost:
+    def __init__(self, handler, event_id):
+        self.handler = handler
+        self.event_id = event_id
+        self.calls = collections.Counter()
+        self.server_ms = 0.0
+
+
+@contextlib.contextmanager
+def track(handler, event_id=None, **fields):
+    """Attribute all instrumented session calls on this thread to handler until the block exits."""
+    parent = getattr(_active, "cost", None)
+    cost = _Cost(handler, event_id)
+    _active.cost = cost
+    started = time.perf_counter()
+    failed = False
+    try:
+        yield cost
+    except BaseException:
+        failed = True
+        raise
+    finally:
+        duration_ms = (time.perf_counter() - started) * 1000
+        _active.cost = parent
+        if parent is not None:
+            parent.calls.update(cost.calls)
+            parent.server_ms += cost.server_ms
+        STATS.observe(handler, cost, duration_ms, failed)
+        extra = "".join(f" {key}={value}" for key, value in fields.items())
+        counts = " ".join(f"{name}={cost.calls[name]}" for name in INSTRUMENTED_METHODS + ("call",))
+        logger.info(
+            "[COST] %s event=%s%s %s server_ms=%.0f total_ms=%.0f%s",
+            handler, event_id or "-", extra, counts, cost.server_ms, duration_ms, " FAILED" if failed else "",
+        )
+
+
+def _wrap(session, name):
+    original = getattr(session, name)
+
+    def instrumented(*args, **kwargs):
+        cost = getattr(_active, "cost", None)
+        if cost is None:
+            return original(*args, **kwargs)
+        cost.calls[name] += 1
+        if name != "call":
+            return original(*args, **kwargs)
+        started = time.perf_counter()
+        try:
+            return original(*args, **kwargs)
+        finally:
+            cost.server_ms += (time.perf_counter() - started) * 1000
+
+    setattr(session, name, instrumented)
+
+
+def instrument_session(session):
+    """Install the counting wrappers on a session (idempotent)."""
+    if getattr(session, "_instrumented", False):
+        return session
+    for name in INSTRUMENTED_METHODS + ("call",):
+        _wrap(session, name)
+    session._instrumented = True
+    return session
@@ -0,0 +1,128 @@
+"""
+Non-blocking logging pipeline for the ftrack listeners.
+-------------------------------------------------------
+configure_logging() routes every log record through a queue: the hub and
+handler threads only enqueue the record, and a single QueueListener thread
+formats it and writes it to stdout and to a size-rotated log file. Records
+are not formatted on the calling thread at all, so a lazily formatted DEBUG
+line that ends up filtered costs almost nothing.
+
+Environment:
+    FTRACK_LOG_LEVEL=INFO                           root level
+    FTRACK_LOG_LEVELS="undark_pbv_sync=DEBUG,core.event_batcher=WARNING"
+    FTRACK_LOG_DEBUG_SAMPLE=20                      keep 1 in N DEBUG lines per message template
+    FTRACK_LOG_MAX_BYTES=10485760                   rotate the log file at this size
+    FTRACK_LOG_BACKUPS=5                            rotated files to keep
+"""
+
+import atexit
+import collections
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import threading
+
+from core.config import env_int, state_path
+
+LOG_FORMAT = "%(asctime)s [%(levelname)s] %(processName)s %(name)s: %(message)s"
+LOG_DIR_NAME = "logs"
+
+_listener = None
+_listener_pid = None
+
+
+class _DeferredQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that leaves formatting to the listener thread."""
+
+    def prepare(self, record):
+        return record
+
+
+class DebugSampler(logging.Filter):
+    """Lets through the first and then every Nth DEBUG record of each message template.
+
+    Counts are kept for the ``max_templates`` most recently logged templates
+    only: f-string messages make every line a template of its own.
+    """
+
+    def __init__(self, every, max_templates=1024):
+        super().__init__()
+        self.every = max(1, every)
+        self.max_templates = max_templates
+        self._seen = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        if record.levelno > logging.DEBUG or self.every == 1:
+            return True
+        key = (record.name, record.msg)
+        with self._lock:
+            count = self._seen.pop(key, 0) + 1
+            self._seen[key] = count
+            if len(self._seen) > self.max_templates:
+                self._seen.popitem(last=False)
+        return count % self.every == 1
+
+
+def _parse_levels(value):
+    levels = {}
+    for item in (value or "").split(","):
+        name, _, level = item.strip().partition("=")
+        if name and level:
+            levels[name.strip()] = level.strip().upper()
+    return levels
+
+
+def configure_logging(process_name="run_actions"):
+    """Install the queue-based pipeline on the root logger (once per process).
+
+    Each process writes its own rotating file, since rotation is not safe
+    across processes.
+    """
+    global _listener, _listener_pid
+    # A forked child inherits the parent's handlers but not its listener thread.
+    if _listener is not None and _listener_pid == os.getpid():
+        return
+
+    formatter = logging.Formatter(LOG_FORMAT)
+    stream_handler = logging.StreamHandler(sys.stdout)
+    stream_handler.setFormatter(formatter)
+
+    log_dir = state_path(LOG_DIR_NAME)
+    os.makedirs(log_dir, exist_ok=True)
+    file_handler = logging.handlers.RotatingFileHandler(
+        os.path.join(log_dir, f"{process_name.lower().replace(' ', '_')}.log"),
+        maxBytes=env_int("FTRACK_LOG_MAX_BYTES", 10 * 1024 * 1024),
+        backupCount=env_int("FTRACK_LOG_BACKUPS", 5),
+        encoding="utf-8",
+    )
+    file_handler.setFormatter(formatter)
+
+    log_queue = queue.SimpleQueue()
+    queue_handler = _DeferredQueueHandler(log_queue)
+    queue_handler.addFilter(DebugSampler(env_int("FTRACK_LOG_DEBUG_SAMPLE", 20)))
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(os.getenv("FTRACK_LOG_LEVEL", "INFO").upper())
+    for name, level in _parse_levels(os.getenv("FTRACK_LOG_LEVELS")).items():
+        logging.getLogger(name).setLevel(level)
+
+    _listener = logging.handlers.QueueListener(
+        log_queue, stream_handler, file_handler, respect_handler_level=True
+    )
+    _listener.start()
+    _listener_pid = os.getpid()
+    atexit.register(shutdown_logging)
+
+
+def shutdown_logging():
+    """Flush queued records and stop the listener thread."""
+    global _listener
+    if _listener is not None and _listener_pid == os.getpid():
+        _listener.stop()
+        _listener = None
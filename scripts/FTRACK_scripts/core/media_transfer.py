@@ -0,0 +1,317 @@
+"""
+Streaming component transfer between ftrack servers.
+----------------------------------------------------
+Copies the files behind a mirrored AssetVersion's components from a
+location on the source server to a location on the target server:
+
+  * Files are streamed in FTRACK_TRANSFER_CHUNK_SIZE chunks through a
+    staging file in the state directory; nothing is read into memory whole.
+  * At most FTRACK_TRANSFER_CONCURRENCY transfers run at once.
+  * Interrupted transfers resume: the staging file keeps what was already
+    downloaded, and disk stores append to a partial upload.
+  * Files are deduplicated by SHA-256. A content index remembers the hash
+    of every transferred component and where each hash lives on each
+    server, so content already present on a disk store of the target is
+    registered for the new component instead of being sent again.
+
+Stores wrap where the bytes live: LocationStore for a real ftrack location,
+LocalDiskStore for a plain directory standing in for one (offline runs and
+the replay load test).
+"""
+
+import contextlib
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from core.config import env_int, state_path
+
+logger = logging.getLogger(__name__)
+
+TRANSFER_CHUNK_SIZE = env_int("FTRACK_TRANSFER_CHUNK_SIZE", 8 * 1024 * 1024)
+TRANSFER_CONCURRENCY = env_int("FTRACK_TRANSFER_CONCURRENCY", 4)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS component_hashes (
+    server       TEXT NOT NULL,
+    component_id TEXT NOT NULL,
+    sha256       TEXT NOT NULL,
+    size         INTEGER NOT NULL,
+    PRIMARY KEY (server, component_id)
+);
+CREATE TABLE IF NOT EXISTS content (
+    server              TEXT NOT NULL,
+    sha256              TEXT NOT NULL,
+    resource_identifier TEXT NOT NULL,
+    created_at          REAL NOT NULL,
+    PRIMARY KEY (server, sha256)
+);
+"""
+
+
+class ContentIndex:
+    """SQLite index of component content hashes and where each hash is stored per server."""
+
+    def __init__(self, path=None):
+        self.path = path or state_path("media_index.sqlite3")
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+
+    def hash_of(self, server, component_id):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT sha256 FROM component_hashes WHERE server = ? AND component_id = ?", (server, component_id)
+            ).fetchone()
+        return row[0] if row else None
+
+    def locate(self, server, sha256):
+        """Resource identifier of content with this hash on server, or None."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT resource_identifier FROM content WHERE server = ? AND sha256 = ?", (server, sha256)
+            ).fetchone()
+        return row[0] if row else None
+
+    def record_hash(self, server, component_id, sha256, size):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO component_hashes VALUES (?, ?, ?, ?)", (server, component_id, sha256, size)
+            )
+
+    def record_content(self, server, sha256, resource_identifier):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO content VALUES (?, ?, ?, ?)", (server, sha256, resource_identifier, time.time())
+            )
+
+    def forget_content(self, server, sha256):
+        with self._lock:
+            self._conn.execute("DELETE FROM content WHERE server = ? AND sha256 = ?", (server, sha256))
+
+
+class LocalDiskStore:
+    """A directory standing in for an ftrack location.
+
+    Resource identifiers are paths relative to the root; components are
+    stored as "<component id><file type>". Uploads are written to a ".part"
+    file first, so an interrupted upload resumes where it stopped. Content
+    already in the directory can be reused by another component.
+    """
+
+    def __init__(self, root):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+
+    def path(self, resource_identifier):
+        return os.path.join(self.root, resource_identifier)
+
+    def resource_identifier(self, component):
+        return component.get("resource_identifier") or self.new_resource_identifier(component)
+
+    def new_resource_identifier(self, component):
+        return f"{component['id']}{component.get('file_type') or ''}"
+
+    def open_read(self, resource_identifier):
+        return open(self.path(resource_identifier), "rb")
+
+    def put(self, staged, component, chunk_size):
+        """Write the staged file as component's data, resuming a partial upload; returns its resource identifier."""
+        resource_identifier = self.new_resource_identifier(component)
+        path = self.path(resource_identifier)
+        partial = path + ".part"
+        os.makedirs(os.path.dirname(partial), exist_ok=True)
+        offset = os.path.getsize(partial) if os.path.exists(partial) else 0
+        if offset:
+            logger.info("[MEDIA] Resuming upload of %s at %d bytes.", resource_identifier, offset)
+        with open(staged, "rb") as reader, open(partial, "r+b" if offset else "wb") as writer:
+            reader.seek(offset)
+            writer.seek(offset)
+            writer.truncate()
+            for chunk in iter(lambda: reader.read(chunk_size), b""):
+                writer.write(chunk)
+        os.replace(partial, path)
+        self.register(component, resource_identifier)
+        return resource_identifier
+
+    def reuse(self, component, resource_identifier):
+        """Point component at content already stored here; False if that content is gone."""
+        if not os.path.exists(self.path(resource_identifier)):
+            return False
+        self.register(component, resource_identifier)
+        return True
+
+    def register(self, component, resource_identifier):
+        """Nothing to register for a plain directory."""
+
+
+class LocationStore(LocalDiskStore):
+    """A location on an ftrack server.
+
+    ``session`` should be a session of its own (transfers run on their own
+    threads); it is serialised by its lock if it is a LockedSession.
+
+    Disk locations (accessor with get_filesystem_path) are read and written
+    directly on the file system, like LocalDiskStore, and support resumed
+    uploads and content reuse. Managed locations such as ftrack.server go
+    through ftrack_api: the staged file is added from the origin location
+    with location.add_component(), which uploads and registers it in one go.
+    Such uploads restart from the staged file, and content is never shared
+    between components there, since the server stores data per component.
+    """
+
+    def __init__(self, session, location_name="ftrack.server"):
+        # Imported here so offline runs with LocalDiskStore need no ftrack_api.
+        import ftrack_api
+
+        self.session = session
+        self.lock = getattr(session, "lock", None) or threading.RLock()
+        self.location = session.query(f'Location where name is "{location_name}"').one()
+        self.origin = session.get("Location", ftrack_api.symbol.ORIGIN_LOCATION_ID)
+        self.accessor = self.location.accessor
+        self.disk = hasattr(self.accessor, "get_filesystem_path")
+        self.root = getattr(self.accessor, "prefix", None)
+
+    def path(self, resource_identifier):
+        return self.accessor.get_filesystem_path(resource_identifier)
+
+    def resource_identifier(self, component):
+        with self.lock:
+            component_location = self.session.query(
+                f'select resource_identifier from ComponentLocation where component_id is "{component["id"]}" '
+                f'and location_id is "{self.location["id"]}"'
+            ).first()
+        if not component_location:
+            raise LookupError(f"Component {component['id']} is not in location {self.location['name']}.")
+        return component_location["resource_identifier"]
+
+    def new_resource_identifier(self, component):
+        with self.lock:
+            return self.location.structure.get_resource_identifier(self._own(component))
+
+    def open_read(self, resource_identifier):
+        if self.disk:
+            return open(self.path(resource_identifier), "rb")
+        # ftrack Data objects have close() but are no context managers.
+        with self.lock:
+            return contextlib.closing(self.accessor.open(resource_identifier, "rb"))
+
+    def put(self, staged, component, chunk_size):
+        if self.disk:
+            return super().put(staged, component, chunk_size)
+        with self.lock:
+            component = self._own(component)
+            self.origin.add_component(component, staged, recursive=False)
+            self.location.add_component(component, self.origin, recursive=False)
+        return self.resource_identifier(component)
+
+    def reuse(self, component, resource_identifier):
+        return self.disk and super().reuse(component, resource_identifier)
+
+    def register(self, component, resource_identifier):
+        """Record that component's data is in this location without moving any bytes."""
+        with self.lock:
+            self.session.create("ComponentLocation", {
+                "component_id": component["id"],
+                "location_id": self.location["id"],
+                "resource_identifier": resource_identifier,
+            })
+            self.session.commit()
+
+    def _own(self, component):
+        """The component as an entity of this store's session."""
+        return self.session.get("Component", component["id"])
+
+
+class MediaTransfer:
+    """Transfers component data between the stores of named servers."""
+
+    def __init__(self, stores, index=None, staging_dir=None,
+                 concurrency=TRANSFER_CONCURRENCY, chunk_size=TRANSFER_CHUNK_SIZE):
+        self.stores = stores
+        self.index = index or ContentIndex()
+        self.staging_dir = staging_dir or state_path("transfers")
+        os.makedirs(self.staging_dir, exist_ok=True)
+        self.chunk_size = chunk_size
+        self._executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="media-transfer")
+
+    def submit(self, source_name, target_name, source_component, target_component):
+        """Queue a transfer; returns a Future resolving to "deduplicated" or "transferred"."""
+        future = self._executor.submit(self.transfer, source_name, target_name, source_component, target_component)
+        future.add_done_callback(self._log_failure)
+        return future
+
+    @staticmethod
+    def _log_failure(future):
+        error = future.exception()
+        if error:
+            logger.error("[MEDIA] Transfer failed: %s", error, exc_info=error)
+
+    def transfer(self, source_name, target_name, source_component, target_component):
+        source, target = self.stores[source_name], self.stores[target_name]
+        component_id = source_component["id"]
+
+        # Content hashed on an earlier transfer can be deduplicated without downloading it again.
+        digest = self.index.hash_of(source_name, component_id)
+        if digest and self._reuse(target_name, target, digest, target_component):
+            return "deduplicated"
+
+        started = time.monotonic()
+        staged, digest, size = self._stage(source_name, source, source_component, target_name)
+        self.index.record_hash(source_name, component_id, digest, size)
+        if self._reuse(target_name, target, digest, target_component):
+            os.remove(staged)
+            return "deduplicated"
+
+        resource_identifier = target.put(staged, target_component, self.chunk_size)
+        self.index.record_content(target_name, digest, resource_identifier)
+        self.index.record_hash(target_name, target_component["id"], digest, size)
+        os.remove(staged)
+        logger.info(
+            "[MEDIA] %s → %s: %s (%d bytes) in %.1fs",
+            source_name, target_name, source_component.get("name"), size, time.monotonic() - started,
+        )
+        return "transferred"
+
+    def _reuse(self, target_name, target, digest, target_component):
+        resource_identifier = self.index.locate(target_name, digest)
+        if not resource_identifier:
+            return False
+        if not target.reuse(target_component, resource_identifier):
+            logger.debug("[MEDIA] Indexed content %s is gone from %s.", digest[:12], target_name)
+            self.index.forget_content(target_name, digest)
+            return False
+        self.index.record_hash(target_name, target_component["id"], digest, 0)
+        logger.info("[MEDIA] %s already on %s; registered without upload.", target_component.get("name"), target_name)
+        return True
+
+    def _stage(self, source_name, source, component, target_name):
+        """Stream the source file into the staging directory, resuming a partial download."""
+        # Per target, so concurrent transfers of one component to several servers never share a file.
+        path = os.path.join(self.staging_dir, f"{source_name}_{component['id']}_{target_name}.part")
+        hasher = hashlib.sha256()
+        offset = 0
+        if os.path.exists(path):
+            with open(path, "rb") as staged:
+                for chunk in iter(lambda: staged.read(self.chunk_size), b""):
+                    hasher.update(chunk)
+                    offset += len(chunk)
+            logger.info("[MEDIA] Resuming download of %s at %d bytes.", component.get("name"), offset)
+
+        with source.open_read(source.resource_identifier(component)) as reader, open(path, "ab") as staged:
+            if offset:
+                reader.seek(offset)
+            for chunk in iter(lambda: reader.read(self.chunk_size), b""):
+                staged.write(chunk)
+                hasher.update(chunk)
+                offset += len(chunk)
+        return path, hasher.hexdigest(), offset
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait=wait)
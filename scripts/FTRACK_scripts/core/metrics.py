@@ -0,0 +1,278 @@
+"""
+Metrics and health endpoint for the action server.
+--------------------------------------------------
+Every process keeps its counters and gauges in the METRICS registry. Listener
+processes publish a snapshot of it (which doubles as a heartbeat) to the
+state directory every few seconds, together with the time since which their
+worker loops (event batchers) have been stuck on unfinished work, if any; the main run_actions process serves the
+merged view over HTTP:
+
+    GET /metrics   Prometheus text format
+    GET /healthz   liveness: the server process is up
+    GET /readyz    readiness: every expected listener sent a heartbeat recently
+                   and none of them is stuck on unfinished work
+
+Exported series include events received/handled per topic, batch queue
+depth, journal backlog, handler latency histograms and ftrack call counts
+(from core.instrumentation), listener restarts and last-event age.
+"""
+
+import glob
+import json
+import logging
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from core.config import env_float, env_int, state_path
+from core.instrumentation import LATENCY_BUCKETS_MS, STATS
+
+logger = logging.getLogger(__name__)
+
+METRICS_PORT = env_int("FTRACK_METRICS_PORT", 8000)
+PUBLISH_INTERVAL = env_float("FTRACK_METRICS_INTERVAL", 5)
+# A listener whose last heartbeat is older than this is reported as not ready.
+HEARTBEAT_TIMEOUT = env_float("FTRACK_HEARTBEAT_TIMEOUT", 30)
+# A listener whose worker loop sat on unfinished work for this long is hung.
+PROGRESS_TIMEOUT = env_float("FTRACK_PROGRESS_TIMEOUT", 300)
+
+METRICS_DIR_NAME = "metrics"
+
+
+def _label_key(labels):
+    return tuple(sorted(labels.items()))
+
+
+class MetricsRegistry:
+    """Thread-safe counters, gauges and gauge callbacks of one process."""
+
+    def __init__(self):
+        self._counters = {}
+        self._gauges = {}
+        self._gauge_functions = {}
+        self._progress_functions = {}
+        self._types = {}
+        self._lock = threading.Lock()
+
+    def inc(self, name, value=1, **labels):
+        with self._lock:
+            key = (name, _label_key(labels))
+            self._counters[key] = self._counters.get(key, 0) + value
+            self._types[name] = "counter"
+
+    def set_gauge(self, name, value, **labels):
+        with self._lock:
+            self._gauges[(name, _label_key(labels))] = value
+            self._types[name] = "gauge"
+
+    def register_gauge(self, name, function, **labels):
+        """Gauge whose value is computed by function() at collection time."""
+        with self._lock:
+            self._gauge_functions[(name, _label_key(labels))] = function
+            self._types[name] = "gauge"
+
+    def register_progress(self, name, function):
+        """Worker loop whose function() returns when it last made progress on outstanding work, or None when idle."""
+        with self._lock:
+            self._progress_functions[name] = function
+
+    def stalled_since(self):
+        """Earliest time since which a registered worker loop has had work outstanding without progress, or None."""
+        with self._lock:
+            functions = list(self._progress_functions.values())
+        times = []
+        for function in functions:
+            try:
+                times.append(function())
+            except Exception as e:
+                logger.debug("Progress function failed: %s", e)
+        return min((t for t in times if t is not None), default=None)
+
+    def samples(self):
+        """Return [(name, type, labels dict, value)] for this process, including handler stats."""
+        with self._lock:
+            samples = [(n, "counter", dict(l), v) for (n, l), v in self._counters.items()]
+            samples += [(n, "gauge", dict(l), v) for (n, l), v in self._gauges.items()]
+            functions = list(self._gauge_functions.items())
+        for (name, labels), function in functions:
+            try:
+                samples.append((name, "gauge", dict(labels), float(function())))
+            except Exception as e:
+                logger.debug("Gauge %s failed: %s", name, e)
+
+        for handler, stats in STATS.snapshot().items():
+            cumulative = 0
+            for bound, count in zip(LATENCY_BUCKETS_MS, stats.bucket_counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else str(bound / 1000)
+                samples.append(("ftrack_handler_latency_seconds_bucket", "histogram", {"handler": handler, "le": le}, cumulative))
+            samples.append(("ftrack_handler_latency_seconds_sum", "histogram", {"handler": handler}, stats.total_ms / 1000))
+            samples.append(("ftrack_handler_latency_seconds_count", "histogram", {"handler": handler}, stats.invocations))
+            samples.append(("ftrack_handler_errors_total", "counter", {"handler": handler}, stats.errors))
+            for method, count in stats.calls.items():
+                samples.append(("ftrack_session_calls_total", "counter", {"handler": handler, "method": method}, count))
+            samples.append(("ftrack_server_seconds_total", "counter", {"handler": handler}, stats.server_ms / 1000))
+        return samples
+
+
+METRICS = MetricsRegistry()
+
+
+def render(samples):
+    """Format samples as Prometheus text exposition."""
+    lines = []
+    typed = set()
+    for name, kind, labels, value in sorted(samples, key=lambda s: (s[0], sorted(s[2].items()))):
+        family = name
+        for suffix in ("_bucket", "_sum", "_count"):
+            if kind == "histogram" and name.endswith(suffix):
+                family = name[: -len(suffix)]
+        if family not in typed:
+            lines.append(f"# TYPE {family} {kind}")
+            typed.add(family)
+        label_text = ",".join(f'{k}="{v}"' for k, v in sorted(labels.items()))
+        lines.append(f"{name}{{{label_text}}} {value}" if label_text else f"{name} {value}")
+    return "\n".join(lines) + "\n"
+
+
+# --- Cross-process publishing ---
+def _metrics_dir():
+    path = state_path(METRICS_DIR_NAME)
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+class MetricsPublisher:
+    """Writes this process's samples plus a heartbeat to the state directory periodically."""
+
+    def __init__(self, process_name, interval=PUBLISH_INTERVAL):
+        self.process_name = process_name
+        self.interval = interval
+        self.path = os.path.join(_metrics_dir(), f"{process_name.lower().replace(' ', '_')}.json")
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="metrics-publisher", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def publish(self):
+        payload = {
+            "process": self.process_name,
+            "pid": os.getpid(),
+            "heartbeat": time.time(),
+            "stalled_since": METRICS.stalled_since(),
+            "samples": METRICS.samples(),
+        }
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(payload, f)
+        os.replace(tmp_path, self.path)
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.publish()
+            except Exception as e:
+                logger.warning("Could not publish metrics: %s", e)
+            self._stop.wait(self.interval)
+
+
+def read_published():
+    """Load every published process snapshot: {process name: payload}."""
+    snapshots = {}
+    for path in glob.glob(os.path.join(_metrics_dir(), "*.json")):
+        try:
+            with open(path, encoding="utf-8") as f:
+                payload = json.load(f)
+            snapshots[payload["process"]] = payload
+        except (OSError, ValueError, KeyError):
+            continue
+    return snapshots
+
+
+def clear_published():
+    """Remove snapshots left over from a previous run."""
+    for path in glob.glob(os.path.join(_metrics_dir(), "*.json")):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+# --- HTTP endpoint ---
+class MetricsServer:
+    """Serves /metrics, /healthz and /readyz from a daemon thread."""
+
+    def __init__(self, port=METRICS_PORT, expected_processes=(), process_name="run_actions"):
+        self.port = port
+        self.expected_processes = list(expected_processes)
+        self.process_name = process_name
+        self._httpd = None
+
+    def collect(self):
+        now = time.time()
+        samples = [(n, k, dict(l, process=self.process_name), v) for n, k, l, v in METRICS.samples()]
+        for name, payload in read_published().items():
+            if payload.get("pid") == os.getpid():
+                continue  # this process; already collected above
+            samples += [(n, k, dict(l, process=name), v) for n, k, l, v in payload["samples"]]
+            samples.append(("ftrack_listener_heartbeat_age_seconds", "gauge", {"process": name}, now - payload["heartbeat"]))
+        return samples
+
+    def readiness(self):
+        """Return (ready, {process: heartbeat age or None}, {process: seconds without progress or None})."""
+        now = time.time()
+        published = read_published()
+        ages, stalled = {}, {}
+        for name in self.expected_processes:
+            payload = published.get(name) or {}
+            ages[name] = now - payload["heartbeat"] if payload else None
+            stalled[name] = now - payload["stalled_since"] if payload.get("stalled_since") else None
+        ready = all(age is not None and age <= HEARTBEAT_TIMEOUT for age in ages.values()) and all(
+            seconds is None or seconds <= PROGRESS_TIMEOUT for seconds in stalled.values()
+        )
+        return ready, ages, stalled
+
+    def start(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                path = self.path.split("?", 1)[0]
+                if path == "/metrics":
+                    self._reply(200, render(server.collect()), "text/plain; version=0.0.4")
+                elif path == "/healthz":
+                    self._reply(200, "ok\n")
+                elif path == "/readyz":
+                    ready, ages, stalled = server.readiness()
+                    body = json.dumps({"ready": ready, "heartbeat_age": ages, "stalled_for": stalled})
+                    self._reply(200 if ready else 503, body, "application/json")
+                else:
+                    self._reply(404, "not found\n")
+
+            def _reply(self, status, body, content_type="text/plain"):
+                data = body.encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                logger.debug("metrics http: " + format, *args)
+
+        self._httpd = ThreadingHTTPServer(("0.0.0.0", self.port), Handler)
+        self.port = self._httpd.server_address[1]
+        threading.Thread(target=self._httpd.serve_forever, name="metrics-http", daemon=True).start()
+        logger.info("Metrics endpoint listening on port %d.", self.port)
+        return self
+
+    def stop(self):
+        if self._httpd:
+            self._httpd.shutdown()
+            self._httpd.server_close()
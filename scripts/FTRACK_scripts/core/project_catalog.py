@@ -0,0 +1,118 @@
+"""
+In-process project catalog.
+---------------------------
+Keeps the id/full_name list of all projects in memory so forms that offer a
+project dropdown do not have to query and sort every project on each launch.
+The catalog is loaded once, kept current from ftrack.update project events
+and fully reloaded every REFRESH_INTERVAL seconds as a safety net against
+missed events.
+"""
+
+import bisect
+import logging
+import threading
+import time
+
+from core.config import env_float
+
+logger = logging.getLogger(__name__)
+
+REFRESH_INTERVAL = env_float("FTRACK_PROJECT_CATALOG_REFRESH", 3600)
+
+# ftrack.update reports projects as entityType "show" / entity_type "Project".
+_PROJECT_TYPES = ("show", "project")
+
+
+def _is_project(entity):
+    return (entity.get("entityType") or entity.get("entity_type") or "").lower() in _PROJECT_TYPES
+
+
+class ProjectCatalog:
+    """Sorted, incrementally maintained list of (full_name, id) for every project."""
+
+    def __init__(self, session, refresh_interval=REFRESH_INTERVAL):
+        self.session = session
+        self.refresh_interval = refresh_interval
+        self._names = {}
+        self._sorted = []
+        self._options = None
+        self._loaded_at = None
+        self._lock = threading.RLock()
+
+    def refresh(self):
+        """Reload every project from the server."""
+        projects = self.session.query("select id, full_name from Project")
+        with self._lock:
+            self._names = {p["id"]: p["full_name"] for p in projects}
+            self._sorted = sorted((name, project_id) for project_id, name in self._names.items())
+            self._options = None
+            self._loaded_at = time.monotonic()
+        logger.info("Project catalog loaded with %d projects.", len(self._names))
+
+    def _ensure_fresh(self):
+        if self._loaded_at is None or time.monotonic() - self._loaded_at > self.refresh_interval:
+            self.refresh()
+
+    def options(self):
+        """Enumerator options for a form, already sorted by full name."""
+        with self._lock:
+            self._ensure_fresh()
+            if self._options is None:
+                self._options = [{"label": name, "value": project_id} for name, project_id in self._sorted]
+            return self._options
+
+    def __len__(self):
+        with self._lock:
+            return len(self._names)
+
+    def upsert(self, project_id, full_name):
+        with self._lock:
+            self._discard(project_id)
+            self._names[project_id] = full_name
+            bisect.insort(self._sorted, (full_name, project_id))
+            self._options = None
+
+    def remove(self, project_id):
+        with self._lock:
+            self._discard(project_id)
+            self._options = None
+
+    def _discard(self, project_id):
+        old_name = self._names.pop(project_id, None)
+        if old_name is None:
+            return
+        index = bisect.bisect_left(self._sorted, (old_name, project_id))
+        if index < len(self._sorted) and self._sorted[index] == (old_name, project_id):
+            del self._sorted[index]
+
+    def handle_update_event(self, event):
+        """ftrack.update callback: apply project add/update/remove to the catalog."""
+        if self._loaded_at is None:
+            return
+        for entity in event["data"].get("entities", []):
+            if not _is_project(entity):
+                continue
+            project_id = entity.get("entityId")
+            action = (entity.get("action") or "").lower()
+            if not project_id:
+                continue
+
+            if action in ("remove", "delete"):
+                self.remove(project_id)
+                logger.info("Project catalog: removed %s.", project_id)
+                continue
+
+            changes = entity.get("changes") or {}
+            full_name = (changes.get("fullname") or changes.get("full_name") or {}).get("new")
+            if action == "update" and full_name is None:
+                # Not a rename (e.g. status or dates changed); nothing to update.
+                continue
+            if full_name is None:
+                project = self.session.query(
+                    f'select id, full_name from Project where id is "{project_id}"'
+                ).first()
+                if not project:
+                    continue
+                full_name = project["full_name"]
+            self.upsert(project_id, full_name)
+            logger.info("Project catalog: %s '%s'.", action or "update", full_name)
@@ -0,0 +1,153 @@
+"""
+Client-side rate limiter shared by all ftrack listeners.
+--------------------------------------------------------
+A token bucket per ftrack server, kept in a SQLite file in the state
+directory so every run_actions process (and thread) draws from the same
+budget. Every server round trip made through Session.call (queries, gets,
+populates, commits) takes one token.
+
+Two priority lanes share each bucket: background work (event handlers, sync,
+cloning) may not drain the bucket below a reserved share, which stays
+available to interactive work (action discover/launch) so users never wait
+behind a sync burst.
+
+Budgets are configured per server as "url=rate/burst" pairs, e.g.
+    FTRACK_RATE_LIMITS="https://postbox-visual.ftrackapp.com=20/40,https://undark.ftrackapp.com=5/10"
+"""
+
+import contextlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+from core.config import env_bool, env_float, state_path
+
+logger = logging.getLogger(__name__)
+
+INTERACTIVE = "interactive"
+BACKGROUND = "background"
+
+DEFAULT_RATE = env_float("FTRACK_RATE_LIMIT", 20)      # tokens per second
+DEFAULT_BURST = env_float("FTRACK_RATE_BURST", 40)     # bucket size
+# Share of the bucket background work may not consume.
+INTERACTIVE_RESERVE = env_float("FTRACK_RATE_INTERACTIVE_RESERVE", 0.25)
+ENABLED = env_bool("FTRACK_RATE_LIMIT_ENABLED", True)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS buckets (
+    server     TEXT PRIMARY KEY,
+    tokens     REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+"""
+
+_lane = threading.local()
+
+
+def _parse_budgets(value):
+    budgets = {}
+    for item in (value or "").split(","):
+        if "=" not in item:
+            continue
+        url, _, spec = item.strip().rpartition("=")
+        rate, _, burst = spec.partition("/")
+        try:
+            budgets[url.rstrip("/")] = (float(rate), float(burst or rate))
+        except ValueError:
+            logger.warning("Ignoring invalid rate limit '%s'.", item)
+    return budgets
+
+
+BUDGETS = _parse_budgets(os.getenv("FTRACK_RATE_LIMITS"))
+
+
+def current_lane():
+    return getattr(_lane, "name", BACKGROUND)
+
+
+@contextlib.contextmanager
+def priority_lane(name):
+    """Run the enclosed server calls in the given lane (INTERACTIVE or BACKGROUND)."""
+    previous = current_lane()
+    _lane.name = name
+    try:
+        yield
+    finally:
+        _lane.name = previous
+
+
+class RateLimiter:
+    """Cross-process token bucket for one ftrack server."""
+
+    def __init__(self, server, rate=None, burst=None, path=None):
+        self.server = (server or "").rstrip("/")
+        budget_rate, budget_burst = BUDGETS.get(self.server, (DEFAULT_RATE, DEFAULT_BURST))
+        self.rate = rate or budget_rate
+        self.burst = burst or budget_burst
+        self.path = path or state_path("rate_limits.sqlite3")
+        self._local = threading.local()
+
+    def _conn(self):
+        # One connection per thread; cross-process safety comes from SQLite's write lock.
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(_SCHEMA)
+            self._local.conn = conn
+        return conn
+
+    def try_acquire(self, cost=1, lane=None):
+        """Take cost tokens if available; returns 0 on success or the seconds to wait."""
+        floor = 0 if (lane or current_lane()) == INTERACTIVE else self.burst * INTERACTIVE_RESERVE
+        conn = self._conn()
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT tokens, updated_at FROM buckets WHERE server = ?", (self.server,)).fetchone()
+            tokens = self.burst if row is None else min(self.burst, row[0] + (now - row[1]) * self.rate)
+            if tokens - cost >= floor:
+                tokens -= cost
+                wait = 0.0
+            else:
+                wait = (cost + floor - tokens) / self.rate
+            conn.execute(
+                "INSERT OR REPLACE INTO buckets (server, tokens, updated_at) VALUES (?, ?, ?)",
+                (self.server, tokens, now),
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return wait
+
+    def acquire(self, cost=1, lane=None):
+        """Block until cost tokens were taken; returns the total time waited."""
+        waited = 0.0
+        while True:
+            wait = self.try_acquire(cost, lane)
+            if not wait:
+                if waited > 1:
+                    logger.info("[RATE LIMIT] %s: waited %.1fs (%s lane).", self.server, waited, lane or current_lane())
+                return waited
+            time.sleep(wait)
+            waited += wait
+
+
+def install_rate_limiter(session, limiter=None):
+    """Route every server round trip of session through the shared limiter for its server."""
+    if not ENABLED or getattr(session, "_rate_limiter", None):
+        return session
+    limiter = limiter or RateLimiter(session.server_url)
+    call = session.call
+
+    def limited_call(data):
+        limiter.acquire()
+        return call(data)
+
+    session.call = limited_call
+    session._rate_limiter = limiter
+    logger.info("Rate limiter installed for %s (%.0f/s, burst %.0f).", limiter.server, limiter.rate, limiter.burst)
+    return session
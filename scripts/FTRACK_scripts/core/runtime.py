@@ -0,0 +1,213 @@
+"""
+Shared-session listener runtime.
+--------------------------------
+Hosts every registered action on one ftrack session and one event hub
+connection instead of one OS process (and one schema download) per action.
+
+Each action is registered against an ActionSession: a thin proxy around the
+action's own session (opened without a hub connection through the router's
+session_factory, so the schema cache makes it cheap) whose event_hub routes
+subscriptions through the ActionRouter's one hub connection.
+  * Request/reply topics (ftrack.action.*) are called inline on the hub
+    thread, since their return value is the reply sent back to ftrack.
+  * Every other topic is subscribed once on the real hub and fanned out to
+    the subscribed actions, each on its own worker pool, so a slow handler
+    never stalls the hub or the other actions.
+
+ftrack sessions are not thread safe, so the proxy serialises the session
+calls it forwards (query, get, create, commit, ...) behind the action's
+lock and materialises query results while holding it. Lazy attribute loads
+(task["project"]["name"]) go through the session's populate(), which is
+locked the same way. The lock is only ever held for one call, never across
+a batch or a sleep, and reply callbacks on the hub thread only contend with
+their own action. Since sessions are per action, a handler's create →
+commit sequence can only interleave with other work of the same action.
+"""
+
+import contextlib
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from core.config import env_int
+
+logger = logging.getLogger(__name__)
+
+# Worker threads per action for fire-and-forget topics.
+WORKERS_PER_ACTION = env_int("FTRACK_WORKERS_PER_ACTION", 1)
+
+# Topics whose callbacks must answer synchronously on the hub thread.
+REPLY_TOPIC_PREFIXES = ("topic=ftrack.action.",)
+
+# Session methods forwarded under the session lock.
+_LOCKED_METHODS = (
+    "get", "create", "commit", "rollback", "populate", "delete",
+    "ensure", "merge", "reset", "call",
+)
+
+
+@contextlib.contextmanager
+def holding(*sessions):
+    """Hold the locks of the given LockedSessions (others are ignored) for a whole handler invocation.
+
+    The locks are taken in a fixed order, so two threads holding the same
+    sessions in opposite roles (source/target) cannot deadlock.
+    """
+    locks = {id(lock): lock for lock in (getattr(session, "lock", None) for session in sessions) if lock is not None}
+    with contextlib.ExitStack() as stack:
+        for _, lock in sorted(locks.items()):
+            stack.enter_context(lock)
+        yield
+
+
+class _LockedQueryResult:
+    """Query result whose server round trips happen under the session lock."""
+
+    def __init__(self, result, lock):
+        self._result = result
+        self._lock = lock
+
+    def first(self):
+        with self._lock:
+            return self._result.first()
+
+    def one(self):
+        with self._lock:
+            return self._result.one()
+
+    def all(self):
+        with self._lock:
+            return self._result.all()
+
+    def __iter__(self):
+        return iter(self.all())
+
+    def __len__(self):
+        return len(self.all())
+
+
+def _lock_lazy_loads(session, lock):
+    """Serialise session.populate(), which ftrack_api entities call to lazy-load an attribute."""
+    if getattr(session, "_populate_lock", None) is not None:
+        return
+    populate = session.populate
+
+    def locked_populate(*args, **kwargs):
+        with lock:
+            return populate(*args, **kwargs)
+
+    session.populate = locked_populate
+    session._populate_lock = lock
+
+
+class _ActionHub:
+    """Event hub facade handed to one action; subscriptions go through the router."""
+
+    def __init__(self, router, action_name):
+        self._router = router
+        self._action_name = action_name
+
+    def subscribe(self, subscription, callback, **kwargs):
+        return self._router.subscribe(self._action_name, subscription, callback, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self._router.session.event_hub, name)
+
+
+class LockedSession:
+    """Proxy of a session whose calls are serialised behind one lock, so threads can share it."""
+
+    def __init__(self, session, lock=None):
+        self._session = session
+        self.lock = lock or threading.RLock()
+        _lock_lazy_loads(session, self.lock)
+
+    def query(self, expression, page_size=None):
+        with self.lock:
+            result = self._session.query(expression, page_size=page_size)
+        return _LockedQueryResult(result, self.lock)
+
+    def __getattr__(self, name):
+        attribute = getattr(self._session, name)
+        if name in _LOCKED_METHODS and callable(attribute):
+            lock = self.lock
+
+            def locked(*args, **kwargs):
+                with lock:
+                    return attribute(*args, **kwargs)
+            return locked
+        return attribute
+
+
+class ActionSession(LockedSession):
+    """Proxy of one action's session (locked calls, routed hub)."""
+
+    def __init__(self, router, action_name, session, lock):
+        super().__init__(session, lock)
+        self.event_hub = _ActionHub(router, action_name)
+
+
+class ActionRouter:
+    """Routes events from one shared session's hub to many hosted actions.
+
+    ``session_factory`` opens the session of each action; without it every
+    action shares the hub session and one lock.
+    """
+
+    def __init__(self, session, session_factory=None, workers_per_action=WORKERS_PER_ACTION):
+        self.session = session
+        self.session_factory = session_factory
+        self.lock = threading.RLock()
+        self.workers_per_action = workers_per_action
+        self._pools = {}
+        self._routes = {}
+        self._routes_lock = threading.Lock()
+
+    def session_for(self, action_name):
+        """Return the session proxy an action should be registered with."""
+        self._pool(action_name)
+        if self.session_factory is None:
+            return ActionSession(self, action_name, self.session, self.lock)
+        return ActionSession(self, action_name, self.session_factory(), threading.RLock())
+
+    def _pool(self, action_name):
+        pool = self._pools.get(action_name)
+        if pool is None:
+            pool = ThreadPoolExecutor(
+                max_workers=self.workers_per_action,
+                thread_name_prefix=action_name.lower().replace(" ", "-"),
+            )
+            self._pools[action_name] = pool
+        return pool
+
+    def subscribe(self, action_name, subscription, callback, **kwargs):
+        if subscription.startswith(REPLY_TOPIC_PREFIXES):
+            logger.info("[ROUTER] %s: inline subscription '%s'.", action_name, subscription)
+            return self.session.event_hub.subscribe(subscription, callback, **kwargs)
+
+        with self._routes_lock:
+            targets = self._routes.get(subscription)
+            first = targets is None
+            if first:
+                targets = self._routes[subscription] = []
+            targets.append((action_name, callback))
+        if first:
+            self.session.event_hub.subscribe(
+                subscription, lambda event: self._dispatch(subscription, event), **kwargs
+            )
+        logger.info("[ROUTER] %s: routed subscription '%s'.", action_name, subscription)
+
+    def _dispatch(self, subscription, event):
+        for action_name, callback in self._routes.get(subscription, ()):
+            self._pools[action_name].submit(self._run, action_name, callback, event)
+
+    @staticmethod
+    def _run(action_name, callback, event):
+        try:
+            callback(event)
+        except Exception as e:
+            logger.exception("[ROUTER] Handler of '%s' failed: %s", action_name, e)
+
+    def shutdown(self, wait=True):
+        for pool in self._pools.values():
+            pool.shutdown(wait=wait)
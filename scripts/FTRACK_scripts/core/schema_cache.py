@@ -0,0 +1,84 @@
+"""
+Persistent ftrack schema cache.
+-------------------------------
+Every new ftrack_api.Session downloads the full server schema before it can
+build its entity classes. ftrack_api's own cache is a single file in the temp
+directory, so it is lost with the container and two servers in one process
+(PBV and UNDARK) keep overwriting each other's copy.
+
+create_session() builds sessions that keep one cache file per server URL in
+the state directory, shared by every listener process and kept across
+restarts. The server reports its schema hash with the server information
+the session fetches anyway:
+  * matching hash: the cached schemas are used, no download.
+  * changed hash or no cache yet: the schemas are downloaded before the
+    session starts and stored. Starting from stale schemas would leave the
+    process on them for its whole lifetime.
+"""
+
+import hashlib
+import json
+import logging
+import os
+
+import ftrack_api
+
+from core.config import state_path
+
+logger = logging.getLogger(__name__)
+
+class SchemaCache:
+    """On-disk copy of one server's schemas and their schema hash."""
+
+    def __init__(self, server_url):
+        key = hashlib.sha1(server_url.rstrip("/").encode("utf-8")).hexdigest()[:16]
+        self.server_url = server_url
+        self.path = state_path(os.path.join("schema_cache", f"{key}.json"))
+
+    def load(self):
+        """Return (schema_hash, schemas), or (None, None) if nothing usable is cached."""
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                data = json.load(f)
+            return data["schema_hash"], data["schemas"]
+        except (OSError, ValueError, KeyError):
+            return None, None
+
+    def store(self, schema_hash, schemas):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        # Written atomically: other processes may be reading it at the same time.
+        temp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump({"server_url": self.server_url, "schema_hash": schema_hash, "schemas": schemas}, f)
+        os.replace(temp_path, self.path)
+
+
+class CachedSchemaSession(ftrack_api.Session):
+    """ftrack_api.Session loading its schemas from the shared SchemaCache."""
+
+    def _load_schemas(self, schema_cache_path):
+        if schema_cache_path is False:
+            return super()._load_schemas(schema_cache_path)
+
+        cache = SchemaCache(self.server_url)
+        cached_hash, schemas = cache.load()
+        server_hash = (getattr(self, "_server_information", None) or {}).get("schema_hash")
+
+        if schemas is not None and cached_hash == server_hash:
+            logger.debug("Schemas for %s loaded from cache.", self.server_url)
+            return schemas
+
+        if schemas is not None:
+            logger.info("Schema of %s changed; downloading the new schemas.", self.server_url)
+        schemas = self._fetch_schemas()
+        cache.store(server_hash, schemas)
+        logger.info("Schemas for %s downloaded and cached.", self.server_url)
+        return schemas
+
+    def _fetch_schemas(self):
+        return self.call([{"action": "query_schemas"}])[0]
+
+
+def create_session(**kwargs):
+    """Create an ftrack session that uses the persistent schema cache."""
+    return CachedSchemaSession(**kwargs)
@@ -0,0 +1,154 @@
+"""
+Partitioned ownership for horizontally scaled sync workers.
+-----------------------------------------------------------
+Shard keys (the sync uses project names, identical on every server) are
+hashed into FTRACK_SYNC_PARTITIONS partitions. Every replica
+takes leases on a fair share of them in a lease table kept in a shared SQLite
+file (the stand-in for a distributed lock), renews them on a heartbeat and
+only handles events whose project falls into a partition it owns. When a
+replica stops heartbeating its leases expire and the survivors pick them
+up; when a new replica joins, the others give up their surplus.
+"""
+
+import logging
+import math
+import os
+import socket
+import sqlite3
+import threading
+import time
+import zlib
+
+from core.config import env_float, env_int, state_path
+
+logger = logging.getLogger(__name__)
+
+PARTITIONS = env_int("FTRACK_SYNC_PARTITIONS", 16)
+LEASE_TTL = env_float("FTRACK_SYNC_LEASE_TTL", 30)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS replicas (
+    replica_id   TEXT PRIMARY KEY,
+    heartbeat_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS leases (
+    partition  INTEGER PRIMARY KEY,
+    owner      TEXT,
+    expires_at REAL NOT NULL DEFAULT 0
+);
+"""
+
+
+def partition_of(key, partitions=PARTITIONS):
+    """Stable partition number of a key (the same in every replica and process)."""
+    return zlib.crc32(str(key).encode("utf-8")) % partitions
+
+
+class ShardLeases:
+    """Lease-based partition ownership for one replica."""
+
+    def __init__(self, replica_id=None, partitions=PARTITIONS, ttl=LEASE_TTL, path=None, on_acquire=None):
+        self.replica_id = replica_id or os.getenv("FTRACK_SYNC_REPLICA_ID") or socket.gethostname()
+        self.partitions = partitions
+        self.ttl = ttl
+        self.path = path or state_path("sync_leases.sqlite3")
+        self.on_acquire = on_acquire
+        self._owned = frozenset()
+        self._valid_until = 0.0
+        self._stop = threading.Event()
+        self._conn = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(_SCHEMA)
+        self._conn.executemany(
+            "INSERT OR IGNORE INTO leases (partition, owner, expires_at) VALUES (?, NULL, 0)",
+            [(p,) for p in range(partitions)],
+        )
+        self._lock = threading.Lock()
+
+    def owns(self, key):
+        """True if this replica currently holds the lease for key's partition."""
+        if time.monotonic() > self._valid_until:
+            return False  # leases not renewed in time; assume they were taken over
+        return partition_of(key, self.partitions) in self._owned
+
+    @property
+    def owned(self):
+        return sorted(self._owned)
+
+    def start(self):
+        self.heartbeat()
+        threading.Thread(target=self._run, name="shard-leases", daemon=True).start()
+        return self
+
+    def stop(self):
+        """Release every lease so other replicas can take over immediately."""
+        self._stop.set()
+        with self._lock:
+            self._conn.execute("UPDATE leases SET owner = NULL, expires_at = 0 WHERE owner = ?", (self.replica_id,))
+            self._conn.execute("DELETE FROM replicas WHERE replica_id = ?", (self.replica_id,))
+        self._owned = frozenset()
+
+    def _run(self):
+        while not self._stop.wait(self.ttl / 3):
+            try:
+                self.heartbeat()
+            except Exception as e:
+                logger.warning("[SHARD] Lease heartbeat failed: %s", e)
+
+    def heartbeat(self):
+        """Renew own leases, then acquire or release partitions towards a fair share."""
+        started = time.monotonic()
+        now = time.time()
+        conn = self._conn
+        with self._lock:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.execute(
+                    "INSERT OR REPLACE INTO replicas (replica_id, heartbeat_at) VALUES (?, ?)", (self.replica_id, now)
+                )
+                conn.execute("DELETE FROM replicas WHERE heartbeat_at < ?", (now - self.ttl,))
+                live = conn.execute("SELECT COUNT(*) FROM replicas").fetchone()[0]
+                fair_share = math.ceil(self.partitions / max(1, live))
+
+                conn.execute(
+                    "UPDATE leases SET expires_at = ? WHERE owner = ? AND expires_at >= ?",
+                    (now + self.ttl, self.replica_id, now),
+                )
+                mine = [row[0] for row in conn.execute(
+                    "SELECT partition FROM leases WHERE owner = ? AND expires_at >= ? ORDER BY partition",
+                    (self.replica_id, now),
+                )]
+                if len(mine) > fair_share:
+                    surplus = mine[fair_share:]
+                    conn.executemany(
+                        "UPDATE leases SET owner = NULL, expires_at = 0 WHERE partition = ? AND owner = ?",
+                        [(p, self.replica_id) for p in surplus],
+                    )
+                    mine = mine[:fair_share]
+                    logger.info("[SHARD] %s released partitions %s.", self.replica_id, surplus)
+                acquired = []
+                if len(mine) < fair_share:
+                    free = [row[0] for row in conn.execute(
+                        "SELECT partition FROM leases WHERE owner IS NULL OR expires_at < ? ORDER BY partition LIMIT ?",
+                        (now, fair_share - len(mine)),
+                    )]
+                    conn.executemany(
+                        "UPDATE leases SET owner = ?, expires_at = ? WHERE partition = ?",
+                        [(self.replica_id, now + self.ttl, p) for p in free],
+                    )
+                    acquired = free
+                    mine += free
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+
+        self._owned = frozenset(mine)
+        # Stop trusting the leases slightly before they expire for everyone else.
+        self._valid_until = started + self.ttl * 0.9
+        if acquired:
+            logger.info("[SHARD] %s acquired partitions %s (owns %d/%d, %d live replicas).",
+                        self.replica_id, acquired, len(mine), self.partitions, live)
+            if self.on_acquire:
+                self.on_acquire(acquired)
+        return self.owned
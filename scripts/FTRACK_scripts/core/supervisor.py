@@ -0,0 +1,138 @@
+"""
+Listener process supervisor.
+----------------------------
+Runs each listener in its own process and keeps it alive:
+
+  * A listener that exits (crash, failed registration) is restarted.
+  * A listener that is alive but stopped heartbeating (its MetricsPublisher
+    snapshot is older than FTRACK_HEARTBEAT_TIMEOUT) is considered hung,
+    terminated and restarted.
+  * So is a listener that still heartbeats but whose event batcher has had
+    work outstanding without completing a dispatch, replay page or task for
+    FTRACK_PROGRESS_TIMEOUT: the heartbeat comes from its own thread and
+    keeps going when the worker deadlocks.
+  * Restarts back off exponentially per listener (FTRACK_RESTART_BACKOFF,
+    doubling up to FTRACK_RESTART_BACKOFF_MAX); a listener that stayed up
+    for FTRACK_RESTART_RESET_AFTER seconds starts again from the base delay.
+
+Only the failed listener is restarted, so the others keep their sessions and
+warm caches. The replacement process takes over from the on-disk journal of
+its predecessor: it replays the events that were never acknowledged and runs
+gap recovery from the journal checkpoint.
+"""
+
+import logging
+import time
+from multiprocessing import Process
+
+from core.config import env_float
+from core.metrics import HEARTBEAT_TIMEOUT, METRICS, PROGRESS_TIMEOUT, read_published
+
+logger = logging.getLogger(__name__)
+
+RESTART_BACKOFF = env_float("FTRACK_RESTART_BACKOFF", 2)
+RESTART_BACKOFF_MAX = env_float("FTRACK_RESTART_BACKOFF_MAX", 300)
+RESTART_RESET_AFTER = env_float("FTRACK_RESTART_RESET_AFTER", 600)
+# Time a new listener process gets to connect and send its first heartbeat.
+STARTUP_GRACE = env_float("FTRACK_STARTUP_GRACE", 120)
+CHECK_INTERVAL = env_float("FTRACK_SUPERVISOR_INTERVAL", 2)
+# Time a terminated listener gets to exit before it is killed.
+TERMINATE_TIMEOUT = 10
+
+
+class _Listener:
+    """Supervision state of one listener."""
+
+    def __init__(self, register_function, name):
+        self.register_function = register_function
+        self.name = name
+        self.process = None
+        self.started_at = None
+        self.failures = 0
+        self.restart_at = None
+
+
+class ListenerSupervisor:
+    """Starts listener processes and restarts them individually when they die or hang.
+
+    ``target(register_function, name)`` is the process entry point
+    (run_actions.run_listener).
+    """
+
+    def __init__(self, target, listeners):
+        self.target = target
+        self.listeners = [_Listener(register_function, name) for register_function, name in listeners]
+        self._running = False
+
+    def start(self):
+        for listener in self.listeners:
+            self._spawn(listener)
+        logger.info("%d action processes have started.", len(self.listeners))
+        return self
+
+    def run(self):
+        """Supervise until stop() is called."""
+        self._running = True
+        while self._running:
+            self.check()
+            time.sleep(CHECK_INTERVAL)
+
+    def check(self):
+        now = time.time()
+        published = read_published()
+        for listener in self.listeners:
+            if listener.restart_at is not None:
+                if now >= listener.restart_at:
+                    METRICS.inc("ftrack_listener_restarts_total", listener=listener.name)
+                    self._spawn(listener)
+                continue
+
+            process = listener.process
+            if not process.is_alive():
+                self._schedule_restart(listener, f"exited with code {process.exitcode}")
+            elif self._is_hung(listener, published.get(listener.name), now):
+                logger.error("Listener '%s' (pid %s) stopped making progress; terminating it.", listener.name, process.pid)
+                self._terminate(process)
+                self._schedule_restart(listener, "hung")
+            elif listener.failures and now - listener.started_at >= RESTART_RESET_AFTER:
+                logger.info("Listener '%s' is stable again; restart backoff reset.", listener.name)
+                listener.failures = 0
+
+    def stop(self):
+        self._running = False
+        for listener in self.listeners:
+            if listener.process is not None and listener.process.is_alive():
+                self._terminate(listener.process)
+
+    def _spawn(self, listener):
+        process = Process(target=self.target, args=(listener.register_function, listener.name), name=listener.name)
+        process.start()
+        listener.process = process
+        listener.started_at = time.time()
+        listener.restart_at = None
+        if listener.failures:
+            logger.info("Restarted listener '%s' (pid %s, attempt %d).", listener.name, process.pid, listener.failures)
+
+    def _schedule_restart(self, listener, reason):
+        listener.failures += 1
+        delay = min(RESTART_BACKOFF_MAX, RESTART_BACKOFF * 2 ** (listener.failures - 1))
+        listener.restart_at = time.time() + delay
+        logger.error("Listener '%s' %s; restarting in %.1fs.", listener.name, reason, delay)
+
+    @staticmethod
+    def _is_hung(listener, payload, now):
+        if payload is None or payload.get("pid") != listener.process.pid:
+            # No heartbeat from this incarnation yet.
+            return now - listener.started_at > STARTUP_GRACE
+        if now - payload["heartbeat"] > HEARTBEAT_TIMEOUT:
+            return True
+        stalled_since = payload.get("stalled_since")
+        return stalled_since is not None and now - stalled_since > PROGRESS_TIMEOUT
+
+    @staticmethod
+    def _terminate(process):
+        process.terminate()
+        process.join(TERMINATE_TIMEOUT)
+        if process.is_alive():
+            process.kill()
+            process.join()
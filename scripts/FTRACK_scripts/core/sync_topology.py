@@ -0,0 +1,126 @@
+"""
+Multi-server sync topology.
+---------------------------
+Describes which ftrack servers the sync connects to and which entity types
+are replicated along each directed link between them, so adding a partner
+studio is a config change instead of another hardwired session.
+
+The topology is a JSON file (FTRACK_SYNC_TOPOLOGY, default
+state/sync_topology.json). Credentials are never stored in it; each server
+names the environment variables holding them:
+
+    {
+      "primary": "PBV",
+      "servers": {
+        "PBV":    {"url_env": "FTRACK_SERVER", "user_env": "FTRACK_API_USER", "key_env": "FTRACK_API_KEY"},
+        "UNDARK": {"url_env": "UNDARK_FTRACK_API_URL", "user_env": "UNDARK_FTRACK_API_USER",
+                   "key_env": "UNDARK_FTRACK_API_KEY"}
+      },
+      "links": [
+        {"source": "PBV", "target": "UNDARK", "entity_types": ["Task", "Note", "AssetVersion"]},
+        {"source": "UNDARK", "target": "PBV", "entity_types": ["Note", "AssetVersion"]}
+      ]
+    }
+
+Optionally, "location" names the location version components are read from
+and written to (default "ftrack.server"), and "media_root" replaces it with
+a local directory standing in for the location (see core.media_transfer).
+
+The primary server is the one whose session the action runner provides.
+Without a topology file the built-in PBV ↔ UNDARK topology above is used.
+"""
+
+import collections
+import json
+import logging
+import os
+
+from core.config import state_path
+
+logger = logging.getLogger(__name__)
+
+TOPOLOGY_PATH = os.getenv("FTRACK_SYNC_TOPOLOGY")
+
+ServerConfig = collections.namedtuple(
+    "ServerConfig", ["name", "url", "user", "api_key", "location", "media_root"], defaults=("ftrack.server", None)
+)
+LinkConfig = collections.namedtuple("LinkConfig", ["source", "target", "entity_types"])
+
+DEFAULT_TOPOLOGY = {
+    "primary": "PBV",
+    "servers": {
+        "PBV": {"url_env": "FTRACK_SERVER", "user_env": "FTRACK_API_USER", "key_env": "FTRACK_API_KEY"},
+        "UNDARK": {
+            "url_env": "UNDARK_FTRACK_API_URL",
+            "user_env": "UNDARK_FTRACK_API_USER",
+            "key_env": "UNDARK_FTRACK_API_KEY",
+        },
+    },
+    "links": [
+        {"source": "PBV", "target": "UNDARK", "entity_types": ["Task", "Note", "AssetVersion"]},
+        {"source": "UNDARK", "target": "PBV", "entity_types": ["Note", "AssetVersion"]},
+    ],
+}
+
+
+class SyncTopology:
+    """Servers and directed replication links of the sync."""
+
+    def __init__(self, primary, servers, links):
+        self.primary = primary
+        self.servers = servers
+        self.links = links
+
+    @classmethod
+    def from_dict(cls, data):
+        servers = {}
+        for name, spec in data["servers"].items():
+            servers[name] = ServerConfig(
+                name,
+                spec.get("url") or os.getenv(spec.get("url_env", "")),
+                os.getenv(spec.get("user_env", "")),
+                os.getenv(spec.get("key_env", "")),
+                spec.get("location", "ftrack.server"),
+                spec.get("media_root"),
+            )
+
+        links = []
+        for spec in data.get("links", []):
+            source, target = spec["source"], spec["target"]
+            for name in (source, target):
+                if name not in servers:
+                    raise ValueError(f"Sync link {source} → {target} refers to unknown server '{name}'.")
+            if source == target:
+                raise ValueError(f"Sync link {source} → {target} links a server to itself.")
+            links.append(LinkConfig(source, target, frozenset(t.lower() for t in spec["entity_types"])))
+
+        primary = data.get("primary") or next(iter(servers))
+        if primary not in servers:
+            raise ValueError(f"Primary sync server '{primary}' is not configured.")
+        return cls(primary, servers, links)
+
+    def outgoing(self, server):
+        """Links whose source is server."""
+        return [link for link in self.links if link.source == server]
+
+    def replicated_types(self, server):
+        """Lower-case entity types that server replicates to at least one other server."""
+        return frozenset().union(*(link.entity_types for link in self.outgoing(server)))
+
+
+def load_topology(path=None):
+    """Load the sync topology file, falling back to the built-in PBV ↔ UNDARK topology."""
+    path = path or TOPOLOGY_PATH or state_path("sync_topology.json")
+    if os.path.exists(path):
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        logger.info("Loaded sync topology from %s", path)
+    else:
+        data = DEFAULT_TOPOLOGY
+    topology = SyncTopology.from_dict(data)
+    logger.info(
+        "Sync topology: %d servers, links: %s",
+        len(topology.servers),
+        ", ".join(f"{l.source}→{l.target}" for l in topology.links) or "none",
+    )
+    return topology
@@ -0,0 +1,179 @@
+"""
+Serialized template-project snapshots.
+--------------------------------------
+The studio clones the same few template projects over and over. Instead of
+re-walking the source project over the API on every clone, a snapshot of its
+hierarchy (names, types, custom attributes) is stored on disk, keyed by
+project id, and reused until an ftrack.update event touches that project or
+it is older than FTRACK_SNAPSHOT_MAX_AGE seconds. The age limit catches
+changes whose events this process never saw (it was down, or another
+process wrote the snapshot).
+"""
+
+import datetime
+import json
+import logging
+import os
+import threading
+import time
+
+from core.config import env_float, state_path
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_FORMAT = 2
+SNAPSHOT_MAX_AGE = env_float("FTRACK_SNAPSHOT_MAX_AGE", 6 * 3600)
+SNAPSHOT_DIR_NAME = "template_snapshots"
+
+# Entity types whose children are never copied.
+LEAF_ENTITY_TYPES = ("Task", "Milestone")
+
+
+# --- Serialization ---
+def _encode(value):
+    """JSON default hook: dates (datetime or arrow) become tagged ISO strings."""
+    if hasattr(value, "isoformat"):
+        return {"__datetime__": value.isoformat()}
+    return str(value)
+
+
+def _decode(obj):
+    if "__datetime__" in obj and len(obj) == 1:
+        return datetime.datetime.fromisoformat(obj["__datetime__"])
+    return obj
+
+
+def build_snapshot(session, project_id):
+    """Query a project and its whole hierarchy and return a JSON-serializable snapshot."""
+    project = session.query(
+        "select id, name, full_name, start_date, end_date, project_schema_id, custom_attributes "
+        f'from Project where id is "{project_id}"'
+    ).one()
+    entities = session.query(
+        "select id, name, parent_id, type_id, custom_attributes "
+        f'from TypedContext where project_id is "{project_id}"'
+    ).all()
+
+    nodes = [
+        {
+            "id": entity["id"],
+            "entity_type": entity.entity_type,
+            "name": entity["name"],
+            "parent_id": entity["parent_id"],
+            "type_id": entity["type_id"],
+            "custom_attributes": dict(entity["custom_attributes"].items()),
+        }
+        for entity in entities
+    ]
+    return {
+        "format": SNAPSHOT_FORMAT,
+        "created_at": time.time(),
+        "project": {
+            "id": project["id"],
+            "name": project["name"],
+            "full_name": project["full_name"],
+            "start_date": project["start_date"],
+            "end_date": project["end_date"],
+            "project_schema_id": project["project_schema_id"],
+            "custom_attributes": dict(project["custom_attributes"].items()),
+        },
+        "nodes": nodes,
+    }
+
+
+def children_by_parent(snapshot):
+    """Group snapshot nodes by parent id, each group in snapshot order."""
+    grouped = {}
+    for node in snapshot["nodes"]:
+        grouped.setdefault(node["parent_id"], []).append(node)
+    return grouped
+
+
+# --- Cache ---
+class TemplateSnapshotCache:
+    """On-disk (plus in-memory) cache of project snapshots, keyed by project id."""
+
+    def __init__(self, directory=None, max_age=SNAPSHOT_MAX_AGE):
+        self.directory = directory or state_path(SNAPSHOT_DIR_NAME)
+        self.max_age = max_age
+        os.makedirs(self.directory, exist_ok=True)
+        self._memory = {}
+        self._lock = threading.Lock()
+        # Project ids with a snapshot, kept in memory so update events need no directory listing.
+        self._cached_ids = {name[:-5] for name in os.listdir(self.directory) if name.endswith(".json")}
+
+    def _path(self, project_id):
+        return os.path.join(self.directory, f"{project_id}.json")
+
+    def get(self, project_id):
+        """Return the cached snapshot for project_id, or None."""
+        with self._lock:
+            snapshot = self._memory.get(project_id)
+            if snapshot is None:
+                try:
+                    with open(self._path(project_id), encoding="utf-8") as f:
+                        snapshot = json.load(f, object_hook=_decode)
+                except FileNotFoundError:
+                    return None
+                except (OSError, ValueError) as e:
+                    logger.warning("Discarding unreadable snapshot for %s: %s", project_id, e)
+                    return None
+                if snapshot.get("format") != SNAPSHOT_FORMAT:
+                    return None
+                self._memory[project_id] = snapshot
+                self._cached_ids.add(project_id)
+        if time.time() - snapshot["created_at"] > self.max_age:
+            logger.info("Snapshot of project %s expired.", project_id)
+            self.invalidate(project_id)
+            return None
+        return snapshot
+
+    def put(self, project_id, snapshot):
+        """Store a snapshot; written atomically so a crash never leaves half a file."""
+        path = self._path(project_id)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(snapshot, f, default=_encode)
+        with self._lock:
+            os.replace(tmp_path, path)
+            # Round-trip through JSON so memory and disk copies are identical.
+            with open(path, encoding="utf-8") as f:
+                self._memory[project_id] = json.load(f, object_hook=_decode)
+            self._cached_ids.add(project_id)
+        logger.info("Stored snapshot of project %s (%d entities).", project_id, len(snapshot["nodes"]))
+
+    def get_or_build(self, session, project_id):
+        """Return the cached snapshot, building (and caching) it from the server on a miss."""
+        snapshot = self.get(project_id)
+        if snapshot is not None:
+            logger.info("Using cached snapshot of project %s.", project_id)
+            return snapshot
+        self.put(project_id, build_snapshot(session, project_id))
+        return self.get(project_id)
+
+    def invalidate(self, project_id):
+        with self._lock:
+            self._memory.pop(project_id, None)
+            self._cached_ids.discard(project_id)
+            try:
+                os.remove(self._path(project_id))
+            except FileNotFoundError:
+                return
+        logger.info("Invalidated snapshot of project %s.", project_id)
+
+    def cached_project_ids(self):
+        with self._lock:
+            return set(self._cached_ids)
+
+    def handle_update_event(self, event):
+        """ftrack.update callback: drop snapshots of any project the event touches."""
+        cached = self.cached_project_ids()
+        if not cached:
+            return
+        touched = set()
+        for entity in event["data"].get("entities", []):
+            touched.add(entity.get("entityId"))
+            for parent in entity.get("parents") or []:
+                touched.add(parent.get("entityId"))
+        for project_id in cached & touched:
+            self.invalidate(project_id)
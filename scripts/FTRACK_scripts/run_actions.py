@@ -1,30 +1,44 @@
-import ftrack_api
 import logging
 import os
 import signal
 import sys
-from multiprocessing import Process
 from dotenv import load_dotenv
 
 # Import the register functions from your action files
 from actions.shot_creation_action import register as register_shot_automation
 from actions.template_action import register as register_project_copy
 from actions.undark_pbv_sync import register as register_undark_pbv_sync
+from core.instrumentation import instrument_session
+from core.logging_setup import configure_logging
+from core.metrics import METRICS, MetricsPublisher, MetricsServer, clear_published
+from core.rate_limiter import install_rate_limiter
+from core.runtime import ActionRouter
+from core.schema_cache import create_session
+from core.supervisor import ListenerSupervisor
 
 # --- Setup ---
-logging.basicConfig(level=logging.INFO)
+# Queue-based, non-blocking logging shared by all actions (see core/logging_setup.py)
+configure_logging()
 logger = logging.getLogger(__name__)
 load_dotenv()
 
+# "process": one OS process (and session) per action, isolated from each other.
+# "shared": all actions on one session and event hub, see core/runtime.py.
+LISTENER_TOPOLOGY = os.getenv("FTRACK_LISTENER_TOPOLOGY", "process").lower()
+
 # --- Functions to run each listener ---
 def run_listener(register_function, name):
     """Initializes a session and runs a listener function."""
+    configure_logging(name)
     logger.info(f"Starting listener process: {name}")
     try:
         # Each process must load the .env file to get credentials
         load_dotenv()
+        # Heartbeat + metrics snapshot picked up by the main process's endpoint
+        MetricsPublisher(name).start()
         # Each process gets its own session
-        session = ftrack_api.Session(auto_connect_event_hub=True)
+        session = create_session(auto_connect_event_hub=True)
+        install_rate_limiter(instrument_session(session))
         register_function(session)
         logger.info(f"Listener '{name}' is waiting for events.")
         session.event_hub.wait()
@@ -32,6 +46,26 @@ def run_listener(register_function, name):
         logger.error(f"Listener '{name}' failed: {e}", exc_info=True)
         sys.exit(1)
 
+
+def run_shared(actions):
+    """Hosts all actions on one shared session and event hub."""
+    logger.info(f"Starting shared listener runtime for {len(actions)} actions.")
+    session = create_session(auto_connect_event_hub=True)
+    install_rate_limiter(instrument_session(session))
+    # Every action gets its own session, so one action's session lock never holds up another.
+    router = ActionRouter(
+        session, session_factory=lambda: install_rate_limiter(instrument_session(create_session(auto_connect_event_hub=False)))
+    )
+    MetricsPublisher("Shared Runtime").start()
+    for register_function, name in actions:
+        try:
+            register_function(router.session_for(name))
+            logger.info(f"Listener '{name}' registered on the shared session.")
+        except Exception as e:
+            logger.error(f"Listener '{name}' failed to register: {e}", exc_info=True)
+    logger.info("Shared runtime is waiting for events.")
+    session.event_hub.wait()
+
 # --- Main execution block ---
 if __name__ == '__main__':
     logger.info("Launching ftrack action server...")
@@ -43,25 +77,28 @@ if __name__ == '__main__':
         (register_undark_pbv_sync, "Undark PBV Sync Listener")
     ]
 
-    processes = []
-    for register_func, name in actions_to_run:
-        process = Process(target=run_listener, args=(register_func, name))
-        processes.append(process)
-        process.start()
+    # Metrics/health endpoint for the container orchestrator
+    clear_published()
+    expected = ["Shared Runtime"] if LISTENER_TOPOLOGY == "shared" else [name for _, name in actions_to_run]
+    MetricsServer(expected_processes=expected).start()
+    for _, name in actions_to_run:
+        METRICS.inc("ftrack_listener_restarts_total", 0, listener=name)
+
+    if LISTENER_TOPOLOGY == "shared":
+        run_shared(actions_to_run)
+        sys.exit(0)
 
-    logger.info(f"{len(processes)} action processes have started.")
+    # Crashed or hung listeners are restarted individually, with backoff.
+    supervisor = ListenerSupervisor(run_listener, actions_to_run).start()
 
     # Graceful shutdown handler
     def shutdown(signum, frame):
         logger.info("Shutdown signal received. Terminating processes...")
-        for p in processes:
-            p.terminate()
-            p.join()
+        supervisor.stop()
         logger.info("Shutdown complete.")
         sys.exit(0)
 
     signal.signal(signal.SIGINT, shutdown)
     signal.signal(signal.SIGTERM, shutdown)
 
-    for p in processes:
-        p.join()
\ No newline at end of file
+    supervisor.run()
\ No newline at end of file
@@ -0,0 +1,12 @@
+"""
+Test setup: import the package modules from FTRACK_scripts and keep all
+runtime state (journals, id maps, leases) in a throwaway directory.
+"""
+
+import os
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.environ.setdefault("FTRACK_STATE_DIR", tempfile.mkdtemp(prefix="ftrack_state_"))
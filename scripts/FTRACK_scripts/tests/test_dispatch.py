@@ -0,0 +1,29 @@
+from core.dispatch import ANY_ACTION, DispatchTable
+
+TABLE = DispatchTable({("Note", "add"): "note", ("Shot", ANY_ACTION): "shot"}, name="test")
+
+
+def test_route_matches_both_type_spellings():
+    assert TABLE.route({"entity_type": "Note", "action": "add"}) == "note"
+    assert TABLE.route({"entityType": "note", "action": "add"}) == "note"
+
+
+def test_route_falls_back_to_operation_and_ignores_case():
+    assert TABLE.route({"entityType": "note", "operation": "add"}) == "note"
+    assert TABLE.route({"entityType": "note", "action": "ADD"}) == "note"
+    assert TABLE.route({"entityType": "note", "operation": "Add"}) == "note"
+
+
+def test_route_without_match():
+    assert TABLE.route({"entityType": "note", "action": "remove"}) is None
+    assert TABLE.route({"entityType": "note"}) is None
+    assert TABLE.route({"entityType": "shot", "action": "update"}) == "shot"
+
+
+def test_select_keeps_routed_entities_in_order():
+    entities = [
+        {"entityType": "task", "action": "add"},
+        {"entityType": "note", "operation": "add"},
+        {"entityType": "shot", "action": "remove"},
+    ]
+    assert TABLE.select(entities) == entities[1:]
@@ -0,0 +1,20 @@
+import logging
+
+from core.logging_setup import DebugSampler
+
+
+def _record(msg, level=logging.DEBUG):
+    return logging.LogRecord("test", level, __file__, 1, msg, None, None)
+
+
+def test_sampler_keeps_first_and_every_nth_debug_record():
+    sampler = DebugSampler(3)
+    assert [sampler.filter(_record("tick %s")) for _ in range(7)] == [True, False, False, True, False, False, True]
+    assert sampler.filter(_record("boom", logging.WARNING))
+
+
+def test_sampler_bounds_its_templates():
+    sampler = DebugSampler(3, max_templates=10)
+    for i in range(1000):
+        sampler.filter(_record(f"line {i}"))
+    assert len(sampler._seen) == 10
@@ -0,0 +1,65 @@
+import json
+import threading
+import time
+import urllib.error
+import urllib.request
+
+from core import metrics
+from core.event_batcher import EventBatcher
+from core.metrics import MetricsPublisher, MetricsServer, clear_published
+
+LISTENER = "Stalled Listener"
+
+
+def _get(server, path):
+    try:
+        with urllib.request.urlopen(f"http://127.0.0.1:{server.port}{path}", timeout=5) as response:
+            return response.status, response.read().decode("utf-8")
+    except urllib.error.HTTPError as e:
+        return e.code, e.read().decode("utf-8")
+
+
+def _wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+def test_readyz_reports_a_stalled_listener(monkeypatch):
+    monkeypatch.setattr(metrics, "PROGRESS_TIMEOUT", 0.2)
+    clear_published()
+    entered, release = threading.Event(), threading.Event()
+
+    def handler(batch):
+        entered.set()
+        release.wait(10)
+
+    batcher = EventBatcher(handler, name="stalled", window=0)
+    publisher = MetricsPublisher(LISTENER)
+    server = MetricsServer(port=0, expected_processes=[LISTENER]).start()
+    try:
+        assert _get(server, "/healthz") == (200, "ok\n")
+        assert _get(server, "/readyz")[0] == 503  # no heartbeat yet
+
+        publisher.publish()
+        assert _get(server, "/readyz")[0] == 200
+
+        batcher({"topic": "ftrack.update", "data": {"entities": [{"entityType": "shot", "entityId": "1", "action": "add"}]}})
+        assert entered.wait(5)
+        time.sleep(0.3)
+        publisher.publish()
+        status, body = _get(server, "/readyz")
+        assert status == 503
+        assert json.loads(body)["stalled_for"][LISTENER] > 0.2
+
+        release.set()
+        _wait_for(lambda: batcher._stalled_since() is None)
+        publisher.publish()
+        assert _get(server, "/readyz")[0] == 200
+        assert "ftrack_events_received_total" in _get(server, "/metrics")[1]
+    finally:
+        release.set()
+        batcher.stop()
+        server.stop()
+        clear_published()
@@ -0,0 +1,29 @@
+from actions.undark_pbv_reconcile import reconcile
+from core.fake_ftrack import FakeSession
+from core.id_map import SyncIdMap
+
+
+def test_renamed_synced_task_is_not_duplicated():
+    pbv, undark = FakeSession("https://pbv.fake"), FakeSession("https://undark.fake")
+    pbv_task = pbv.add("Task", {"name": "asset-request_hero_v2", "parent": pbv.add("Project", {"name": "shared_project"})})
+    undark_task = undark.add(
+        "Task", {"name": "asset-request_hero", "parent": undark.add("Project", {"name": "shared_project"})}
+    )
+    id_map = SyncIdMap()
+    id_map.record("Task", "PBV", pbv_task["id"], "UNDARK", undark_task["id"])
+
+    plan = reconcile(pbv, undark, id_map=id_map, dry_run=False)
+
+    assert [kind for kind, *_ in plan] == []
+    assert [task["name"] for task in undark.query("Task").all()] == ["asset-request_hero"]
+
+
+def test_unmapped_task_is_created():
+    pbv, undark = FakeSession("https://pbv.fake"), FakeSession("https://undark.fake")
+    pbv.add("Task", {"name": "asset-request_prop", "parent": pbv.add("Project", {"name": "shared_project"})})
+    undark.add("Project", {"name": "shared_project"})
+
+    plan = reconcile(pbv, undark, id_map=SyncIdMap(), dry_run=False)
+
+    assert [kind for kind, *_ in plan] == ["Task"]
+    assert [task["name"] for task in undark.query("Task").all()] == ["asset-request_prop"]
@@ -0,0 +1,81 @@
+import datetime
+
+from actions.undark_pbv_sync import RECOVERY_PROJECT_ATTRIBUTES, RECOVERY_QUERIES, SyncLink, fan_out
+from core.echo_guard import EchoGuard
+from core.fake_ftrack import FakeSession
+from core.gap_recovery import GapRecovery
+from core.id_map import SyncIdMap
+
+
+class ProjectShards:
+    """Shard leases owning exactly the partitions of the given project names."""
+
+    def __init__(self, *projects):
+        self.projects = set(projects)
+
+    def owns(self, key):
+        return key in self.projects
+
+
+class CollectingBatcher:
+    """Stands in for the EventBatcher: collects what gap recovery feeds it."""
+
+    name = "sync_pbv"
+    journal = None
+
+    def __init__(self):
+        self.entities = []
+
+    def __call__(self, event):
+        self.entities += event["data"]["entities"]
+
+    def call_soon(self, task):
+        task()
+
+
+def _seed(session, with_entities):
+    project = session.add("Project", {"name": "shared_project"})
+    task = session.add("Task", {"name": "asset-request_hero", "parent": project})
+    asset = session.add("Asset", {"name": "hero", "project": project})
+    session.add("User", {"username": "artist"})
+    if not with_entities:
+        return None, None
+    now = datetime.datetime.now(datetime.timezone.utc)
+    user = session.query('User where username is "artist"').first()
+    note = session.add("Note", {"parent": task, "content": "fix the edge", "subject": "review", "user": user, "date": now})
+    version = session.add("AssetVersion", {"name": "v001", "asset": asset, "date": now})
+    return note, version
+
+
+def test_takeover_recovery_routes_notes_and_versions_to_project_owner():
+    pbv, undark = FakeSession("https://pbv.fake"), FakeSession("https://undark.fake")
+    note, version = _seed(pbv, with_entities=True)
+    _seed(undark, with_entities=False)
+    id_map = SyncIdMap()
+    link = SyncLink(
+        pbv, undark, "PBV", "UNDARK", id_map, EchoGuard(), shards=ProjectShards("shared_project")
+    )
+
+    batcher = CollectingBatcher()
+    queries = {etype: RECOVERY_QUERIES[etype] for etype in ("Note", "AssetVersion")}
+    GapRecovery(pbv, batcher, queries, project_attributes=RECOVERY_PROJECT_ATTRIBUTES).run(lookback=3600)
+    assert {entity["entityId"] for entity in batcher.entities} == {note["id"], version["id"]}
+
+    assert fan_out([link], None, batcher.entities) == []
+    assert id_map.counterpart("PBV", note["id"], "UNDARK")
+    assert id_map.counterpart("PBV", version["id"], "UNDARK")
+
+
+def test_takeover_recovery_skips_projects_owned_elsewhere():
+    pbv, undark = FakeSession("https://pbv.fake"), FakeSession("https://undark.fake")
+    note, version = _seed(pbv, with_entities=True)
+    _seed(undark, with_entities=False)
+    id_map = SyncIdMap()
+    link = SyncLink(pbv, undark, "PBV", "UNDARK", id_map, EchoGuard(), shards=ProjectShards("other_project"))
+
+    batcher = CollectingBatcher()
+    GapRecovery(pbv, batcher, RECOVERY_QUERIES, project_attributes=RECOVERY_PROJECT_ATTRIBUTES).run(lookback=3600)
+
+    assert fan_out([link], None, batcher.entities) == []
+    assert undark.query("Note").all() == []
+    assert undark.query("AssetVersion").all() == []
@@ -0,0 +1,245 @@
+"""
+Event-replay load test harness
+------------------------------
+Feeds recorded or synthetic ftrack.update streams into the action handlers,
+running against the in-memory stand-in in core/fake_ftrack.py, at a
+controlled rate, and reports throughput, latency percentiles and server
+round-trip counts.
+
+Scenarios:
+    shots  create_tasks_for_new_shot(s) for a stream of new shots
+    sync   sync_entities for a stream of new notes on PBV (plus their echoes on UNDARK)
+    clone  CreateProjectFromCopyAction cloning a generated template project
+
+Usage (from scripts/FTRACK_scripts):
+    python -m tools.replay_load_test shots --count 500 --rate 200 --latency 0.02
+    python -m tools.replay_load_test shots --batch-window 0.5 --count 2000
+    python -m tools.replay_load_test sync --count 300 --echo
+    python -m tools.replay_load_test clone --count 2000 --latency 0.01
+    python -m tools.replay_load_test shots --events recorded.jsonl
+"""
+
+import argparse
+import json
+import logging
+import os
+import sys
+import tempfile
+import threading
+import time
+
+# Keep id maps, journals and snapshots of the run out of the real state directory.
+os.environ.setdefault("FTRACK_STATE_DIR", tempfile.mkdtemp(prefix="ftrack_load_test_"))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.event_batcher import EventBatcher
+from core.fake_ftrack import FakeSession
+
+logger = logging.getLogger("replay_load_test")
+
+TASK_TYPES = ["Animation", "Lighting", "Compositing"]
+
+
+# --- Fixtures ---
+def seed_shots(session, count):
+    project = session.add("Project", {"name": "load_test", "full_name": "Load Test"})
+    for name in TASK_TYPES:
+        session.add("Type", {"name": name})
+    session.add("Status", {"name": "Not Started"})
+    session.add("Priority", {"name": "None"})
+    return [session.add("Shot", {"name": f"sh{i:05d}", "parent": project}) for i in range(count)]
+
+
+def seed_sync(pbv, undark, count):
+    notes = []
+    for session in (pbv, undark):
+        project = session.add("Project", {"name": "shared_project"})
+        task = session.add("Task", {"name": "asset-request_hero", "parent": project})
+        user = session.add("User", {"username": "artist"})
+        if session is pbv:
+            notes = [
+                session.add("Note", {"parent": task, "content": f"note {i}", "subject": "load", "user": user})
+                for i in range(count)
+            ]
+    return notes
+
+
+def seed_template(session, count):
+    """Template project of roughly count entities: folders → shots → tasks."""
+    schema = session.add("ProjectSchema", {"name": "VFX"})
+    project = session.add("Project", {
+        "name": "template", "full_name": "Template", "project_schema": schema,
+        "start_date": None, "end_date": None,
+    })
+    task_type = session.add("Type", {"name": "Compositing"})
+    created = 0
+    folder_index = 0
+    while created < count:
+        folder = session.add("Folder", {"name": f"folder{folder_index:03d}", "parent": project})
+        created += 1
+        for s in range(10):
+            shot = session.add("Shot", {"name": f"sh{s:03d}", "parent": folder, "custom_attributes": {"fps": 25}})
+            created += 1
+            for name in TASK_TYPES:
+                session.add("Task", {"name": name, "parent": shot, "type": task_type})
+                created += 1
+        folder_index += 1
+    return project
+
+
+def load_events(path):
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def entity_event(entity_type, entity_id):
+    return {"topic": "ftrack.update", "data": {"entities": [
+        {"entity_type": entity_type, "entityType": entity_type.lower(), "entityId": entity_id, "action": "add"}
+    ]}}
+
+
+# --- Runner ---
+def percentile(samples, fraction):
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def replay(events, handler, rate, batch_window=None):
+    """Publish events at rate/s into handler (per event, or through an EventBatcher).
+
+    Returns (elapsed seconds, list of handler latencies in ms).
+    """
+    latencies = []
+    lock = threading.Lock()
+
+    def timed(payload):
+        started = time.perf_counter()
+        handler(payload)
+        with lock:
+            latencies.append((time.perf_counter() - started) * 1000)
+
+    if batch_window is not None:
+        batcher = EventBatcher(timed, name="load_test", window=batch_window)
+        publish = batcher
+    else:
+        batcher = None
+        publish = lambda event: timed(event["data"].get("entities", []))
+
+    interval = 1.0 / rate if rate else 0
+    started = time.perf_counter()
+    for index, event in enumerate(events):
+        publish(event)
+        if interval:
+            delay = started + (index + 1) * interval - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+    if batcher:
+        batcher.stop()
+    return time.perf_counter() - started, latencies
+
+
+def report(name, events, elapsed, latencies, sessions):
+    print(f"\n=== {name} ===")
+    print(f"events:       {events}")
+    print(f"elapsed:      {elapsed:.2f}s")
+    print(f"throughput:   {events / elapsed if elapsed else 0:.1f} events/s")
+    print(f"invocations:  {len(latencies)}")
+    print(f"latency p50:  {percentile(latencies, 0.50):.1f} ms")
+    print(f"latency p95:  {percentile(latencies, 0.95):.1f} ms")
+    print(f"latency max:  {max(latencies) if latencies else 0:.1f} ms")
+    for label, session in sessions.items():
+        counts = dict(session.call_counts)
+        per_event = sum(counts.values()) / events if events else 0
+        print(f"{label:<13} {counts}  ({per_event:.2f} round trips/event)")
+
+
+def run_shots(args):
+    from actions.shot_creation_action import TaskTemplate, create_tasks_for_new_shots
+
+    session = FakeSession(latency=args.latency)
+    shots = seed_shots(session, args.count)
+    events = load_events(args.events) if args.events else [entity_event("Shot", s["id"]) for s in shots]
+    template = TaskTemplate(session)
+    session.call_counts.clear()
+    elapsed, latencies = replay(
+        events, lambda entities: create_tasks_for_new_shots(session, entities, template=template),
+        args.rate, args.batch_window,
+    )
+    report("shots", len(events), elapsed, latencies, {"session": session})
+
+
+def run_sync(args):
+    from actions.undark_pbv_sync import SyncLink, sync_entities
+    from core.echo_guard import EchoGuard
+    from core.id_map import SyncIdMap
+
+    pbv = FakeSession("https://pbv.fake", latency=args.latency)
+    undark = FakeSession("https://undark.fake", latency=args.latency)
+    notes = seed_sync(pbv, undark, args.count)
+    id_map, guard = SyncIdMap(), EchoGuard()
+    to_undark = SyncLink(pbv, undark, "PBV", "UNDARK", id_map, guard)
+    to_pbv = SyncLink(undark, pbv, "UNDARK", "PBV", id_map, guard)
+
+    events = load_events(args.events) if args.events else [entity_event("Note", n["id"]) for n in notes]
+
+    def handler(entities):
+        sync_entities(to_undark, entities)
+        if args.echo:
+            # Replay the echo UNDARK would publish for every note the sync created there.
+            created = [id_map.counterpart("PBV", e["entityId"], "UNDARK") for e in entities]
+            sync_entities(to_pbv, [entity_event("Note", i)["data"]["entities"][0] for i in created if i])
+
+    elapsed, latencies = replay(events, handler, args.rate, args.batch_window)
+    report("sync", len(events), elapsed, latencies, {"pbv": pbv, "undark": undark})
+
+
+def run_clone(args):
+    from actions.template_action import CreateProjectFromCopyAction
+
+    session = FakeSession(latency=args.latency)
+    template = seed_template(session, args.count)
+    action = CreateProjectFromCopyAction(session, session_factory=lambda: session)
+    action.projects.refresh()
+    job = session.add("Job", {"status": "queued"})
+    session.call_counts.clear()
+
+    values = {"source_project_id": template["id"], "new_project_name": "Load Test Copy", "new_start_date": "2025-01-01"}
+    started = time.perf_counter()
+    action._run_clone_job(values, job["id"])
+    elapsed = time.perf_counter() - started
+    copies = len(session.query('TypedContext where project.name is "load_test_copy"'))
+    print(f"\nCloned {copies} entities, job status: {job['status']}")
+    report("clone", copies, elapsed, [elapsed * 1000], {"session": session})
+
+    # A repeat clone of the same template is served from the snapshot cache.
+    job = session.add("Job", {"status": "queued"})
+    session.call_counts.clear()
+    values["new_project_name"] = "Load Test Copy 2"
+    started = time.perf_counter()
+    action._run_clone_job(values, job["id"])
+    elapsed = time.perf_counter() - started
+    report("clone (cached snapshot)", copies, elapsed, [elapsed * 1000], {"session": session})
+
+
+SCENARIOS = {"shots": run_shots, "sync": run_sync, "clone": run_clone}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replay ftrack.update streams into the actions against a fake server.")
+    parser.add_argument("scenario", choices=sorted(SCENARIOS))
+    parser.add_argument("--count", type=int, default=200, help="synthetic events (or template size for clone)")
+    parser.add_argument("--rate", type=float, default=0, help="events per second (0 = as fast as possible)")
+    parser.add_argument("--latency", type=float, default=0.0, help="simulated seconds per server round trip")
+    parser.add_argument("--batch-window", type=float, default=None, help="coalesce through an EventBatcher with this window")
+    parser.add_argument("--events", help="JSONL file of recorded events (journal payload format)")
+    parser.add_argument("--echo", action="store_true", help="sync: also replay the echo events of created notes")
+    parser.add_argument("--verbose", action="store_true")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING)
+    if not args.verbose:
+        # The actions configure their own verbose logging on import.
+        logging.disable(logging.INFO)
+    SCENARIOS[args.scenario](args)